@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""Análisis de la consulta del chat: palabras clave ponderadas y entidades.
+
+En lugar de mandar a la base cada palabra de más de tres letras, la consulta pasa por:
+
+1. Entidades: los números de expediente, las áreas (``area_solicitante``) y las
+   modalidades (``tipo_proceso``) citadas se resuelven con búsquedas exactas e
+   indexadas, y sus palabras ya no se buscan con ilike.
+2. Palabras clave: sin puntuación, acentos ni palabras vacías, reducidas a su raíz
+   (ver normalizacion_texto.py) y ordenadas por IDF contra el corpus. Se descartan
+   las que no aparecen en el corpus y las que aparecen en más de ``FRECUENCIA_MAXIMA``
+   de sus filas (no filtran nada y traen medio corpus), y se envían como máximo
+   ``MAX_PALABRAS_CLAVE``.
+
+El IDF y los catálogos de áreas y modalidades salen de un ``Vocabulario`` que se
+calcula recorriendo por páginas las tablas del repositorio y se guarda en
+``RUTA_VOCABULARIO`` (vigente por ``VIGENCIA_VOCABULARIO`` segundos). Si el archivo
+falta o venció se recalcula en segundo plano, sin hacer esperar al chat. Para
+calcularlo a mano (p. ej. antes de arrancar la app)::
+
+    python analisis_consulta.py
+"""
+import json
+import math
+import os
+import re
+import threading
+import time
+import weakref
+
+from normalizacion_texto import raiz, tokenizar
+
+# Máximo de palabras clave por consulta (las de mayor IDF)
+MAX_PALABRAS_CLAVE = int(os.environ.get("MAX_PALABRAS_CLAVE", "6"))
+# Fracción de las filas del corpus por encima de la cual una raíz ya no sirve como filtro
+FRECUENCIA_MAXIMA = float(os.environ.get("FRECUENCIA_MAXIMA", "0.5"))
+RUTA_VOCABULARIO = os.environ.get(
+    "RUTA_VOCABULARIO", os.path.join(os.path.dirname(os.path.abspath(__file__)), "vocabulario.json")
+)
+VIGENCIA_VOCABULARIO = float(os.environ.get("VIGENCIA_VOCABULARIO", str(24 * 3600)))
+# Filas leídas por página al calcular el vocabulario
+TAMANO_PAGINA = 1000
+
+PATRON_EXPEDIENTE = re.compile(r"\d{4}-[A-Za-z]{3}-[A-Za-z]{3}-\d{4}")
+
+# Campos de expedientes cuyos valores se reconocen como entidades en la consulta
+CAMPOS_ENTIDAD = {"area": "area_solicitante", "modalidad": "tipo_proceso"}
+
+# Columnas que no aportan texto al vocabulario
+_COLUMNAS_NO_TEXTO = {"id", "created_at", "updated_at", "expediente_id", "nombre_archivo"}
+
+# Palabras vacías del español (ya sin acentos) y muletillas frecuentes en las preguntas al chat
+PALABRAS_VACIAS = frozenset("""
+a al algo alguien algun alguna algunas alguno algunos alla alli ante antes aqui asi aun aunque
+bajo bien cada casi como con contra cual cuales cualquier cuando cuanta cuantas cuanto cuantos
+de del dentro desde donde dos durante e el ella ellas ello ellos en entonces entre era eran eres
+es esa esas ese eso esos esta estaba estaban estan estar estas este esto estos estoy fue fueron
+ha haber habia habian han has hasta hay he hemos la las le les lo los mas me mi mis mucha muchas
+mucho muchos muy nada ni ningun ninguna no nos nosotros nuestra nuestro o otra otras otro otros
+para pero poco por porque pues que quien quienes se sea sean segun ser si sido siempre sin sino
+sobre solo son su sus tal tambien tan tanto te tenemos tengo tiene tienen toda todas todo todos
+tras tu tus un una unas uno unos usted ustedes y ya yo
+acerca ayuda ayudame busca buscame buscar cuales dame deben deberia decir dice dime encuentra
+encuentran explica explicame expediente expedientes favor gracias hola indica indicame informacion
+muestra muestrame mostrar necesito podrias puedes quiero relacionada relacionadas relacionado
+relacionados respecto saber
+""".split())
+
+
+def _terminos(texto):
+    # Raíces de las palabras con contenido (sin palabras vacías ni fragmentos de una o dos letras)
+    return [
+        raiz(palabra) for palabra in tokenizar(texto)
+        if palabra not in PALABRAS_VACIAS and (len(palabra) > 2 or palabra.isdigit())
+    ]
+
+
+class Vocabulario:
+    """Frecuencia de documento por raíz (para el IDF) y valores conocidos de cada entidad."""
+
+    def __init__(self, documentos=0, frecuencias=None, catalogos=None, creado_en=None):
+        self.documentos = documentos
+        self.frecuencias = frecuencias or {}
+        self.catalogos = catalogos or {}
+        self.creado_en = creado_en if creado_en is not None else time.time()
+
+    def agregar_fila(self, fila):
+        textos = [v for c, v in fila.items() if c not in _COLUMNAS_NO_TEXTO and isinstance(v, str)]
+        self.documentos += 1
+        for termino in set(_terminos(" ".join(textos))):
+            self.frecuencias[termino] = self.frecuencias.get(termino, 0) + 1
+
+    def agregar_catalogo(self, campo, valor):
+        if isinstance(valor, str) and valor.strip():
+            valores = self.catalogos.setdefault(campo, [])
+            if valor not in valores:
+                valores.append(valor)
+
+    def util(self, termino, frecuencia_maxima=FRECUENCIA_MAXIMA):
+        """Si la raíz sirve como filtro: aparece en el corpus, pero no en casi todo."""
+        if not self.documentos:
+            return True
+        return 0 < self.frecuencias.get(termino, 0) <= frecuencia_maxima * self.documentos
+
+    def idf(self, termino):
+        """IDF suavizado; sin corpus todas las raíces pesan igual."""
+        if not self.documentos:
+            return 1.0
+        return math.log((self.documentos + 1) / (self.frecuencias.get(termino, 0) + 1)) + 1
+
+    def vigente(self, vigencia=VIGENCIA_VOCABULARIO):
+        return time.time() - self.creado_en <= vigencia
+
+    @classmethod
+    def desde_repositorio(cls, repositorio, tablas, tamano_pagina=TAMANO_PAGINA):
+        """Recorre ``tablas`` completas; cada fila cuenta como un documento."""
+        vocabulario = cls()
+        for tabla in tablas:
+            try:
+                for filas in repositorio.paginas_tabla(tabla, tamano_pagina):
+                    for fila in filas:
+                        vocabulario.agregar_fila(fila)
+                        if tabla == "expedientes":
+                            for campo in CAMPOS_ENTIDAD.values():
+                                vocabulario.agregar_catalogo(campo, fila.get(campo))
+            except Exception as e:
+                print(f"Error al leer {tabla} para el vocabulario: {e}")
+        return vocabulario
+
+    def guardar(self, ruta):
+        # Se escribe aparte y se reemplaza de una vez: otro proceso puede estar leyéndolo
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            json.dump({
+                "documentos": self.documentos, "frecuencias": self.frecuencias,
+                "catalogos": self.catalogos, "creado_en": self.creado_en,
+            }, archivo, ensure_ascii=False)
+        os.replace(temporal, ruta)
+
+    @classmethod
+    def cargar(cls, ruta):
+        with open(ruta, encoding="utf-8") as archivo:
+            datos = json.load(archivo)
+        return cls(datos["documentos"], datos["frecuencias"], datos["catalogos"], datos["creado_en"])
+
+
+_vocabularios = weakref.WeakKeyDictionary()
+_calculando = weakref.WeakSet()
+_lock_vocabulario = threading.Lock()
+
+
+def _calcular_en_segundo_plano(repositorio, tablas, ruta):
+    # Recorre las tablas en un hilo aparte (uno por repositorio a la vez) y publica el
+    # resultado al terminar; se llama con _lock_vocabulario tomado
+    if repositorio in _calculando:
+        return
+    _calculando.add(repositorio)
+
+    def calcular():
+        try:
+            print("Calculando el vocabulario de la consulta (IDF y catálogos) en segundo plano...")
+            vocabulario = Vocabulario.desde_repositorio(repositorio, tablas)
+            if vocabulario.documentos:
+                vocabulario.guardar(ruta)
+            with _lock_vocabulario:
+                _vocabularios[repositorio] = vocabulario
+        except Exception as e:
+            print(f"No se pudo calcular el vocabulario: {e}")
+        finally:
+            with _lock_vocabulario:
+                _calculando.discard(repositorio)
+
+    threading.Thread(target=calcular, name="vocabulario", daemon=True).start()
+
+
+def obtener_vocabulario(repositorio, tablas, ruta=None):
+    """Vocabulario del repositorio, calculado una vez por proceso (y por ``ruta``, si se indica).
+
+    Sin ``ruta`` (fixtures, pruebas) se calcula en el momento. Con ``ruta`` se usa el
+    archivo guardado (``python analisis_consulta.py``) y, si falta o venció, se recalcula
+    en segundo plano: mientras tanto sirve el anterior o, si no hay ninguno, uno vacío,
+    así ningún turno del chat espera a que se recorran todas las tablas. Un vocabulario
+    vacío (sin corpus) no descarta palabras.
+    """
+    with _lock_vocabulario:
+        vocabulario = _vocabularios.get(repositorio)
+        if vocabulario is not None and vocabulario.vigente():
+            return vocabulario
+        if ruta is None:
+            print("Calculando el vocabulario de la consulta (IDF y catálogos)...")
+            vocabulario = Vocabulario.desde_repositorio(repositorio, tablas)
+            _vocabularios[repositorio] = vocabulario
+            return vocabulario
+        if vocabulario is None and os.path.exists(ruta):
+            try:
+                vocabulario = _vocabularios[repositorio] = Vocabulario.cargar(ruta)
+            except Exception as e:
+                print(f"No se pudo leer el vocabulario de {ruta}: {e}")
+        if vocabulario is None or not vocabulario.vigente():
+            _calcular_en_segundo_plano(repositorio, tablas, ruta)
+        return vocabulario or Vocabulario()
+
+
+class AnalisisConsulta:
+    """Resultado del análisis: entidades detectadas y palabras clave a buscar."""
+
+    def __init__(self, expedientes, entidades, palabras_clave, pesos, descartadas):
+        self.expedientes = expedientes
+        # campo de expedientes -> valores exactos (p. ej. {"area_solicitante": ["Logística"]})
+        self.entidades = entidades
+        self.palabras_clave = palabras_clave
+        self.pesos = pesos
+        self.descartadas = descartadas
+
+    def describir(self):
+        partes = [f"{p} ({self.pesos[p]:.2f})" for p in self.palabras_clave]
+        return ", ".join(partes) or "ninguna"
+
+
+def _detectar_entidades(terminos, vocabulario):
+    # Un valor del catálogo se reconoce si todas sus raíces están en la consulta; los
+    # valores más largos van primero y sus raíces ya no cuentan como palabras clave
+    entidades, consumidos = {}, set()
+    candidatos = [
+        (campo, valor, set(_terminos(valor)))
+        for campo in CAMPOS_ENTIDAD.values()
+        for valor in vocabulario.catalogos.get(campo, [])
+    ]
+    for campo, valor, raices_valor in sorted(candidatos, key=lambda c: len(c[2]), reverse=True):
+        if raices_valor and raices_valor <= terminos and not raices_valor <= consumidos:
+            entidades.setdefault(campo, []).append(valor)
+            consumidos |= raices_valor
+    return entidades, consumidos
+
+
+def analizar_consulta(consulta, vocabulario=None, max_palabras=MAX_PALABRAS_CLAVE):
+    """Extrae de ``consulta`` los expedientes citados, las entidades y las palabras clave."""
+    vocabulario = vocabulario or Vocabulario()
+    expedientes = [numero.upper() for numero in PATRON_EXPEDIENTE.findall(consulta)]
+    # Los números de expediente no se trocean en palabras clave
+    terminos = _terminos(PATRON_EXPEDIENTE.sub(" ", consulta))
+    entidades, consumidos = _detectar_entidades(set(terminos), vocabulario)
+
+    candidatos, descartadas = [], []
+    for termino in terminos:
+        if termino in consumidos or termino in candidatos or termino in descartadas:
+            continue
+        (candidatos if vocabulario.util(termino) else descartadas).append(termino)
+
+    pesos = {termino: vocabulario.idf(termino) for termino in candidatos}
+    # Orden por IDF descendente; a igual peso, el orden de la consulta
+    ordenados = sorted(candidatos, key=lambda t: -pesos[t])
+    descartadas.extend(ordenados[max_palabras:])
+    palabras_clave = ordenados[:max_palabras]
+    return AnalisisConsulta(expedientes, entidades, palabras_clave, {p: pesos[p] for p in palabras_clave}, descartadas)
+
+
+if __name__ == "__main__":
+    from supabase_client import TABLAS_NORMATIVA, obtener_repositorio
+
+    vocabulario = Vocabulario.desde_repositorio(
+        obtener_repositorio(), ["expedientes", "documentos_expediente"] + TABLAS_NORMATIVA
+    )
+    vocabulario.guardar(RUTA_VOCABULARIO)
+    print(f"Vocabulario: {vocabulario.documentos} filas, {len(vocabulario.frecuencias)} raíces")
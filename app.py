@@ -1,10 +1,23 @@
+import csv
+import io
 import os
+import re
+import shutil
+import tempfile
 import streamlit as st
-from supabase_client import buscar_expediente_completo
-from llamadas_ia import consulta_claude
+from supabase_client import (
+    buscar_expediente_completo, buscar_id_expediente, exportar_expedientes_en_lote, indice_local,
+    obtener_cliente_supabase, preparar_recursos_compartidos
+)
+from ingesta_pdf import ingerir_pdfs
+from llamadas_ia import MENSAJE_ERROR, responder_turno
+from conversacion import Conversacion
 from config import APIS_DISPONIBLES, obtener_api
+from proveedores_llm import enrutador_llm
+from cache_respuestas import cache_busquedas, cache_respuestas
+from trazas import registro_trazas
+from turnos_chat import ESPERA_ENTRE_FRAGMENTOS, ESPERA_PRIMER_FRAGMENTO, ChatSaturado, ejecutor_turnos
 
-print("Usando API Key en app.py:", os.environ.get("CLAUDE_API_KEY", "NO ENCONTRADA"))
 # Configuración de la página
 st.set_page_config(page_title="IA - Gestión de Expedientes", layout="wide")
 
@@ -12,8 +25,15 @@ st.set_page_config(page_title="IA - Gestión de Expedientes", layout="wide")
 st.sidebar.title("IA - Gestión de Expedientes")
 menu = st.sidebar.radio("Navegación", ["Explorar Expedientes", "Chat", "Subir PDF"])
 
-# Opción para elegir la API de IA
-opcion_ia = st.sidebar.selectbox("Selecciona el modelo de IA", list(APIS_DISPONIBLES.keys()))
+# Opción para elegir la API de IA (la automática elige por latencia y errores observados)
+OPCION_AUTOMATICA = "Automático"
+
+# Streamlit carga en memoria todo archivo que se ofrece para descargar: las exportaciones
+# en lote más grandes que esto (en MB) no se ofrecen y se pide dividir el lote
+MAX_MB_EXPORTACION = float(os.environ.get("MAX_MB_EXPORTACION", "50"))
+opcion_ia = st.sidebar.selectbox("Selecciona el modelo de IA", list(APIS_DISPONIBLES.keys()) + [OPCION_AUTOMATICA])
+# Si el modelo tarda en empezar a responder, se consulta en paralelo al otro (ver proveedores_llm.py)
+priorizar_latencia = st.sidebar.checkbox("Priorizar la velocidad de respuesta")
 
 # Sección de consulta de expedientes
 def mostrar_busqueda_expedientes():
@@ -33,13 +53,79 @@ def mostrar_busqueda_expedientes():
         else:
             st.error("No se encontró el expediente.")
 
+# Lee números de expediente de un texto pegado (separados por líneas, comas o espacios)
+# y de un CSV (columna "numero_expediente" o, si no existe, la primera columna)
+def leer_numeros_expediente(texto, archivo_csv):
+    numeros = [numero for numero in re.split(r"[\s,;]+", texto or "") if numero]
+    if archivo_csv is not None:
+        # Se decodifica una copia del contenido: envolver el archivo subido en un TextIOWrapper
+        # lo cerraría al liberarse el wrapper y el siguiente rerun no podría volver a leerlo
+        lector = csv.reader(io.StringIO(archivo_csv.getvalue().decode("utf-8-sig"), newline=""))
+        encabezado = next(lector, [])
+        columna = encabezado.index("numero_expediente") if "numero_expediente" in encabezado else 0
+        if columna == 0 and encabezado and encabezado[0] != "numero_expediente":
+            # Sin encabezado reconocible: la primera fila también es un número
+            numeros.append(encabezado[0])
+        numeros.extend(fila[columna] for fila in lector if len(fila) > columna and fila[columna].strip())
+    return numeros
+
+# Búsqueda y exportación de muchos expedientes a la vez
+def mostrar_busqueda_en_lote():
+    st.markdown("---")
+    st.subheader("Búsqueda en lote")
+    texto = st.text_area("Pegue los números de expediente (uno por línea o separados por comas):")
+    archivo_csv = st.file_uploader("O suba un CSV con los números de expediente", type=["csv"])
+    formato = st.radio("Formato de exportación", ["csv", "jsonl"], horizontal=True)
+
+    if st.button("Buscar y exportar"):
+        numeros = leer_numeros_expediente(texto, archivo_csv)
+        if not numeros:
+            st.warning("Por favor, ingrese al menos un número de expediente.")
+            return
+        
+        # Los resultados se escriben a un archivo temporal a medida que llegan
+        destino = tempfile.NamedTemporaryFile("w", suffix=f".{formato}", encoding="utf-8", newline="", delete=False)
+        try:
+            with destino, st.spinner(f"Buscando {len(numeros)} expedientes..."):
+                resumen = exportar_expedientes_en_lote(numeros, destino, formato)
+
+            st.success(f"{resumen['expedientes']} expedientes y {resumen['documentos']} documentos exportados.")
+            if resumen["no_encontrados"]:
+                st.warning(f"No se encontraron {len(resumen['no_encontrados'])} expedientes: {', '.join(resumen['no_encontrados'][:50])}")
+            megabytes = os.path.getsize(destino.name) / 1024 / 1024
+            if megabytes > MAX_MB_EXPORTACION:
+                st.error(
+                    f"La exportación ocupa {megabytes:.0f} MB (máximo {MAX_MB_EXPORTACION:.0f} MB). "
+                    "Divida el lote en varias búsquedas más pequeñas."
+                )
+                return
+            with open(destino.name, "rb") as archivo:
+                st.download_button("Descargar resultados", archivo, file_name=f"expedientes.{formato}")
+        finally:
+            os.remove(destino.name)
+
+# Cada rerun vuelve a ejecutar este script: el cliente de la base, los esquemas, el
+# vocabulario y los índices se preparan una sola vez por proceso y los comparten todas
+# las sesiones (igual que el transporte HTTP de los modelos y el pool de turnos)
+@st.cache_resource(show_spinner="Preparando la conexión a la base de datos...")
+def recursos_compartidos():
+    return preparar_recursos_compartidos()
+
 # Inicializar historial de chat en la sesión si no existe
 if 'mensajes' not in st.session_state:
     st.session_state.mensajes = []
+# Expedientes y documentos ya recuperados en la sesión, para las preguntas de seguimiento
+if 'conversacion' not in st.session_state:
+    st.session_state.conversacion = Conversacion()
 
 # Sección de Chat con IA
 def mostrar_chat():
     st.title("Chat con IA sobre Expedientes")
+    try:
+        recursos_compartidos()
+    except Exception as e:
+        # Sin recursos precargados el turno los crea al buscar (y muestra allí el error)
+        print(f"No se pudieron preparar los recursos compartidos: {e}")
     
     # Mostrar historial de mensajes
     for mensaje in st.session_state.mensajes:
@@ -56,48 +142,162 @@ def mostrar_chat():
     col1, col2 = st.columns([1, 5])
     
     with col1:
-        if st.button("Enviar", use_container_width=True):
-            if consulta.strip() == "":
-                st.warning("Por favor, escribe una consulta.")
-                return
-            
-            # Agregar consulta del usuario al historial
-            st.session_state.mensajes.append({"role": "user", "content": consulta})
-            
-            # Mostrar indicador de carga
-            with st.spinner("Buscando información y generando respuesta..."):
-                api_seleccionada = obtener_api(opcion_ia)
-
-                if api_seleccionada:
-                    if opcion_ia == "Claude":
-                        respuesta = consulta_claude(consulta)
-                    else:
-                        respuesta = "⚠️ Modelo no reconocido o aún no implementado."
-                else:
-                    respuesta = "⚠️ No se ha configurado correctamente la API seleccionada."
-                
-                # Agregar respuesta al historial
-                st.session_state.mensajes.append({"role": "assistant", "content": respuesta})
-                
-                # Recargar la página para mostrar los nuevos mensajes
-                st.rerun()
+        enviar = st.button("Enviar", use_container_width=True)
     
     with col2:
         if st.button("Limpiar Chat", use_container_width=True):
             st.session_state.mensajes = []
+            st.session_state.conversacion = Conversacion()
             st.rerun()
+    
+    # Aciertos y fallos de los cachés de búsqueda y de respuestas
+    busquedas = cache_busquedas.estadisticas()
+    respuestas = cache_respuestas.estadisticas()
+    st.sidebar.caption(
+        f"Caché de búsquedas: {busquedas['aciertos']} aciertos / {busquedas['fallos']} fallos · "
+        f"Caché de respuestas: {respuestas['aciertos']} aciertos / {respuestas['fallos']} fallos"
+    )
+    trabajo = st.session_state.conversacion.resumen()
+    st.sidebar.caption(
+        f"Conjunto de trabajo: {trabajo['expedientes']} expedientes, {trabajo['documentos']} documentos · "
+        f"{trabajo['busquedas']} búsquedas, {trabajo['reutilizaciones']} preguntas sin consultar la base"
+    )
+    st.sidebar.caption(" · ".join(
+        f"{nombre}: {e['latencia_ms'] if e['latencia_ms'] is not None else '-'} ms al primer token, "
+        f"{e['fallos']} fallos" + (" (en pausa)" if e["enfriando"] else "")
+        for nombre, e in enrutador_llm.resumen().items()
+    ))
+    turnos = ejecutor_turnos.resumen()
+    st.sidebar.caption(
+        f"Turnos del chat: {turnos['en_curso']} de {turnos['capacidad']} en curso, "
+        f"{turnos['en_espera']} en espera, {turnos['rechazados']} rechazados por saturación"
+    )
+    
+    # Etapas más lentas del último turno (ver trazas.py)
+    mostrar_etapas_lentas(st.session_state.get("ultima_traza"))
+    
+    if enviar:
+        if consulta.strip() == "":
+            st.warning("Por favor, escribe una consulta.")
+            return
+        
+        # Agregar consulta del usuario al historial
+        st.session_state.mensajes.append({"role": "user", "content": consulta})
+        st.markdown(f"**Tú:** {consulta}")
+        
+        proveedor = None if opcion_ia == OPCION_AUTOMATICA else opcion_ia
+
+        if proveedor is None or obtener_api(proveedor):
+            # El turno (búsqueda, contexto y llamada al modelo) corre en el pool compartido
+            # (ver turnos_chat.py); aquí se muestra la respuesta a medida que llega
+            resultado = {}
+            try:
+                turno = ejecutor_turnos.enviar(
+                    responder_turno, consulta, conversacion=st.session_state.conversacion,
+                    historial=st.session_state.mensajes[:-1], proveedor=proveedor,
+                    cobertura=priorizar_latencia, resultado=resultado, atributos={"modelo": opcion_ia}
+                )
+            except ChatSaturado:
+                st.session_state.mensajes.pop()
+                st.warning("⏳ Hay muchas consultas en curso en este momento. Intenta de nuevo en unos segundos.")
+                return
+            
+            # La búsqueda en la base de datos ocurre antes del primer token
+            with st.spinner("Buscando información en la base de datos..."):
+                iniciado = turno.iniciado.wait(ESPERA_PRIMER_FRAGMENTO)
+            
+            # Mostrar la respuesta a medida que llegan los tokens; si el modelo elegido
+            # falla o está sobrecargado responde el otro
+            st.markdown("**Asistente:**")
+            try:
+                if not iniciado:
+                    turno.cancelado.set()
+                    raise TimeoutError(f"no hubo respuesta en {ESPERA_PRIMER_FRAGMENTO:g} segundos")
+                respuesta = st.write_stream(turno.fragmentos(espera=ESPERA_ENTRE_FRAGMENTOS))
+                error = "error" in resultado
+            except Exception as e:
+                # Turno vencido o error inesperado del turno: se informa sin perder la página
+                print(f"Error al mostrar la respuesta del chat: {e}")
+                respuesta = f"{MENSAJE_ERROR}: {e}. Intenta de nuevo en unos momentos."
+                error = True
+                st.error(respuesta)
+            st.session_state.ultima_traza = turno.traza_id
+        else:
+            respuesta = "⚠️ No se ha configurado correctamente la API seleccionada."
+            error = True
+        
+        # Agregar respuesta al historial; los errores se muestran pero no se reenvían al
+        # modelo como respuestas del asistente (ver compactar_historial)
+        st.session_state.mensajes.append({"role": "assistant", "content": respuesta, "error": error})
+        
+        # Recargar la página para mostrar los nuevos mensajes
+        st.rerun()
+
+# Panel con las etapas más lentas de un turno del chat
+def mostrar_etapas_lentas(traza_id):
+    if not traza_id:
+        return
+    tramos = registro_trazas.tramos(traza_id)
+    raiz = next((t for t in tramos if t.padre_id is None), None)
+    lentos = registro_trazas.mas_lentos(traza_id)
+    if raiz is None or not lentos:
+        return
+    with st.expander(f"Etapas más lentas del último turno ({raiz.duracion_ms:.0f} ms en total)"):
+        st.table([
+            {
+                "Etapa": t.nombre + (f" ({t.atributos['tabla']})" if t.atributos.get("tabla") else ""),
+                "Duración (ms)": round(t.duracion_ms, 1),
+                "Filas": t.atributos.get("filas", ""),
+                "Bytes": t.atributos.get("bytes", ""),
+            }
+            for t in lentos
+        ])
 
 # Sección para subir PDF
 def subir_pdf():
     st.title("Subir Documentos PDF")
-    archivo = st.file_uploader("Selecciona un archivo PDF", type=["pdf"])
+    numero_expediente = st.text_input("Número de expediente al que pertenecen los documentos:")
+    archivos = st.file_uploader("Selecciona uno o varios archivos PDF", type=["pdf"], accept_multiple_files=True)
 
-    if archivo:
-        st.success(f"Archivo {archivo.name} subido correctamente.")
+    if archivos and st.button("Procesar"):
+        if numero_expediente.strip() == "":
+            st.warning("Por favor, ingrese un número de expediente.")
+            return
+        
+        expediente_id = buscar_id_expediente(numero_expediente.strip())
+        if expediente_id is None:
+            st.error("No se encontró el expediente.")
+            return
+        
+        # Guardar los archivos en disco para que el pool de procesos los lea página a página
+        with tempfile.TemporaryDirectory(prefix="subida_") as directorio:
+            rutas = []
+            for archivo in archivos:
+                ruta = os.path.join(directorio, os.path.basename(archivo.name))
+                with open(ruta, "wb") as destino:
+                    shutil.copyfileobj(archivo, destino)
+                rutas.append((archivo.name, ruta))
+            
+            with st.spinner(f"Extrayendo e insertando {len(rutas)} archivo(s)..."):
+                indice = indice_local if indice_local.existe() else None
+                resumen = ingerir_pdfs(rutas, expediente_id, obtener_cliente_supabase(), indice=indice)
+        
+        for resultado in resumen:
+            if resultado["estado"] == "completado":
+                retomado = f" (retomado desde la página {resultado['retomado_desde']})" if resultado.get("retomado_desde") else ""
+                st.success(
+                    f"{resultado['archivo']}: {resultado['paginas']} páginas, {resultado['fragmentos']} fragmentos, "
+                    f"{resultado['paginas_por_segundo']:.1f} páginas/s{retomado}"
+                )
+            elif resultado["estado"] == "duplicado":
+                st.info(f"{resultado['archivo']} ya había sido cargado; se omitió.")
+            else:
+                st.error(f"{resultado['archivo']}: {resultado['error']}. Puede volver a subirlo para retomar la carga.")
 
 # Mostrar la sección seleccionada
 if menu == "Explorar Expedientes":
     mostrar_busqueda_expedientes()
+    mostrar_busqueda_en_lote()
 elif menu == "Chat":
     mostrar_chat()
 elif menu == "Subir PDF":
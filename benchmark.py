@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+"""Benchmark de la búsqueda del chat y de la llamada al modelo, sin red.
+
+Repite cada consulta de ``benchmark_consultas.json`` contra una base simulada
+(fixtures sintéticos en un espejo SQLite temporal, con latencia por consulta) y un
+servidor local que imita la API de mensajes de Claude (simuladores_llm.py). Por consulta registra:
+
+- latencia total, de la búsqueda y del modelo (p50 y p95, en ms),
+- round trips a la base y bytes recibidos,
+- tamaño del prompt (caracteres y tokens estimados).
+
+Los resultados se escriben en JSON y se comparan con una línea base; cualquier
+regresión termina con código de salida 1::
+
+    python benchmark.py                          # compara con benchmark_baseline.json
+    python benchmark.py --actualizar-baseline    # acepta los resultados actuales como base
+
+Al actualizarla se listan los cambios respecto de la base anterior (resumen y
+regresiones aceptadas), para citarlos en el commit propio de la nueva línea base.
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+# El benchmark mide la búsqueda por la base (sin índice local ni caché persistente) y no
+# debe quedar frenado por el limitador de tasa del modelo
+os.environ["USAR_INDICE_LOCAL"] = "0"
+os.environ["MODO_RECUPERACION"] = "palabras"
+os.environ.pop("RUTA_CACHE", None)
+os.environ["LLM_SOLICITUDES_POR_MINUTO"] = "0"
+os.environ["LLM_TOKENS_POR_MINUTO"] = "0"
+os.environ.setdefault("CLAUDE_API_KEY", "clave-benchmark")
+os.environ.setdefault("TRAZAS_EXPORTADOR", "ninguno")
+
+import llamadas_ia  # noqa: E402
+from analisis_consulta import obtener_vocabulario  # noqa: E402
+from cache_respuestas import cache_busquedas, cache_respuestas  # noqa: E402
+from normalizacion_texto import estimar_tokens  # noqa: E402
+from proveedores_llm import enrutador_llm  # noqa: E402
+from repositorios import repositorio_desde_fixtures  # noqa: E402
+from simuladores_llm import servidor_simulado  # noqa: E402
+from supabase_client import TABLAS_NORMATIVA, buscar_informacion_para_chat  # noqa: E402
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+RUTA_CONSULTAS = os.path.join(DIRECTORIO, "benchmark_consultas.json")
+RUTA_BASELINE = os.path.join(DIRECTORIO, "benchmark_baseline.json")
+
+REPETICIONES = 5
+# Latencias simuladas (segundos): por consulta a la base y por respuesta del modelo
+LATENCIA_BD = 0.02
+LATENCIA_LLM = 0.05
+
+# Aumento tolerado respecto de la línea base, relativo y absoluto, por métrica
+TOLERANCIAS = {
+    "round_trips": (0.0, 0),
+    "bytes_bd": (0.10, 0),
+    "prompt_tokens": (0.10, 0),
+    "latencia_p50_ms": (0.25, 25.0),
+    "latencia_p95_ms": (0.50, 50.0),
+}
+
+# Datos sintéticos: (sigla, nombre) de tipos de proceso y áreas, usados en los números de expediente
+TIPOS_PROCESO = [
+    ("LPN", "Licitación pública"), ("ADS", "Adjudicación simplificada"),
+    ("CDI", "Contratación directa"), ("CPU", "Concurso público"),
+]
+AREAS = [
+    ("LOG", "Logística"), ("TIC", "Tecnologías de la Información"), ("INF", "Infraestructura"),
+    ("RRH", "Recursos Humanos"), ("AJU", "Asesoría Jurídica"),
+]
+TEMAS = [
+    "Adquisición de equipos de cómputo", "Servicio de limpieza de oficinas", "Mantenimiento de vehículos",
+    "Obra de mejoramiento vial", "Consultoría para estudio de preinversión", "Servicio de seguridad y vigilancia",
+    "Suministro de combustible", "Arrendamiento de local institucional", "Capacitación del personal",
+    "Adquisición de licencias de software",
+]
+TIPOS_DOCUMENTO = ["Informe técnico", "Términos de referencia", "Resolución", "Contrato", "Acta de conformidad"]
+ORACIONES = [
+    "El área usuaria remite el requerimiento con las especificaciones técnicas del bien.",
+    "Se verificó la disponibilidad presupuestal mediante la certificación de crédito correspondiente.",
+    "El comité de selección otorgó la buena pro al postor con el menor precio ofertado.",
+    "La entidad aplicará penalidades por mora en la ejecución de la prestación.",
+    "El plazo de ejecución es de sesenta días calendario contados desde la firma del contrato.",
+    "Se recomienda ampliar el plazo por causas no imputables al contratista.",
+    "La garantía de fiel cumplimiento se mantendrá vigente hasta la conformidad de la recepción.",
+    "El órgano encargado de las contrataciones elaboró el estudio de mercado.",
+    "Se declara desierto el procedimiento por no haberse presentado ofertas válidas.",
+    "El contratista solicita una adenda para modificar el cronograma de entregas.",
+    "La conformidad del servicio fue otorgada por el área usuaria sin observaciones.",
+    "Se notificó la resolución del contrato por incumplimiento injustificado de obligaciones.",
+]
+NORMATIVA = {
+    "normativa_articulos": ("numero", "titulo", "texto"),
+    "normativa_anexos": ("codigo", "nombre", "descripcion"),
+    "normativa_disposiciones": ("tipo", "numero", "texto"),
+    "normativa_documentos": ("codigo", "titulo", "sumilla"),
+    "normativa_estructura": ("nivel", "codigo", "titulo"),
+    "normativa_literales": ("literal", "articulo", "texto"),
+    "normativa_numerales": ("numeral", "articulo", "texto"),
+    "normativa_referencias": ("norma", "articulo", "descripcion"),
+}
+
+
+def numero_expediente(i):
+    """Número del i-ésimo expediente sintético (formato 2022-LPN-LOG-0001)."""
+    return f"{2022 + i % 3}-{TIPOS_PROCESO[i % len(TIPOS_PROCESO)][0]}-{AREAS[i % len(AREAS)][0]}-{i + 1:04d}"
+
+
+def generar_fixtures(directorio, expedientes=200, registros_normativa=40, semilla=7):
+    """Escribe en ``directorio`` fixtures sintéticos y reproducibles (un JSON por tabla)."""
+    aleatorio = random.Random(semilla)
+    filas_expedientes, filas_documentos = [], []
+    for i in range(expedientes):
+        fecha = f"{2022 + i % 3}-{1 + i % 12:02d}-{1 + i % 28:02d}"
+        filas_expedientes.append({
+            "id": i + 1,
+            "numero_expediente": numero_expediente(i),
+            "fecha_creacion": fecha,
+            "tipo_proceso": TIPOS_PROCESO[i % len(TIPOS_PROCESO)][1],
+            "modalidad": aleatorio.choice(["Suma alzada", "Precios unitarios", "Esquema mixto"]),
+            "seccion": aleatorio.choice(["Bienes", "Servicios", "Obras", "Consultorías"]),
+            "tema_principal": aleatorio.choice(TEMAS),
+            "area_solicitante": AREAS[i % len(AREAS)][1],
+            "estado": aleatorio.choice(["En trámite", "Adjudicado", "Concluido", "Desierto"]),
+            "updated_at": f"{fecha}T10:00:00",
+        })
+        for _ in range(aleatorio.randint(2, 5)):
+            filas_documentos.append({
+                "id": len(filas_documentos) + 1,
+                "expediente_id": i + 1,
+                "tipo_documento": aleatorio.choice(TIPOS_DOCUMENTO),
+                "nombre_archivo": f"{numero_expediente(i)}-{len(filas_documentos) + 1}.pdf",
+                "contenido": " ".join(aleatorio.choice(ORACIONES) for _ in range(aleatorio.randint(4, 16))),
+                "updated_at": f"{fecha}T12:00:00",
+            })
+
+    tablas = {"expedientes": filas_expedientes, "documentos_expediente": filas_documentos}
+    for tabla, (corta, media, larga) in NORMATIVA.items():
+        tablas[tabla] = [
+            {
+                "id": j + 1,
+                corta: str(j + 1),
+                media: f"Artículo {aleatorio.randint(1, 80)} de la Ley de Contrataciones del Estado",
+                larga: " ".join(aleatorio.choice(ORACIONES) for _ in range(aleatorio.randint(1, 4))),
+                "updated_at": "2024-01-01T00:00:00",
+            }
+            for j in range(registros_normativa)
+        ]
+
+    for tabla, filas in tablas.items():
+        with open(os.path.join(directorio, f"{tabla}.json"), "w", encoding="utf-8") as archivo:
+            json.dump(filas, archivo, ensure_ascii=False)
+
+
+def percentil(valores, p):
+    """Percentil ``p`` (0-100) por rango más cercano."""
+    ordenados = sorted(valores)
+    if not ordenados:
+        return 0.0
+    rango = math.ceil(p / 100 * len(ordenados))
+    return ordenados[max(0, min(len(ordenados), rango) - 1)]
+
+
+def medir_consulta(consulta, repositorio, repeticiones):
+    """Ejecuta el turno completo ``repeticiones`` veces con los cachés vacíos."""
+    totales, busquedas, modelos = [], [], []
+    round_trips = bytes_bd = 0
+    prompt = ""
+    for _ in range(repeticiones):
+        cache_busquedas.limpiar()
+        cache_respuestas.limpiar()
+        inicio = time.perf_counter()
+        informacion_bd = buscar_informacion_para_chat(consulta, repositorio=repositorio)
+        fin_busqueda = time.perf_counter()
+        solicitud = llamadas_ia.preparar_solicitud(consulta, informacion_bd=informacion_bd)
+        prompt = llamadas_ia.texto_solicitud(solicitud)
+        inicio_modelo = time.perf_counter()
+        llamadas_ia.consulta_ia(consulta, solicitud=solicitud, proveedor="Claude")
+        fin = time.perf_counter()
+
+        totales.append((fin - inicio) * 1000)
+        busquedas.append((fin_busqueda - inicio) * 1000)
+        modelos.append((fin - inicio_modelo) * 1000)
+        estadisticas = informacion_bd.get("estadisticas", {})
+        round_trips = max(round_trips, estadisticas.get("consultas", 0))
+        bytes_bd = max(bytes_bd, estadisticas.get("bytes", 0))
+
+    return {
+        "latencia_p50_ms": round(percentil(totales, 50), 1),
+        "latencia_p95_ms": round(percentil(totales, 95), 1),
+        "busqueda_p50_ms": round(percentil(busquedas, 50), 1),
+        "busqueda_p95_ms": round(percentil(busquedas, 95), 1),
+        "modelo_p50_ms": round(percentil(modelos, 50), 1),
+        "modelo_p95_ms": round(percentil(modelos, 95), 1),
+        "round_trips": round_trips,
+        "bytes_bd": bytes_bd,
+        "prompt_caracteres": len(prompt),
+        "prompt_tokens": estimar_tokens(prompt),
+    }
+
+
+def ejecutar_benchmark(consultas, repositorio, repeticiones=REPETICIONES, detallado=False):
+    """Mide todas las consultas. Devuelve ``{"consultas": {id: métricas}, "resumen": {...}}``."""
+    # Esquemas de normativa y vocabulario ya en caché, como en un proceso que lleva tiempo en marcha
+    for tabla in TABLAS_NORMATIVA:
+        repositorio.columnas_texto(tabla)
+    obtener_vocabulario(repositorio, ["expedientes", "documentos_expediente"] + TABLAS_NORMATIVA)
+
+    resultados = {}
+    for item in consultas:
+        salida = contextlib.nullcontext() if detallado else contextlib.redirect_stdout(io.StringIO())
+        with salida:
+            resultados[item["id"]] = medir_consulta(item["consulta"], repositorio, repeticiones)
+        resultados[item["id"]]["tipo"] = item.get("tipo")
+        m = resultados[item["id"]]
+        print(f"{item['id']:<28} p50 {m['latencia_p50_ms']:>7.1f} ms  p95 {m['latencia_p95_ms']:>7.1f} ms  "
+              f"{m['round_trips']:>3} consultas  {m['bytes_bd']:>7} bytes  {m['prompt_tokens']:>5} tokens")
+
+    metricas = list(resultados.values())
+    resumen = {
+        "consultas": len(metricas),
+        "round_trips_total": sum(m["round_trips"] for m in metricas),
+        "bytes_bd_total": sum(m["bytes_bd"] for m in metricas),
+        "prompt_tokens_promedio": round(sum(m["prompt_tokens"] for m in metricas) / max(1, len(metricas)), 1),
+        "latencia_p50_ms": round(percentil([m["latencia_p50_ms"] for m in metricas], 50), 1),
+        "latencia_p95_ms": round(percentil([m["latencia_p95_ms"] for m in metricas], 95), 1),
+    }
+    return {"consultas": resultados, "resumen": resumen}
+
+
+def comparar(actual, base, tolerancias=TOLERANCIAS):
+    """Lista de regresiones (textos) de ``actual`` respecto de ``base``."""
+    regresiones = []
+    for id_consulta, previas in base.get("consultas", {}).items():
+        metricas = actual["consultas"].get(id_consulta)
+        if metricas is None:
+            regresiones.append(f"{id_consulta}: la consulta ya no está en el corpus")
+            continue
+        for metrica, (relativa, absoluta) in tolerancias.items():
+            if metrica not in previas:
+                continue
+            limite = previas[metrica] * (1 + relativa) + absoluta
+            if metricas[metrica] > limite:
+                regresiones.append(
+                    f"{id_consulta}: {metrica} {metricas[metrica]} > {previas[metrica]} (límite {limite:g})"
+                )
+    return regresiones
+
+
+def diferencias_resumen(actual, base):
+    """Líneas ``métrica: base -> actual (±%)`` del resumen, para el mensaje del commit de la línea base."""
+    lineas = []
+    for metrica, valor in actual["resumen"].items():
+        previo = base.get("resumen", {}).get(metrica)
+        if previo is None or previo == valor:
+            continue
+        cambio = f" ({(valor - previo) / previo:+.1%})" if previo else ""
+        lineas.append(f"{metrica}: {previo} -> {valor}{cambio}")
+    return lineas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--consultas", default=RUTA_CONSULTAS, help="corpus de consultas (JSON)")
+    parser.add_argument("--fixtures", help="directorio con fixtures propios (por defecto se generan)")
+    parser.add_argument("--repeticiones", type=int, default=REPETICIONES)
+    parser.add_argument("--latencia-bd", type=float, default=LATENCIA_BD, help="segundos por consulta a la base")
+    parser.add_argument("--latencia-llm", type=float, default=LATENCIA_LLM, help="segundos por respuesta del modelo")
+    parser.add_argument("--salida", default="resultados_benchmark.json")
+    parser.add_argument("--baseline", default=RUTA_BASELINE)
+    parser.add_argument("--actualizar-baseline", action="store_true", help="guarda los resultados como línea base")
+    parser.add_argument("--detallado", action="store_true", help="muestra los mensajes de la búsqueda")
+    args = parser.parse_args()
+
+    with open(args.consultas, encoding="utf-8") as archivo:
+        consultas = json.load(archivo)
+
+    with tempfile.TemporaryDirectory(prefix="benchmark_") as temporal:
+        directorio_fixtures = args.fixtures
+        if not directorio_fixtures:
+            generar_fixtures(temporal)
+            directorio_fixtures = temporal
+        with contextlib.redirect_stdout(io.StringIO()):
+            repositorio = repositorio_desde_fixtures(directorio_fixtures, latencia=args.latencia_bd)
+
+    servidor, url = servidor_simulado("Claude", args.latencia_llm)
+    enrutador_llm.proveedores["Claude"].url = url
+    try:
+        resultados = ejecutar_benchmark(consultas, repositorio, args.repeticiones, args.detallado)
+    finally:
+        servidor.shutdown()
+    resultados["parametros"] = {
+        "repeticiones": args.repeticiones, "latencia_bd": args.latencia_bd, "latencia_llm": args.latencia_llm,
+        "fixtures": args.fixtures or "sinteticos",
+    }
+
+    with open(args.salida, "w", encoding="utf-8") as archivo:
+        json.dump(resultados, archivo, ensure_ascii=False, indent=2)
+    print(f"\nResumen: {resultados['resumen']}")
+    print(f"Resultados guardados en {args.salida}")
+
+    if args.actualizar_baseline:
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as archivo:
+                base = json.load(archivo)
+            print("\nCambios respecto de la línea base anterior:")
+            for linea in diferencias_resumen(resultados, base) + comparar(resultados, base):
+                print(f"  - {linea}")
+        with open(args.baseline, "w", encoding="utf-8") as archivo:
+            json.dump(resultados, archivo, ensure_ascii=False, indent=2)
+        print(f"Línea base actualizada: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No existe la línea base {args.baseline}; use --actualizar-baseline para crearla")
+        return 0
+    with open(args.baseline, encoding="utf-8") as archivo:
+        base = json.load(archivo)
+    if base.get("parametros", {}).get("latencia_bd") != args.latencia_bd:
+        print("⚠️ La línea base se midió con otra latencia simulada; las latencias no son comparables")
+    regresiones = comparar(resultados, base)
+    if regresiones:
+        print(f"\n❌ {len(regresiones)} REGRESIONES respecto de {args.baseline}:")
+        for regresion in regresiones:
+            print(f"  - {regresion}")
+        return 1
+    print(f"\n✅ Sin regresiones respecto de {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
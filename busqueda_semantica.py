@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""Recuperación semántica (vectorial) para el chat.
+
+Divide el contenido de los documentos y de las normativas en fragmentos, los
+convierte en vectores con un modelo local en CPU (sentence-transformers) y guarda
+la matriz normalizada en un archivo ``.npy`` que se abre con memoria mapeada.
+Una consulta se responde con un producto matriz-vector y un top-k por similitud
+coseno, sin ninguna consulta a Supabase.
+
+Requiere ``numpy`` y ``sentence-transformers``, que sólo se importan al usarlo.
+El índice se construye a partir de las filas del índice local (indice_local.py)::
+
+    python busqueda_semantica.py
+"""
+import contextlib
+import glob
+import json
+import os
+import secrets
+import sqlite3
+import threading
+
+# Archivos del índice: <ruta>.db (de qué fila y posición es cada fragmento, cada fila una
+# sola vez y la versión del índice) y <ruta>-<versión>.npy (vectores). Al reconstruirlo
+# se escriben archivos nuevos y el .db se reemplaza al final, de un solo paso: quien lo
+# lea ve siempre un .db con los vectores de su misma versión
+RUTA_VECTORES = os.environ.get(
+    "RUTA_VECTORES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "vectores")
+)
+MODELO_EMBEDDINGS = os.environ.get(
+    "MODELO_EMBEDDINGS", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+)
+
+# Tamaño de los fragmentos (en palabras) y solapamiento entre fragmentos consecutivos
+PALABRAS_POR_FRAGMENTO = 200
+SOLAPAMIENTO = 40
+# Fragmentos por lote al calcular los vectores
+TAMANO_LOTE = 64
+# Similitud coseno mínima para considerar relevante un fragmento
+MIN_SIMILITUD = float(os.environ.get("MIN_SIMILITUD", "0.3"))
+
+# Columnas que no aportan texto a los fragmentos
+_COLUMNAS_NO_TEXTO = {"id", "created_at", "updated_at", "expediente_id"}
+
+_ESQUEMA = """
+CREATE TABLE filas (
+    tabla TEXT NOT NULL,
+    registro_id TEXT NOT NULL,
+    datos TEXT NOT NULL,
+    PRIMARY KEY (tabla, registro_id)
+);
+CREATE TABLE fragmentos (
+    indice INTEGER PRIMARY KEY,
+    tabla TEXT NOT NULL,
+    registro_id TEXT NOT NULL,
+    posicion INTEGER NOT NULL
+);
+CREATE TABLE version (
+    valor TEXT
+);
+"""
+
+
+def fragmentar(texto, palabras_por_fragmento=PALABRAS_POR_FRAGMENTO, solapamiento=SOLAPAMIENTO):
+    """Divide ``texto`` en fragmentos de palabras que se solapan parcialmente."""
+    palabras = (texto or "").split()
+    if not palabras:
+        return []
+    paso = max(1, palabras_por_fragmento - solapamiento)
+    return [
+        " ".join(palabras[i:i + palabras_por_fragmento])
+        for i in range(0, max(1, len(palabras) - solapamiento), paso)
+    ]
+
+
+def _texto_fila(tabla, fila):
+    if tabla == "documentos_expediente":
+        return fila.get("contenido") or ""
+    return " ".join(
+        str(valor) for columna, valor in fila.items()
+        if columna not in _COLUMNAS_NO_TEXTO and isinstance(valor, str)
+    )
+
+
+class IndiceSemantico:
+    """Matriz de vectores en disco (memoria mapeada) con búsqueda top-k por coseno."""
+
+    def __init__(self, ruta=RUTA_VECTORES, modelo=MODELO_EMBEDDINGS):
+        self.ruta = ruta
+        self.nombre_modelo = modelo
+        self._modelo = None
+        # ((inodo, mtime) del .db, versión, matriz) cargados por última vez
+        self._cargado = (None, None, None)
+        self._lock = threading.Lock()
+
+    def existe(self):
+        return os.path.exists(self.ruta + ".db")
+
+    def _ruta_vectores(self, version):
+        return f"{self.ruta}-{version}.npy"
+
+    @contextlib.contextmanager
+    def _conexion(self, ruta=None):
+        # Una conexión por llamada (la búsqueda corre en varios hilos), que se cierra al terminar
+        conexion = sqlite3.connect(ruta or self.ruta + ".db")
+        try:
+            with conexion:
+                yield conexion
+        finally:
+            conexion.close()
+
+    def _obtener_modelo(self):
+        with self._lock:
+            if self._modelo is None:
+                from sentence_transformers import SentenceTransformer
+                self._modelo = SentenceTransformer(self.nombre_modelo, device="cpu")
+            return self._modelo
+
+    def _vectorizar(self, textos):
+        return self._obtener_modelo().encode(
+            textos, batch_size=TAMANO_LOTE, normalize_embeddings=True, convert_to_numpy=True
+        ).astype("float32")
+
+    def construir(self, filas):
+        """Construye el índice a partir de pares ``(tabla, fila)``. Devuelve el nº de fragmentos.
+
+        Cada fila se guarda una vez en ``<ruta>.db``; de cada fragmento sólo se guarda
+        su fila y su posición (el texto se vuelve a cortar al devolverlo).
+        """
+        import numpy as np
+
+        temporal = f"{self.ruta}.db.{secrets.token_hex(4)}.tmp"
+        textos = []
+        version = None
+        try:
+            with self._conexion(temporal) as conexion:
+                conexion.executescript(_ESQUEMA)
+                for tabla, fila in filas:
+                    registro_id = str(fila["id"])
+                    fragmentos = fragmentar(_texto_fila(tabla, fila))
+                    if not fragmentos:
+                        continue
+                    conexion.execute(
+                        "INSERT OR REPLACE INTO filas (tabla, registro_id, datos) VALUES (?, ?, ?)",
+                        (tabla, registro_id, json.dumps(fila, ensure_ascii=False, default=str))
+                    )
+                    conexion.executemany(
+                        "INSERT INTO fragmentos (indice, tabla, registro_id, posicion) VALUES (?, ?, ?, ?)",
+                        [(len(textos) + posicion, tabla, registro_id, posicion) for posicion in range(len(fragmentos))]
+                    )
+                    textos.extend(fragmentos)
+
+                # Sin texto que indexar el índice queda vacío (versión nula, sin vectores)
+                if textos:
+                    version = secrets.token_hex(8)
+                    dimension = self._obtener_modelo().get_sentence_embedding_dimension()
+                    # Se escribe por lotes directamente al archivo para no tener toda la matriz en memoria
+                    matriz = np.lib.format.open_memmap(
+                        self._ruta_vectores(version), mode="w+", dtype="float32", shape=(len(textos), dimension)
+                    )
+                    for inicio in range(0, len(textos), TAMANO_LOTE):
+                        lote = textos[inicio:inicio + TAMANO_LOTE]
+                        matriz[inicio:inicio + len(lote)] = self._vectorizar(lote)
+                    matriz.flush()
+                    del matriz
+                conexion.execute("INSERT INTO version (valor) VALUES (?)", (version,))
+        except BaseException:
+            # El índice publicado queda intacto; sólo se descarta lo que se estaba escribiendo
+            for ruta in (temporal, self._ruta_vectores(version)):
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+            raise
+
+        os.replace(temporal, self.ruta + ".db")
+        # Los vectores anteriores ya no los referencia el .db (un proceso que aún los tenga
+        # mapeados los conserva hasta soltarlos)
+        for ruta in glob.glob(glob.escape(self.ruta) + "-*.npy"):
+            if ruta != self._ruta_vectores(version):
+                os.remove(ruta)
+        return len(textos)
+
+    def _cargar(self):
+        """``(versión, matriz)`` vigentes; se vuelven a leer si otro proceso reconstruyó el índice."""
+        import numpy as np
+
+        # Cada reconstrucción reemplaza el .db por otro archivo (otro inodo)
+        estado = os.stat(self.ruta + ".db")
+        modificado = (estado.st_ino, estado.st_mtime_ns)
+        with self._lock:
+            if self._cargado[0] != modificado:
+                with self._conexion() as conexion:
+                    (version,) = conexion.execute("SELECT valor FROM version").fetchone()
+                if version != self._cargado[1]:
+                    matriz = None if version is None else np.load(self._ruta_vectores(version), mmap_mode="r")
+                else:
+                    matriz = self._cargado[2]
+                self._cargado = (modificado, version, matriz)
+            return self._cargado[1], self._cargado[2]
+
+    def fragmentos(self, indices, version=None):
+        """Metadatos ``{"tabla", "posicion", "fragmento", "fila"}`` de los fragmentos ``indices``.
+
+        Con ``version``, si el índice cambió desde entonces no devuelve ninguno.
+        """
+        if not indices:
+            return {}
+        with self._conexion() as conexion:
+            if version is not None and conexion.execute("SELECT valor FROM version").fetchone()[0] != version:
+                return {}
+            registros = conexion.execute(
+                "SELECT fragmentos.indice, fragmentos.tabla, fragmentos.posicion, filas.datos "
+                "FROM fragmentos JOIN filas ON filas.tabla = fragmentos.tabla "
+                "AND filas.registro_id = fragmentos.registro_id "
+                f"WHERE fragmentos.indice IN ({', '.join('?' for _ in indices)})",
+                [int(i) for i in indices]
+            ).fetchall()
+        metadatos = {}
+        for indice, tabla, posicion, datos in registros:
+            fila = json.loads(datos)
+            fragmento = fragmentar(_texto_fila(tabla, fila))[posicion]
+            metadatos[indice] = {"tabla": tabla, "posicion": posicion, "fragmento": fragmento, "fila": fila}
+        return metadatos
+
+    def buscar(self, consulta, k=10, min_similitud=MIN_SIMILITUD):
+        """Devuelve hasta ``k`` fragmentos ``(similitud, metadatos)`` ordenados por similitud."""
+        import numpy as np
+
+        version, matriz = self._cargar()
+        if matriz is None or not len(matriz):
+            return []
+
+        similitudes = matriz @ self._vectorizar([consulta])[0]
+        k = min(k, len(similitudes))
+        mejores = np.argpartition(-similitudes, k - 1)[:k]
+        mejores = [int(i) for i in mejores[np.argsort(-similitudes[mejores])] if similitudes[i] >= min_similitud]
+        metadatos = self.fragmentos(mejores, version)
+        return [(float(similitudes[i]), metadatos[i]) for i in mejores if i in metadatos]
+
+
+if __name__ == "__main__":
+    from indice_local import IndiceLocal
+
+    total = IndiceSemantico().construir(IndiceLocal().filas())
+    print(f"Índice semántico construido con {total} fragmentos")
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""Caché de esquemas (columnas de texto) de las tablas consultadas por el chat.
+
+Evita descubrir las columnas de cada tabla de normativa en cada turno: se cargan
+una vez por proceso y se reutilizan hasta que vence el TTL o se invalidan.
+"""
+import os
+import threading
+import time
+
+# Segundos que una entrada del caché se considera vigente
+TTL_ESQUEMAS = float(os.environ.get("TTL_ESQUEMAS", "3600"))
+
+
+class CacheEsquemas:
+    """Caché thread-safe ``tabla -> columnas de texto`` con TTL e invalidación explícita."""
+
+    def __init__(self, ttl=TTL_ESQUEMAS):
+        self.ttl = ttl
+        self._columnas = {}
+        self._lock = threading.Lock()
+        # Serializa las cargas para que varios hilos no consulten el mismo esquema a la vez
+        self._lock_carga = threading.Lock()
+
+    def _vigente(self, tabla):
+        with self._lock:
+            entrada = self._columnas.get(tabla)
+            if entrada is None:
+                return None
+            columnas, cargado_en = entrada
+            if time.monotonic() - cargado_en > self.ttl:
+                del self._columnas[tabla]
+                return None
+            return columnas
+
+    def obtener(self, tabla, cargador):
+        """Devuelve las columnas de texto de ``tabla``, cargándolas si hace falta.
+
+        ``cargador(tabla)`` debe devolver un diccionario ``tabla -> columnas``; puede
+        incluir otras tablas además de la pedida, que quedan también en caché.
+        """
+        columnas = self._vigente(tabla)
+        if columnas is not None:
+            return columnas
+
+        with self._lock_carga:
+            # Otro hilo pudo haberla cargado mientras esperábamos
+            columnas = self._vigente(tabla)
+            if columnas is None:
+                esquemas = cargador(tabla)
+                self.guardar(esquemas)
+                columnas = esquemas.get(tabla, [])
+        return columnas
+
+    def guardar(self, esquemas):
+        ahora = time.monotonic()
+        with self._lock:
+            for tabla, columnas in esquemas.items():
+                self._columnas[tabla] = (list(columnas), ahora)
+
+    def invalidar(self, tabla=None):
+        """Descarta el esquema de ``tabla`` o, sin argumento, el de todas las tablas."""
+        with self._lock:
+            if tabla is None:
+                self._columnas.clear()
+            else:
+                self._columnas.pop(tabla, None)
+
+
+# Caché compartido por todo el proceso
+cache_esquemas = CacheEsquemas()
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""Caché de dos niveles para el chat.
+
+- ``cache_busquedas``: resultados de ``buscar_informacion_para_chat`` por consulta
+  normalizada, con un TTL corto.
+- ``cache_respuestas``: respuestas finales del modelo, con clave ``hash(modelo + prompt)``.
+
+Ambos son LRU con límite de entradas y TTL. Si se define ``RUTA_CACHE`` también
+se guardan en un archivo SQLite, de modo que sobreviven a reinicios de Streamlit.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from normalizacion_texto import tokenizar
+
+# Archivo SQLite opcional para persistir el caché entre reinicios
+RUTA_CACHE = os.environ.get("RUTA_CACHE")
+
+TTL_CACHE_BUSQUEDAS = float(os.environ.get("TTL_CACHE_BUSQUEDAS", "300"))
+MAX_CACHE_BUSQUEDAS = int(os.environ.get("MAX_CACHE_BUSQUEDAS", "256"))
+TTL_CACHE_RESPUESTAS = float(os.environ.get("TTL_CACHE_RESPUESTAS", "86400"))
+MAX_CACHE_RESPUESTAS = int(os.environ.get("MAX_CACHE_RESPUESTAS", "1000"))
+
+
+def normalizar_consulta(consulta):
+    """Clave común para consultas casi idénticas: sin acentos, mayúsculas ni puntuación."""
+    return " ".join(tokenizar(consulta))
+
+
+def clave_respuesta(modelo, prompt):
+    """Clave de una respuesta del modelo: hash del modelo más el prompt completo."""
+    return hashlib.sha256(f"{modelo}\n{prompt}".encode("utf-8")).hexdigest()
+
+
+class CacheLRU:
+    """Caché LRU thread-safe con TTL, límite de entradas y respaldo opcional en SQLite.
+
+    Los valores deben poder serializarse a JSON si se usa ``ruta``. El lock sólo
+    protege las entradas en memoria: las lecturas y escrituras del archivo se hacen
+    fuera de él, cada una con su propia conexión.
+    """
+
+    def __init__(self, nombre, max_entradas, ttl, ruta=None):
+        self.nombre = nombre
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.ruta = ruta
+        self.aciertos = 0
+        self.fallos = 0
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        if self.ruta:
+            with self._conexion() as conexion:
+                conexion.execute(
+                    "CREATE TABLE IF NOT EXISTS cache (nombre TEXT, clave TEXT, valor TEXT, "
+                    "guardado_en REAL, usado_en REAL, PRIMARY KEY (nombre, clave))"
+                )
+
+    @contextlib.contextmanager
+    def _conexion(self):
+        # Conexión de corta vida: transacción al salir del bloque y cierre siempre
+        conexion = sqlite3.connect(self.ruta, timeout=10)
+        try:
+            with conexion:
+                yield conexion
+        finally:
+            conexion.close()
+
+    def _leer_disco(self, clave):
+        with self._conexion() as conexion:
+            fila = conexion.execute(
+                "SELECT valor, guardado_en FROM cache WHERE nombre = ? AND clave = ?", (self.nombre, clave)
+            ).fetchone()
+            if fila:
+                conexion.execute(
+                    "UPDATE cache SET usado_en = ? WHERE nombre = ? AND clave = ?", (time.time(), self.nombre, clave)
+                )
+        return (json.loads(fila[0]), fila[1]) if fila else None
+
+    def _escribir_disco(self, clave, valor, guardado_en):
+        with self._conexion() as conexion:
+            conexion.execute(
+                "INSERT OR REPLACE INTO cache (nombre, clave, valor, guardado_en, usado_en) VALUES (?, ?, ?, ?, ?)",
+                (self.nombre, clave, json.dumps(valor, ensure_ascii=False, default=str), guardado_en, guardado_en)
+            )
+            # Expulsar las entradas vencidas y las menos usadas recientemente
+            conexion.execute(
+                "DELETE FROM cache WHERE nombre = ? AND guardado_en < ?", (self.nombre, time.time() - self.ttl)
+            )
+            conexion.execute(
+                "DELETE FROM cache WHERE nombre = ? AND clave NOT IN "
+                "(SELECT clave FROM cache WHERE nombre = ? ORDER BY usado_en DESC LIMIT ?)",
+                (self.nombre, self.nombre, self.max_entradas)
+            )
+
+    def obtener(self, clave):
+        """Devuelve el valor guardado o None si no existe o venció."""
+        ahora = time.time()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+        if entrada is None and self.ruta:
+            entrada = self._leer_disco(clave)
+        with self._lock:
+            if entrada is not None and ahora - entrada[1] <= self.ttl:
+                self._entradas[clave] = entrada
+                self._entradas.move_to_end(clave)
+                self._recortar()
+                self.aciertos += 1
+                return entrada[0]
+            self._entradas.pop(clave, None)
+            self.fallos += 1
+            return None
+
+    def guardar(self, clave, valor):
+        ahora = time.time()
+        with self._lock:
+            self._entradas[clave] = (valor, ahora)
+            self._entradas.move_to_end(clave)
+            self._recortar()
+        if self.ruta:
+            self._escribir_disco(clave, valor, ahora)
+
+    def _recortar(self):
+        while len(self._entradas) > self.max_entradas:
+            self._entradas.popitem(last=False)
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+        if self.ruta:
+            with self._conexion() as conexion:
+                conexion.execute("DELETE FROM cache WHERE nombre = ?", (self.nombre,))
+
+    def estadisticas(self):
+        with self._lock:
+            return {"aciertos": self.aciertos, "fallos": self.fallos, "entradas": len(self._entradas)}
+
+
+# Cachés compartidos por todo el proceso
+cache_busquedas = CacheLRU("busquedas", MAX_CACHE_BUSQUEDAS, TTL_CACHE_BUSQUEDAS, RUTA_CACHE)
+cache_respuestas = CacheLRU("respuestas", MAX_CACHE_RESPUESTAS, TTL_CACHE_RESPUESTAS, RUTA_CACHE)
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""Construcción del contexto que se envía al modelo.
+
+Puntúa cada expediente, documento y registro de normativa encontrado según su
+relevancia para la consulta, descarta duplicados y elige los mejores hasta
+llenar un presupuesto de tokens. En lugar de cortar el contenido en los primeros
+caracteres, de cada texto largo se toma el fragmento con más palabras de la consulta.
+"""
+import hashlib
+import math
+import os
+import re
+
+from analisis_consulta import PALABRAS_VACIAS
+from normalizacion_texto import estimar_tokens, raiz, raiz_de_palabra, raices, tokenizar
+
+# Tokens máximos del contexto de la base de datos dentro del prompt
+PRESUPUESTO_TOKENS_CONTEXTO = int(os.environ.get("PRESUPUESTO_TOKENS_CONTEXTO", "3000"))
+# Caracteres de los extractos de documentos y de los valores de normativa
+LARGO_EXTRACTO = 300
+LARGO_VALOR_NORMATIVA = 100
+# Bonificación para los expedientes citados por número (y sus documentos)
+BONO_EXPEDIENTE_CITADO = 10.0
+BONO_DOCUMENTO_DE_CITADO = 1.0
+
+_PATRON_PALABRA = re.compile(r"\w+", re.UNICODE)
+_PATRON_EXPEDIENTE = re.compile(r"\d{4}-[A-Za-z]{3}-[A-Za-z]{3}-\d{4}")
+
+_SECCIONES = [
+    ("expedientes", "\n\n## Expedientes encontrados:\n"),
+    ("documentos", "\n\n## Documentos relevantes:\n"),
+    ("normativas", "\n\n## Normativas relacionadas:\n"),
+]
+
+
+# Función para formatear mejor los datos del expediente
+def formatear_expediente(expediente):
+    info = []
+
+    # Campos principales
+    campos_principales = [
+        ("Número", "numero_expediente"),
+        ("Fecha de creación", "fecha_creacion"),
+        ("Tipo de proceso", "tipo_proceso"),
+        ("Modalidad", "modalidad"),
+        ("Sección", "seccion"),
+        ("Tema principal", "tema_principal"),
+        ("Área solicitante", "area_solicitante"),
+        ("Estado", "estado")
+    ]
+
+    for label, campo in campos_principales:
+        if campo in expediente and expediente[campo]:
+            info.append(f"{label}: {expediente[campo]}")
+
+    return info
+
+# Función para formatear mejor los datos de documentos
+def formatear_documento(documento, extracto=None):
+    info = []
+
+    # Campos principales para documentos
+    if "tipo_documento" in documento and documento["tipo_documento"]:
+        info.append(f"Tipo: {documento['tipo_documento']}")
+
+    if "nombre_archivo" in documento and documento["nombre_archivo"]:
+        info.append(f"Archivo: {documento['nombre_archivo']}")
+
+    if "contenido" in documento and documento["contenido"]:
+        # Limitar el tamaño del contenido (o usar el fragmento más relevante si se indica)
+        contenido = extracto if extracto is not None else documento["contenido"]
+        if extracto is None and len(contenido) > LARGO_EXTRACTO:
+            contenido = contenido[:LARGO_EXTRACTO] + "..."
+        info.append(f"Extracto: {contenido}")
+
+    # Información del expediente relacionado
+    if "expediente_numero" in documento and documento["expediente_numero"]:
+        info.append(f"Pertenece al expediente: {documento['expediente_numero']}")
+
+    return info
+
+
+def extraer_fragmento(texto, raices_consulta, largo=LARGO_EXTRACTO):
+    """Devuelve la ventana de ``largo`` caracteres con más palabras de la consulta."""
+    if len(texto) <= largo:
+        return texto
+
+    posiciones = [
+        m.start() for m in _PATRON_PALABRA.finditer(texto)
+        if raiz_de_palabra(m.group()) in raices_consulta
+    ]
+    if not posiciones:
+        return texto[:largo] + "..."
+
+    # Ventana deslizante sobre las posiciones de las coincidencias
+    mejor_inicio, mejor_cuenta, fin = posiciones[0], 0, 0
+    for i, inicio in enumerate(posiciones):
+        while fin < len(posiciones) and posiciones[fin] < inicio + largo:
+            fin += 1
+        if fin - i > mejor_cuenta:
+            mejor_inicio, mejor_cuenta = inicio, fin - i
+
+    # Dejar un poco de contexto antes de la primera coincidencia
+    inicio = max(0, min(mejor_inicio - largo // 5, len(texto) - largo))
+    fragmento = texto[inicio:inicio + largo]
+    return ("..." if inicio > 0 else "") + fragmento + ("..." if inicio + largo < len(texto) else "")
+
+
+def puntuar(texto, raices_consulta):
+    """Relevancia de ``texto``: proporción de raíces de la consulta presentes más un
+    pequeño bono (logarítmico) por la cantidad de apariciones."""
+    if not raices_consulta:
+        return 0.0
+    apariciones = [r for r in raices(texto) if r in raices_consulta]
+    cobertura = len(set(apariciones)) / len(raices_consulta)
+    return cobertura + 0.1 * math.log1p(len(apariciones))
+
+
+def _candidatos(informacion_bd, raices_consulta, citados):
+    # Cada candidato: (seccion, grupo, lineas, texto para puntuar, bono)
+    for exp in informacion_bd.get("expedientes") or []:
+        lineas = formatear_expediente(exp)
+        bono = BONO_EXPEDIENTE_CITADO if str(exp.get("numero_expediente", "")).lower() in citados else 0.0
+        yield "expedientes", None, lineas, " ".join(lineas), bono
+
+    for doc in informacion_bd.get("documentos") or []:
+        contenido = doc.get("contenido") or ""
+        extracto = extraer_fragmento(contenido, raices_consulta) if contenido else None
+        lineas = formatear_documento(doc, extracto)
+        bono = BONO_DOCUMENTO_DE_CITADO if str(doc.get("expediente_numero", "")).lower() in citados else 0.0
+        texto = " ".join(str(doc.get(campo) or "") for campo in ("tipo_documento", "nombre_archivo", "contenido"))
+        yield "documentos", None, lineas, texto, bono
+
+    for norm in informacion_bd.get("normativas") or []:
+        tabla = norm.get("tabla", "").replace("normativa_", "").capitalize()
+        grupo = f"\n### {tabla} relacionados con '{norm.get('palabra_clave', '')}':\n"
+        for item in norm.get("datos", []):
+            lineas = []
+            textos = []
+            # Mostrar campos relevantes
+            for key, value in item.items():
+                if key not in ["id", "created_at", "updated_at"] and value is not None:
+                    str_value = str(value)
+                    textos.append(str_value)
+                    if len(str_value) > LARGO_VALOR_NORMATIVA:
+                        str_value = extraer_fragmento(str_value, raices_consulta, LARGO_VALOR_NORMATIVA)
+                    lineas.append(f"{key}: {str_value}")
+            yield "normativas", grupo, lineas, " ".join(textos), 0.0
+
+
+def construir_contexto(informacion_bd, consulta, presupuesto=PRESUPUESTO_TOKENS_CONTEXTO):
+    """Arma el contexto con los candidatos más relevantes que caben en ``presupuesto`` tokens.
+
+    Devuelve ``(contexto, estadisticas)``; el contexto es una cadena vacía si no hubo
+    resultados.
+    """
+    if not informacion_bd:
+        return "", {"candidatos": 0, "incluidos": 0, "tokens": 0}
+
+    # Sólo las palabras con contenido: con las vacías, un texto lleno de "de", "la" o "por"
+    # puntuaría como relevante y desplazaría el extracto de las palabras que importan
+    raices_consulta = {raiz(palabra) for palabra in tokenizar(consulta) if palabra not in PALABRAS_VACIAS}
+    citados = {numero.lower() for numero in _PATRON_EXPEDIENTE.findall(consulta)}
+
+    # Puntuar y descartar duplicados (mismo texto normalizado)
+    candidatos = []
+    vistos = set()
+    for orden, (seccion, grupo, lineas, texto, bono) in enumerate(_candidatos(informacion_bd, raices_consulta, citados)):
+        if not lineas:
+            continue
+        huella = hashlib.md5(" ".join(tokenizar(" ".join(lineas))).encode("utf-8")).hexdigest()
+        if huella in vistos:
+            continue
+        vistos.add(huella)
+        puntaje = puntuar(texto, raices_consulta) + bono
+        candidatos.append((puntaje, orden, seccion, grupo, lineas))
+
+    # Llenar el presupuesto de mayor a menor relevancia (a igual puntaje, el orden original)
+    candidatos.sort(key=lambda c: (-c[0], c[1]))
+    restantes = presupuesto
+    encabezados = set()
+    elegidos = {seccion: [] for seccion, _ in _SECCIONES}
+    for puntaje, orden, seccion, grupo, lineas in candidatos:
+        costo = estimar_tokens("\n".join(lineas)) + 8
+        nuevos = [e for e in (seccion, grupo) if e is not None and e not in encabezados]
+        costo += sum(estimar_tokens(e) for e in nuevos)
+        if costo > restantes:
+            continue
+        restantes -= costo
+        encabezados.update(nuevos)
+        elegidos[seccion].append((grupo, lineas))
+
+    # Ensamblar en una sola pasada
+    partes = []
+    for seccion, titulo in _SECCIONES:
+        if not elegidos[seccion]:
+            continue
+        partes.append(titulo)
+        if seccion == "normativas":
+            por_grupo = {}
+            for grupo, lineas in elegidos[seccion]:
+                por_grupo.setdefault(grupo, []).append(lineas)
+            for grupo, registros in por_grupo.items():
+                partes.append(grupo)
+                for j, lineas in enumerate(registros, 1):
+                    partes.append(f"- Registro {j}:\n")
+                    partes.extend(f"  * {linea}\n" for linea in lineas)
+        else:
+            etiqueta = "Expediente" if seccion == "expedientes" else "Documento"
+            for i, (_, lineas) in enumerate(elegidos[seccion], 1):
+                partes.append(f"\n### {etiqueta} {i}:\n")
+                partes.extend(f"- {linea}\n" for linea in lineas)
+
+    incluidos = sum(len(v) for v in elegidos.values())
+    estadisticas = {"candidatos": len(candidatos), "incluidos": incluidos, "tokens": presupuesto - restantes}
+    return "".join(partes), estadisticas
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""Memoria de la conversación del chat: conjunto de trabajo e historial compactado.
+
+- ``Conversacion`` guarda, por sesión, los expedientes, documentos y normativas ya
+  recuperados (el conjunto de trabajo). Una pregunta de seguimiento ("¿y sus
+  documentos?") que no cita expedientes, áreas ni modalidades nuevas y cuyas palabras
+  clave ya aparecen en el conjunto de trabajo se responde con él, sin consultar la base.
+  Su texto para el modelo (``contexto_trabajo``) sólo cambia cuando se vuelve a
+  buscar, así que es el prefijo estable que el proveedor guarda en caché.
+- ``compactar_historial`` deja los turnos más recientes completos mientras quepan en
+  ``PRESUPUESTO_TOKENS_HISTORIAL`` y resume los anteriores en unas pocas líneas. Los
+  turnos cuya respuesta fue un error (mensajes con ``"error": True``) no se reenvían.
+
+Este módulo no importa Streamlit ni Supabase: la búsqueda y el análisis de la
+consulta se reciben como funciones (ver llamadas_ia.py).
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from normalizacion_texto import estimar_tokens, raices
+
+# Tokens máximos del historial que se reenvía al modelo (turnos completos más resumen)
+PRESUPUESTO_TOKENS_HISTORIAL = int(os.environ.get("PRESUPUESTO_TOKENS_HISTORIAL", "2000"))
+# Caracteres de cada pregunta y respuesta dentro del resumen de turnos antiguos
+LARGO_RESUMEN_PREGUNTA = 200
+LARGO_RESUMEN_RESPUESTA = 300
+
+# Tamaño máximo del conjunto de trabajo (se descartan primero los más antiguos)
+MAX_EXPEDIENTES_TRABAJO = 50
+MAX_DOCUMENTOS_TRABAJO = 200
+MAX_GRUPOS_NORMATIVA_TRABAJO = 40
+
+_COLUMNAS_SIN_TEXTO = {"id", "created_at", "updated_at", "expediente_id"}
+
+
+def _recortar(texto, largo):
+    texto = " ".join(str(texto).split())
+    return texto if len(texto) <= largo else texto[:largo].rstrip() + "..."
+
+
+def _unir_consecutivos(mensajes):
+    # La API exige alternar usuario y asistente: se unen los mensajes seguidos del mismo rol
+    unidos = []
+    for mensaje in mensajes:
+        if unidos and unidos[-1]["role"] == mensaje["role"]:
+            unidos[-1] = {"role": mensaje["role"], "content": unidos[-1]["content"] + "\n\n" + mensaje["content"]}
+        else:
+            unidos.append({"role": mensaje["role"], "content": str(mensaje["content"])})
+    return unidos
+
+
+def _sin_turnos_fallidos(mensajes):
+    # Un error no es una respuesta del asistente: se descarta junto con su pregunta
+    validos = []
+    for mensaje in mensajes:
+        if mensaje.get("error"):
+            if mensaje["role"] == "assistant" and validos and validos[-1]["role"] == "user":
+                validos.pop()
+            continue
+        validos.append(mensaje)
+    return validos
+
+
+def compactar_historial(mensajes, presupuesto=PRESUPUESTO_TOKENS_HISTORIAL):
+    """Divide el historial en ``(resumen, recientes)``.
+
+    ``recientes`` son los últimos mensajes completos que caben en el presupuesto,
+    empezando por una pregunta del usuario; los anteriores quedan en ``resumen``
+    (una línea por mensaje, recortada, y como máximo medio presupuesto). Una pregunta
+    final que quedó sin respuesta se omite.
+    """
+    mensajes = _unir_consecutivos([m for m in _sin_turnos_fallidos(mensajes) if m.get("content")])
+    if mensajes and mensajes[-1]["role"] == "user":
+        mensajes.pop()
+    inicio, usados = len(mensajes), 0
+    while inicio > 0:
+        costo = estimar_tokens(mensajes[inicio - 1]["content"]) + 4
+        if usados + costo > presupuesto:
+            break
+        usados += costo
+        inicio -= 1
+    # El historial completo debe empezar con un mensaje del usuario
+    while inicio < len(mensajes) and mensajes[inicio]["role"] != "user":
+        inicio += 1
+
+    lineas = []
+    for mensaje in mensajes[:inicio]:
+        if mensaje["role"] == "user":
+            lineas.append(f"- Usuario: {_recortar(mensaje['content'], LARGO_RESUMEN_PREGUNTA)}")
+        else:
+            lineas.append(f"  Asistente: {_recortar(mensaje['content'], LARGO_RESUMEN_RESPUESTA)}")
+    # Si el resumen no cabe, se pierden primero los turnos más antiguos (pregunta y respuesta)
+    while lineas and estimar_tokens("\n".join(lineas)) > presupuesto // 2:
+        lineas.pop(0)
+        while lineas and not lineas[0].startswith("- Usuario"):
+            lineas.pop(0)
+    resumen = "Resumen de la conversación anterior:\n" + "\n".join(lineas) if lineas else ""
+    return resumen, mensajes[inicio:]
+
+
+class Conversacion:
+    """Estado de recuperación de una sesión del chat."""
+
+    def __init__(self):
+        self.expedientes = OrderedDict()
+        self.documentos = OrderedDict()
+        self.normativas = OrderedDict()
+        # Números de expediente y valores de entidades ya buscados (aunque no existieran)
+        self.numeros = set()
+        self.entidades = {}
+        self.raices = set()
+        # Preguntas desde la última búsqueda: con ellas se puntúa el contexto
+        self.consultas_contexto = []
+        self.busquedas = 0
+        self.reutilizaciones = 0
+        # (búsqueda con la que se armó, texto) del contexto del conjunto de trabajo
+        self._contexto_trabajo = (None, "")
+        # El turno corre en el pool de turnos (turnos_chat.py): un turno abandonado puede
+        # seguir recuperando mientras empieza el siguiente de la misma sesión
+        self._lock = threading.Lock()
+
+    def vacia(self):
+        return not (self.expedientes or self.documentos or self.normativas)
+
+    def cubre(self, analisis):
+        """Si la pregunta se puede responder con el conjunto de trabajo."""
+        if self.vacia():
+            return False
+        if any(numero.upper() not in self.numeros for numero in analisis.expedientes):
+            return False
+        for campo, valores in analisis.entidades.items():
+            if not set(valores) <= self.entidades.get(campo, set()):
+                return False
+        return all(palabra in self.raices for palabra in analisis.palabras_clave)
+
+    def incorporar(self, informacion_bd, analisis):
+        """Agrega los resultados de una búsqueda al conjunto de trabajo."""
+        self.numeros.update(numero.upper() for numero in analisis.expedientes)
+        for campo, valores in analisis.entidades.items():
+            self.entidades.setdefault(campo, set()).update(valores)
+        if not informacion_bd or "error" in informacion_bd:
+            return
+
+        for exp in informacion_bd.get("expedientes") or []:
+            self.expedientes[exp["id"]] = exp
+            self.expedientes.move_to_end(exp["id"])
+        for doc in informacion_bd.get("documentos") or []:
+            self.documentos[doc["id"]] = doc
+            self.documentos.move_to_end(doc["id"])
+        for grupo in informacion_bd.get("normativas") or []:
+            clave = (grupo.get("tabla"), grupo.get("columna"), grupo.get("palabra_clave"))
+            self.normativas[clave] = grupo
+            self.normativas.move_to_end(clave)
+        for elementos, maximo in ((self.expedientes, MAX_EXPEDIENTES_TRABAJO),
+                                  (self.documentos, MAX_DOCUMENTOS_TRABAJO),
+                                  (self.normativas, MAX_GRUPOS_NORMATIVA_TRABAJO)):
+            while len(elementos) > maximo:
+                elementos.popitem(last=False)
+
+        self.numeros.update(
+            str(exp.get("numero_expediente")).upper() for exp in self.expedientes.values() if exp.get("numero_expediente")
+        )
+        self.raices = set(raices(" ".join(self._textos())))
+
+    def _textos(self):
+        for fila in list(self.expedientes.values()) + list(self.documentos.values()):
+            yield from (v for c, v in fila.items() if c not in _COLUMNAS_SIN_TEXTO and isinstance(v, str))
+        for grupo in self.normativas.values():
+            for fila in grupo.get("datos", []):
+                yield from (v for c, v in fila.items() if c not in _COLUMNAS_SIN_TEXTO and isinstance(v, str))
+
+    def como_informacion_bd(self):
+        """El conjunto de trabajo con la forma de ``buscar_informacion_para_chat``."""
+        return {
+            "expedientes": list(self.expedientes.values()),
+            "documentos": list(self.documentos.values()),
+            "normativas": list(self.normativas.values()),
+        }
+
+    def recuperar(self, consulta, buscar, analizar):
+        """Información para responder ``consulta`` y texto con el que puntuar el contexto.
+
+        ``analizar(consulta)`` devuelve un ``AnalisisConsulta`` y ``buscar(consulta)``
+        los resultados de la base; ``buscar`` sólo se llama si el conjunto de trabajo
+        no cubre la pregunta.
+        """
+        analisis = analizar(consulta)
+        with self._lock:
+            if self.cubre(analisis):
+                print("Pregunta de seguimiento: se reutiliza el conjunto de trabajo (sin consultar la base)")
+                self.reutilizaciones += 1
+                self.consultas_contexto.append(consulta)
+                return self.como_informacion_bd(), "\n".join(self.consultas_contexto)
+
+        # La búsqueda (red) corre sin el lock: sólo se toma para modificar el conjunto de trabajo
+        informacion_bd = buscar(consulta)
+        with self._lock:
+            self.busquedas += 1
+            self.incorporar(informacion_bd, analisis)
+            self.consultas_contexto = [consulta]
+            return self.como_informacion_bd(), "\n".join(self.consultas_contexto)
+
+    def contexto_trabajo(self, construir):
+        """Texto del conjunto de trabajo para el modelo, armado con ``construir(informacion_bd, consulta)``.
+
+        Se arma con la pregunta que originó la última búsqueda y se reutiliza tal cual
+        en las preguntas de seguimiento, hasta la siguiente búsqueda.
+        """
+        with self._lock:
+            if self._contexto_trabajo[0] != self.busquedas:
+                consulta = self.consultas_contexto[0] if self.consultas_contexto else ""
+                self._contexto_trabajo = (self.busquedas, construir(self.como_informacion_bd(), consulta))
+            return self._contexto_trabajo[1]
+
+    def resumen(self):
+        return {
+            "expedientes": len(self.expedientes), "documentos": len(self.documentos),
+            "normativas": len(self.normativas), "busquedas": self.busquedas,
+            "reutilizaciones": self.reutilizaciones,
+        }
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""Índice local de texto completo (SQLite FTS5) sobre documentos y normativas.
+
+Replica en un archivo SQLite el texto de ``documentos_expediente`` y de las tablas
+``normativa_*`` ya normalizado (sin acentos y reducido a raíces en español), de
+modo que el chat pueda buscar por relevancia (BM25) en milisegundos en lugar de
+lanzar un ``ilike`` por palabra contra Supabase.
+
+Para crear o refrescar el índice de forma incremental (por ``updated_at``)::
+
+    python indice_local.py
+"""
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+
+from normalizacion_texto import raices
+from sincronizacion import leer_cambios
+
+# Archivo del índice; el chat sólo lo usa si existe
+RUTA_INDICE = os.environ.get("RUTA_INDICE_LOCAL", os.path.join(os.path.dirname(os.path.abspath(__file__)), "indice_local.db"))
+
+# Filas leídas de Supabase por página al refrescar
+TAMANO_PAGINA = 1000
+
+# Columnas que no aportan texto al índice
+_COLUMNAS_NO_INDEXADAS = {"id", "created_at", "updated_at", "expediente_id"}
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS registros (
+    rowid INTEGER PRIMARY KEY,
+    tabla TEXT NOT NULL,
+    registro_id TEXT NOT NULL,
+    updated_at TEXT,
+    datos TEXT NOT NULL,
+    UNIQUE (tabla, registro_id)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS indice USING fts5(
+    texto, tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TABLE IF NOT EXISTS marcas (
+    tabla TEXT PRIMARY KEY,
+    updated_at TEXT
+);
+"""
+
+
+def _texto_indexable(fila):
+    # Concatena los valores de texto de la fila y los reduce a raíces
+    partes = [
+        valor for columna, valor in fila.items()
+        if columna not in _COLUMNAS_NO_INDEXADAS and isinstance(valor, str)
+    ]
+    return " ".join(raices(" ".join(partes)))
+
+
+def _consulta_fts(palabras):
+    # Raíces entre comillas (evita la sintaxis de FTS5) unidas por OR; BM25 ordena el resto
+    terminos = []
+    for palabra in palabras:
+        for termino in raices(palabra):
+            if termino not in terminos:
+                terminos.append(termino)
+    return " OR ".join(f'"{termino}"*' for termino in terminos)
+
+
+class IndiceLocal:
+    """Índice FTS5 en disco con búsqueda BM25 y refresco incremental por ``updated_at``."""
+
+    def __init__(self, ruta=RUTA_INDICE):
+        self.ruta = ruta
+        self._preparado = False
+        self._lock = threading.Lock()
+
+    def existe(self):
+        return os.path.exists(self.ruta)
+
+    def preparar(self):
+        """Crea las tablas si faltan; basta una vez por proceso (no en cada conexión)."""
+        with self._lock:
+            if not self._preparado:
+                conexion = sqlite3.connect(self.ruta)
+                try:
+                    conexion.executescript(_ESQUEMA)
+                finally:
+                    conexion.close()
+                self._preparado = True
+
+    def _conectar(self):
+        # Una conexión por llamada: el chat consulta el índice desde varios hilos
+        self.preparar()
+        return sqlite3.connect(self.ruta)
+
+    @contextlib.contextmanager
+    def _conexion(self):
+        # Transacción en una conexión propia, que se cierra al terminar
+        conexion = self._conectar()
+        try:
+            with conexion:
+                yield conexion
+        finally:
+            conexion.close()
+
+    def guardar_filas(self, tabla, filas):
+        """Inserta o reemplaza filas de ``tabla`` en el índice."""
+        with self._conexion() as conexion:
+            for fila in filas:
+                registro_id = str(fila["id"])
+                previo = conexion.execute(
+                    "SELECT rowid FROM registros WHERE tabla = ? AND registro_id = ?", (tabla, registro_id)
+                ).fetchone()
+                if previo:
+                    conexion.execute("DELETE FROM indice WHERE rowid = ?", previo)
+                    conexion.execute("DELETE FROM registros WHERE rowid = ?", previo)
+                cursor = conexion.execute(
+                    "INSERT INTO registros (tabla, registro_id, updated_at, datos) VALUES (?, ?, ?, ?)",
+                    (tabla, registro_id, fila.get("updated_at"), json.dumps(fila, ensure_ascii=False, default=str))
+                )
+                conexion.execute(
+                    "INSERT INTO indice (rowid, texto) VALUES (?, ?)", (cursor.lastrowid, _texto_indexable(fila))
+                )
+
+    def marca(self, tabla):
+        """Último ``updated_at`` indexado de ``tabla`` (o None si nunca se indexó)."""
+        with self._conexion() as conexion:
+            fila = conexion.execute("SELECT updated_at FROM marcas WHERE tabla = ?", (tabla,)).fetchone()
+        return fila[0] if fila else None
+
+    def _guardar_marca(self, tabla, updated_at):
+        with self._conexion() as conexion:
+            conexion.execute(
+                "INSERT INTO marcas (tabla, updated_at) VALUES (?, ?) "
+                "ON CONFLICT (tabla) DO UPDATE SET updated_at = excluded.updated_at",
+                (tabla, updated_at)
+            )
+
+    def actualizar_tabla(self, cliente, tabla):
+        """Trae de Supabase sólo las filas modificadas desde la última marca. Devuelve cuántas."""
+        total = 0
+        for filas in leer_cambios(cliente, tabla, self.marca(tabla), TAMANO_PAGINA):
+            self.guardar_filas(tabla, filas)
+            total += len(filas)
+            if filas[-1].get("updated_at"):
+                self._guardar_marca(tabla, filas[-1]["updated_at"])
+        return total
+
+    def actualizar(self, cliente, tablas):
+        """Refresca todas las ``tablas``; un error en una no impide refrescar las demás."""
+        for tabla in tablas:
+            try:
+                nuevas = self.actualizar_tabla(cliente, tabla)
+                print(f"Índice local: {nuevas} filas nuevas o modificadas en {tabla}")
+            except Exception as e:
+                print(f"Error al actualizar el índice local para {tabla}: {e}")
+
+    def filas(self, tablas=None):
+        """Recorre ``(tabla, fila)`` de todos los registros replicados en el índice."""
+        sql = "SELECT tabla, datos FROM registros"
+        parametros = []
+        if tablas:
+            sql += f" WHERE tabla IN ({', '.join('?' for _ in tablas)})"
+            parametros.extend(tablas)
+        conexion = self._conectar()
+        try:
+            for tabla, datos in conexion.execute(sql, parametros):
+                yield tabla, json.loads(datos)
+        finally:
+            conexion.close()
+
+    def buscar(self, palabras, tablas=None, limite=20):
+        """Devuelve las filas más relevantes para ``palabras`` ordenadas por BM25.
+
+        Cada fila es el registro original de Supabase con dos claves añadidas:
+        ``_tabla`` y ``_puntaje`` (menor es más relevante, como en BM25 de FTS5).
+        """
+        consulta_fts = _consulta_fts(palabras)
+        if not consulta_fts:
+            return []
+
+        sql = (
+            "SELECT registros.tabla, registros.datos, bm25(indice) AS puntaje "
+            "FROM indice JOIN registros ON registros.rowid = indice.rowid "
+            "WHERE indice MATCH ?"
+        )
+        parametros = [consulta_fts]
+        if tablas:
+            sql += f" AND registros.tabla IN ({', '.join('?' for _ in tablas)})"
+            parametros.extend(tablas)
+        sql += " ORDER BY puntaje LIMIT ?"
+        parametros.append(limite)
+
+        with self._conexion() as conexion:
+            filas = conexion.execute(sql, parametros).fetchall()
+
+        resultados = []
+        for tabla, datos, puntaje in filas:
+            registro = json.loads(datos)
+            registro["_tabla"] = tabla
+            registro["_puntaje"] = puntaje
+            resultados.append(registro)
+        return resultados
+
+
+if __name__ == "__main__":
+    from supabase_client import TABLAS_NORMATIVA, obtener_cliente_supabase
+
+    IndiceLocal().actualizar(obtener_cliente_supabase(), ["documentos_expediente"] + TABLAS_NORMATIVA)
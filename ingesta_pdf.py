@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""Ingesta de PDF: extracción de texto, fragmentación e inserción en ``documentos_expediente``.
+
+- El texto se extrae página a página (``pypdf``) y se vuelca a un archivo temporal
+  JSONL, así un expediente escaneado de cientos de páginas nunca está entero en memoria.
+- Con varios archivos, la extracción corre en un pool de procesos.
+- Cada archivo se identifica por el hash SHA-256 de su contenido y el expediente al
+  que se sube: los ya ingeridos en ese expediente se omiten y los que fallaron a mitad
+  se retoman desde la última página insertada (el progreso se guarda en un SQLite
+  local). El mismo PDF sí se ingiere en otro expediente.
+- Los fragmentos se insertan en bloque, por lotes, vinculados al expediente.
+
+Este módulo no importa Streamlit ni Supabase para que los procesos del pool
+arranquen rápido; el cliente de Supabase se recibe como parámetro.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Caracteres aproximados por fragmento (se agrupan páginas completas hasta este tamaño)
+TAMANO_FRAGMENTO = 4000
+# Fragmentos por inserción en bloque
+FILAS_POR_LOTE = 50
+MAX_PROCESOS = int(os.environ.get("INGESTA_MAX_PROCESOS", str(min(4, os.cpu_count() or 1))))
+RUTA_ESTADO_INGESTA = os.environ.get(
+    "RUTA_ESTADO_INGESTA", os.path.join(os.path.dirname(os.path.abspath(__file__)), "ingesta_estado.db")
+)
+
+
+def hash_archivo(ruta, tamano_bloque=1 << 20):
+    """SHA-256 del contenido del archivo, leído por bloques."""
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as archivo:
+        for bloque in iter(lambda: archivo.read(tamano_bloque), b""):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+def extraer_paginas(ruta, desde_pagina=1):
+    """Genera ``(numero_pagina, texto)`` página a página (numeradas desde 1)."""
+    from pypdf import PdfReader
+
+    lector = PdfReader(ruta)
+    for indice in range(desde_pagina - 1, len(lector.pages)):
+        yield indice + 1, (lector.pages[indice].extract_text() or "").strip()
+
+
+def fragmentar_paginas(paginas, tamano=TAMANO_FRAGMENTO):
+    """Agrupa páginas consecutivas en fragmentos ``(pagina_inicio, pagina_fin, texto)``."""
+    inicio, fin, partes, largo = None, None, [], 0
+    for numero, texto in paginas:
+        if partes and largo + len(texto) > tamano:
+            yield inicio, fin, "\n".join(partes)
+            inicio, partes, largo = None, [], 0
+        if inicio is None:
+            inicio = numero
+        fin = numero
+        if texto:
+            partes.append(texto)
+            largo += len(texto)
+    if partes:
+        yield inicio, fin, "\n".join(partes)
+
+
+def _extraer_a_spool(ruta, desde_pagina, ruta_spool):
+    # Se ejecuta en un proceso del pool: escribe los fragmentos en JSONL y devuelve estadísticas
+    inicio = time.monotonic()
+    paginas = 0
+    ultima = desde_pagina - 1
+
+    def _contar(paginas_pdf):
+        nonlocal paginas, ultima
+        for numero, texto in paginas_pdf:
+            paginas += 1
+            ultima = numero
+            yield numero, texto
+
+    with open(ruta_spool, "w", encoding="utf-8") as spool:
+        for pagina_inicio, pagina_fin, texto in fragmentar_paginas(_contar(extraer_paginas(ruta, desde_pagina))):
+            spool.write(json.dumps({"pagina_inicio": pagina_inicio, "pagina_fin": pagina_fin, "texto": texto},
+                                   ensure_ascii=False) + "\n")
+    return {"paginas": paginas, "ultima_pagina": ultima, "segundos": time.monotonic() - inicio}
+
+
+class EstadoIngesta:
+    """Registro local (SQLite) de los archivos ingeridos, por hash de contenido y expediente."""
+
+    def __init__(self, ruta=RUTA_ESTADO_INGESTA):
+        self.ruta = ruta
+        with self._conectar() as conexion:
+            conexion.execute(
+                "CREATE TABLE IF NOT EXISTS ingestas (hash TEXT, expediente_id TEXT, nombre TEXT, "
+                "estado TEXT, ultima_pagina INTEGER, actualizado_en REAL, PRIMARY KEY (hash, expediente_id))"
+            )
+            # Registros de la versión anterior (tabla ``archivos``, sólo por hash)
+            if conexion.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'archivos'").fetchone():
+                conexion.execute(
+                    "INSERT OR IGNORE INTO ingestas (hash, expediente_id, nombre, estado, ultima_pagina, actualizado_en) "
+                    "SELECT hash, expediente_id, nombre, estado, ultima_pagina, actualizado_en FROM archivos"
+                )
+                conexion.execute("DROP TABLE archivos")
+
+    def _conectar(self):
+        return sqlite3.connect(self.ruta, timeout=10)
+
+    def obtener(self, hash_contenido, expediente_id):
+        with self._conectar() as conexion:
+            fila = conexion.execute(
+                "SELECT estado, ultima_pagina FROM ingestas WHERE hash = ? AND expediente_id = ?",
+                (hash_contenido, str(expediente_id))
+            ).fetchone()
+        return {"estado": fila[0], "ultima_pagina": fila[1]} if fila else None
+
+    def registrar(self, hash_contenido, nombre, expediente_id, estado, ultima_pagina):
+        with self._conectar() as conexion:
+            conexion.execute(
+                "INSERT OR REPLACE INTO ingestas (hash, expediente_id, nombre, estado, ultima_pagina, actualizado_en) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (hash_contenido, str(expediente_id), nombre, estado, ultima_pagina, time.time())
+            )
+
+
+def _insertar_spool(cliente, ruta_spool, nombre, expediente_id, hash_contenido, estado, indice=None):
+    # Inserta los fragmentos por lotes y registra la última página insertada tras cada lote
+    insertados = 0
+    lote = []
+    ultima_pagina = None
+
+    def _enviar():
+        nonlocal insertados
+        response = cliente.table("documentos_expediente").insert([fila for fila, _ in lote]).execute()
+        insertados += len(lote)
+        estado.registrar(hash_contenido, nombre, expediente_id, "parcial", lote[-1][1])
+        if indice is not None and response.data:
+            indice.guardar_filas("documentos_expediente", response.data)
+        lote.clear()
+
+    with open(ruta_spool, encoding="utf-8") as spool:
+        for linea in spool:
+            fragmento = json.loads(linea)
+            paginas = (f"pág. {fragmento['pagina_inicio']}" if fragmento["pagina_inicio"] == fragmento["pagina_fin"]
+                       else f"págs. {fragmento['pagina_inicio']}-{fragmento['pagina_fin']}")
+            fila = {
+                "expediente_id": expediente_id,
+                "nombre_archivo": f"{nombre} ({paginas})",
+                "tipo_documento": "PDF",
+                "contenido": fragmento["texto"],
+            }
+            lote.append((fila, fragmento["pagina_fin"]))
+            ultima_pagina = fragmento["pagina_fin"]
+            if len(lote) >= FILAS_POR_LOTE:
+                _enviar()
+    if lote:
+        _enviar()
+    return insertados, ultima_pagina
+
+
+def ingerir_pdfs(archivos, expediente_id, cliente, indice=None, estado=None, max_procesos=MAX_PROCESOS):
+    """Ingiere una lista de PDF ``(nombre, ruta)`` en el expediente ``expediente_id``.
+
+    Devuelve un resumen por archivo con su estado (``completado``, ``duplicado`` o
+    ``error``), páginas procesadas, fragmentos insertados y páginas por segundo.
+    Si se pasa ``indice`` (ver indice_local.py), los fragmentos también se indexan.
+    """
+    estado = estado or EstadoIngesta()
+    resumen = []
+    pendientes = []
+    en_esta_carga = set()
+
+    for nombre, ruta in archivos:
+        hash_contenido = hash_archivo(ruta)
+        previo = estado.obtener(hash_contenido, expediente_id)
+        if (previo and previo["estado"] == "completado") or hash_contenido in en_esta_carga:
+            print(f"{nombre} ya fue ingerido en este expediente (mismo contenido); se omite")
+            resumen.append({"archivo": nombre, "estado": "duplicado", "paginas": 0, "fragmentos": 0})
+            continue
+        # Si una ingesta anterior quedó a medias, se retoma desde la página siguiente
+        desde_pagina = (previo["ultima_pagina"] or 0) + 1 if previo else 1
+        pendientes.append((nombre, ruta, hash_contenido, desde_pagina))
+        en_esta_carga.add(hash_contenido)
+
+    if not pendientes:
+        return resumen
+
+    directorio_spool = tempfile.mkdtemp(prefix="ingesta_")
+    procesos = max(1, min(max_procesos, len(pendientes)))
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        futuros = {}
+        for nombre, ruta, hash_contenido, desde_pagina in pendientes:
+            ruta_spool = os.path.join(directorio_spool, f"{hash_contenido}.jsonl")
+            futuro = pool.submit(_extraer_a_spool, ruta, desde_pagina, ruta_spool)
+            futuros[futuro] = (nombre, hash_contenido, desde_pagina, ruta_spool)
+
+        # Insertar cada archivo en cuanto termina su extracción
+        for futuro in as_completed(futuros):
+            nombre, hash_contenido, desde_pagina, ruta_spool = futuros[futuro]
+            try:
+                extraccion = futuro.result()
+                insertados, _ = _insertar_spool(cliente, ruta_spool, nombre, expediente_id, hash_contenido, estado, indice)
+                estado.registrar(hash_contenido, nombre, expediente_id, "completado", extraccion["ultima_pagina"])
+                paginas_por_segundo = extraccion["paginas"] / extraccion["segundos"] if extraccion["segundos"] else 0.0
+                print(f"{nombre}: {extraccion['paginas']} páginas, {insertados} fragmentos, "
+                      f"{paginas_por_segundo:.1f} páginas/s")
+                resumen.append({
+                    "archivo": nombre, "estado": "completado", "paginas": extraccion["paginas"],
+                    "fragmentos": insertados, "paginas_por_segundo": paginas_por_segundo,
+                    "retomado_desde": desde_pagina if desde_pagina > 1 else None,
+                })
+            except Exception as e:
+                print(f"Error al ingerir {nombre}: {e}")
+                resumen.append({"archivo": nombre, "estado": "error", "error": str(e), "paginas": 0, "fragmentos": 0})
+            finally:
+                if os.path.exists(ruta_spool):
+                    os.remove(ruta_spool)
+
+    os.rmdir(directorio_spool)
+    return resumen
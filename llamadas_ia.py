@@ -1,126 +1,30 @@
 # -*- coding: utf-8 -*-
-import os
-import requests
 import json
-from config import CLAUDE_API_KEY
-from supabase_client import buscar_informacion_para_chat
-
-# Verificar si la API key está definida correctamente
-if not CLAUDE_API_KEY or CLAUDE_API_KEY == "CLAVE_NO_ENCONTRADA":
-    print("⚠️ ERROR: La clave de API de Claude no está configurada correctamente.")
-else:
-    print(f"✅ Claude API Key detectada: {CLAUDE_API_KEY[:5]}********")
-
-# Función para formatear mejor los datos del expediente
-def formatear_expediente(expediente):
-    info = []
-    
-    # Campos principales
-    campos_principales = [
-        ("Número", "numero_expediente"),
-        ("Fecha de creación", "fecha_creacion"),
-        ("Tipo de proceso", "tipo_proceso"),
-        ("Modalidad", "modalidad"),
-        ("Sección", "seccion"),
-        ("Tema principal", "tema_principal"),
-        ("Área solicitante", "area_solicitante"),
-        ("Estado", "estado")
-    ]
-    
-    for label, campo in campos_principales:
-        if campo in expediente and expediente[campo]:
-            info.append(f"{label}: {expediente[campo]}")
-    
-    return info
+import os
+from cache_respuestas import cache_respuestas, clave_respuesta
+from constructor_contexto import PRESUPUESTO_TOKENS_CONTEXTO, construir_contexto
+from config import obtener_api
+from conversacion import compactar_historial
+from supabase_client import analizar_consulta_chat, buscar_informacion_para_chat
+from normalizacion_texto import estimar_tokens
+from proveedores_llm import MAX_TOKENS_RESPUESTA, ErrorProveedor, enrutador_llm, texto_contenido
+from trazas import tramo
 
-# Función para formatear mejor los datos de documentos
-def formatear_documento(documento):
-    info = []
-    
-    # Campos principales para documentos
-    if "tipo_documento" in documento and documento["tipo_documento"]:
-        info.append(f"Tipo: {documento['tipo_documento']}")
-    
-    if "nombre_archivo" in documento and documento["nombre_archivo"]:
-        info.append(f"Archivo: {documento['nombre_archivo']}")
-    
-    if "contenido" in documento and documento["contenido"]:
-        # Limitar el tamaño del contenido
-        contenido = documento["contenido"]
-        if len(contenido) > 300:
-            contenido = contenido[:300] + "..."
-        info.append(f"Extracto: {contenido}")
-    
-    # Información del expediente relacionado
-    if "expediente_numero" in documento and documento["expediente_numero"]:
-        info.append(f"Pertenece al expediente: {documento['expediente_numero']}")
-    
-    return info
-
-# Función para hacer la llamada a la API de Claude con contexto de la base de datos
-def consulta_claude(mensaje):
-    url = "https://api.anthropic.com/v1/messages"  # URL de la API
-    headers = {
-        "anthropic-version": "2023-06-01",
-        "x-api-key": CLAUDE_API_KEY,
-        "content-type": "application/json"
-    }
+# Verificar si hay algún proveedor con la API key definida (sin mostrarla)
+if not enrutador_llm.ordenar():
+    print("⚠️ ERROR: No hay ninguna clave de API de IA (Claude o Gemini) configurada correctamente.")
 
-    # Paso 1: Buscar información relevante en Supabase
-    print("Buscando información relevante en la base de datos...")
-    informacion_bd = buscar_informacion_para_chat(mensaje)
-    
-    # Paso 2: Preparar el contexto con la información encontrada
-    contexto = ""
-    
-    # Si encontramos expedientes relevantes
-    if informacion_bd and "expedientes" in informacion_bd and informacion_bd["expedientes"]:
-        contexto += "\n\n## Expedientes encontrados:\n"
-        for i, exp in enumerate(informacion_bd["expedientes"][:5], 1):  # Limitamos a 5
-            contexto += f"\n### Expediente {i}:\n"
-            for linea in formatear_expediente(exp):
-                contexto += f"- {linea}\n"
-    
-    # Si encontramos documentos relevantes
-    if informacion_bd and "documentos" in informacion_bd and informacion_bd["documentos"]:
-        contexto += "\n\n## Documentos relevantes:\n"
-        for i, doc in enumerate(informacion_bd["documentos"][:7], 1):  # Limitamos a 7
-            contexto += f"\n### Documento {i}:\n"
-            for linea in formatear_documento(doc):
-                contexto += f"- {linea}\n"
-    
-    # Si encontramos normativas relevantes
-    if informacion_bd and "normativas" in informacion_bd and informacion_bd["normativas"]:
-        contexto += "\n\n## Normativas relacionadas:\n"
-        for i, norm in enumerate(informacion_bd["normativas"][:3], 1):  # Limitamos a 3
-            tabla = norm.get("tabla", "").replace("normativa_", "").capitalize()
-            palabra = norm.get("palabra_clave", "")
-            contexto += f"\n### {tabla} relacionados con '{palabra}':\n"
-            
-            for j, item in enumerate(norm.get("datos", [])[:2], 1):  # Limitamos a 2 items por normativa
-                contexto += f"- Registro {j}:\n"
-                # Mostrar campos relevantes
-                for key, value in item.items():
-                    if key not in ["id", "created_at", "updated_at"] and value is not None:
-                        # Limitar el tamaño de los valores
-                        str_value = str(value)
-                        if len(str_value) > 100:
-                            str_value = str_value[:100] + "..."
-                        contexto += f"  * {key}: {str_value}\n"
-    
-    # Si no encontramos información, indicarlo
-    if not contexto:
-        contexto = "\nNo se encontró información específica en la base de datos sobre esta consulta."
-    
-    print(f"Contexto generado: {len(contexto)} caracteres")
-    
-    # Paso 3: Crear mensaje para Claude con el contexto
-    mensaje_con_contexto = f"""Eres un asistente jurídico especializado en gestión de expedientes. Responde de manera profesional y detallada a la siguiente consulta utilizando la información de la base de datos proporcionada.
+# Texto con el que empieza la respuesta (o lo que se agrega a una respuesta parcial) cuando
+# falla la consulta al modelo; app.py no la guarda como respuesta del asistente
+MENSAJE_ERROR = "❌ Error en la consulta"
 
-Consulta del usuario: {mensaje}
+# Tokens del contexto adicional de las preguntas de seguimiento (extractos del conjunto de
+# trabajo elegidos con la pregunta nueva)
+PRESUPUESTO_TOKENS_SEGUIMIENTO = int(os.environ.get("PRESUPUESTO_TOKENS_SEGUIMIENTO", "1500"))
 
-Información disponible en la base de datos:
-{contexto}
+# Instrucciones fijas del asistente: junto con el conjunto de trabajo de la sesión forman
+# el prefijo del prompt que el proveedor guarda en caché entre turnos (prompt caching)
+INSTRUCCIONES_SISTEMA = """Eres un asistente jurídico especializado en gestión de expedientes. Responde de manera profesional y detallada a las consultas del usuario utilizando la información de la base de datos proporcionada.
 
 Instrucciones:
 1. Responde directamente a la consulta del usuario basándote en la información proporcionada.
@@ -128,41 +32,161 @@ Instrucciones:
 3. Organiza tu respuesta de manera clara y estructurada, con introducción, desarrollo y conclusión.
 4. Cuando sea apropiado, incluye sugerencias o recomendaciones sobre los próximos pasos a seguir.
 5. Utiliza un tono profesional pero accesible, como lo haría un asesor jurídico experimentado.
+6. Ten en cuenta la conversación previa para interpretar preguntas de seguimiento.
 """
 
-    data = {
-        "model": "claude-3-7-sonnet-20250219",
-        "max_tokens": 1000,
-        "messages": [{"role": "user", "content": mensaje_con_contexto}]
+# Bloque de texto de la API de mensajes; con cache_control marca el fin de un prefijo cacheable
+def _bloque(texto, cache=False):
+    bloque = {"type": "text", "text": texto}
+    if cache:
+        bloque["cache_control"] = {"type": "ephemeral"}
+    return bloque
+
+# Texto plano de una solicitud (system y mensajes), para estimar sus tokens
+def texto_solicitud(solicitud):
+    partes = [bloque["text"] for bloque in solicitud["system"]]
+    partes.extend(texto_contenido(mensaje["content"]) for mensaje in solicitud["messages"])
+    return "\n\n".join(partes)
+
+# Función para preparar la solicitud al modelo con contexto de la base de datos.
+# Si ya se tienen los resultados de buscar_informacion_para_chat se pasan en informacion_bd.
+# Con conversacion (ver conversacion.py) las preguntas de seguimiento reutilizan lo ya
+# recuperado en la sesión, y historial son los mensajes anteriores ({"role", "content"}).
+# Devuelve {"system": [...], "messages": [...]} con el formato de la API de mensajes de
+# Anthropic (cada proveedor lo traduce al suyo). Con conversacion el system empieza por las
+# instrucciones y el conjunto de trabajo, que no cambian hasta la siguiente búsqueda, con el
+# único punto de caché del prompt; después van los extractos propios de la pregunta, el
+# resumen del historial y, en los mensajes, los turnos recientes y la pregunta.
+def preparar_solicitud(mensaje, informacion_bd=None, conversacion=None, historial=None):
+    # Paso 1: Buscar información relevante en Supabase (o en el conjunto de trabajo de la sesión)
+    consulta_contexto = mensaje
+    if informacion_bd is None:
+        print("Buscando información relevante en la base de datos...")
+        if conversacion is not None:
+            with tramo("conjunto_trabajo") as t:
+                informacion_bd, consulta_contexto = conversacion.recuperar(
+                    mensaje, buscar_informacion_para_chat, analizar_consulta_chat
+                )
+                t.registrar(**conversacion.resumen())
+        else:
+            informacion_bd = buscar_informacion_para_chat(mensaje)
+    
+    # Paso 2: Preparar el contexto con los resultados más relevantes que caben en el presupuesto
+    if conversacion is not None:
+        # Prefijo estable: el conjunto de trabajo, armado una vez por búsqueda
+        trabajo = conversacion.contexto_trabajo(_contexto_con_traza)
+        # Una pregunta de seguimiento agrega los extractos de documentos y normativas que
+        # mejor responden a ella (los expedientes ya están completos en el prefijo)
+        contexto = ""
+        if consulta_contexto != mensaje:
+            seguimiento = {**informacion_bd, "expedientes": []}
+            contexto = _contexto_con_traza(seguimiento, mensaje, PRESUPUESTO_TOKENS_SEGUIMIENTO)
+    else:
+        trabajo = None
+        contexto = _contexto_con_traza(informacion_bd, consulta_contexto)
+    
+    # Paso 3: Historial (los turnos antiguos, resumidos) y pregunta actual
+    resumen, recientes = compactar_historial(historial or [])
+    if trabajo is None:
+        system = [_bloque(INSTRUCCIONES_SISTEMA), _bloque(_texto_contexto(contexto))]
+    else:
+        system = [_bloque(INSTRUCCIONES_SISTEMA), _bloque(_texto_contexto(trabajo), cache=True)]
+        if contexto:
+            system.append(_bloque(f"Extractos relacionados con la pregunta actual:\n{contexto}"))
+    if resumen:
+        system.append(_bloque(resumen))
+    return {
+        "system": system,
+        "messages": recientes + [{"role": "user", "content": mensaje}],
     }
 
+# Contexto de informacion_bd para consulta (ver constructor_contexto.py), medido en la traza
+def _contexto_con_traza(informacion_bd, consulta, presupuesto=PRESUPUESTO_TOKENS_CONTEXTO):
+    with tramo("construir_contexto") as t:
+        contexto, estadisticas = construir_contexto(informacion_bd, consulta, presupuesto)
+        t.registrar(
+            filas=estadisticas["incluidos"], candidatos=estadisticas["candidatos"],
+            tokens=estadisticas["tokens"], bytes=len(contexto.encode("utf-8"))
+        )
+    print(
+        f"Contexto generado: {len(contexto)} caracteres, {estadisticas['incluidos']} de "
+        f"{estadisticas['candidatos']} resultados, ~{estadisticas['tokens']} tokens"
+    )
+    return contexto
+
+def _texto_contexto(contexto):
+    # Si no encontramos información, indicarlo
+    if not contexto:
+        contexto = "\nNo se encontró información específica en la base de datos sobre esta consulta."
+    return f"Información disponible en la base de datos:\n{contexto}"
+
+# Función para consultar al modelo de IA con contexto de la base de datos. proveedor es el
+# elegido en la barra lateral (Claude o Gemini; None elige por latencia observada) y con
+# cobertura=True se consulta en paralelo a otro proveedor si el primero tarda (ver
+# proveedores_llm.py). Si ya se preparó la solicitud (p. ej. para mostrar un spinner
+# durante la búsqueda) se puede pasar en solicitud para no repetir la búsqueda.
+def consulta_ia(mensaje, solicitud=None, proveedor=None, cobertura=False):
+    return "".join(consulta_ia_stream(mensaje, solicitud, proveedor, cobertura))
+
+# Turno completo del chat como generador: búsqueda (o conjunto de trabajo de la sesión),
+# contexto y respuesta en streaming. app.py lo ejecuta en el pool de turnos (turnos_chat.py).
+# Con el dict resultado se sabe si la consulta falló (ver consulta_ia_stream)
+def responder_turno(mensaje, conversacion=None, historial=None, proveedor=None, cobertura=False, resultado=None):
+    solicitud = preparar_solicitud(mensaje, conversacion=conversacion, historial=historial)
+    yield from consulta_ia_stream(mensaje, solicitud, proveedor=proveedor, cobertura=cobertura, resultado=resultado)
+
+# Clave del caché de respuestas: proveedor, modelo (el de config.py si no se indica) y solicitud
+def _clave_cache(proveedor, contenido, modelo=None):
+    if modelo is None:
+        modelo = (obtener_api(proveedor) or {}).get("modelo")
+    return clave_respuesta(f"{proveedor}/{modelo}", contenido)
+
+# Versión en streaming de consulta_ia: generador que entrega el texto a medida que llega.
+# Si la consulta falla entrega un aviso que empieza por MENSAJE_ERROR y, si se pasó el
+# dict resultado, le agrega "error" con el motivo
+def consulta_ia_stream(mensaje, solicitud=None, proveedor=None, cobertura=False, resultado=None):
+    if solicitud is None:
+        solicitud = preparar_solicitud(mensaje)
+    texto = texto_solicitud(solicitud)
+
+    # Misma pregunta con el mismo contexto e historial, y el mismo proveedor y modelo: respuesta
+    # desde el caché. Sin proveedor elegido sirve la de cualquiera de los configurados
+    contenido = json.dumps(solicitud, ensure_ascii=False, sort_keys=True)
+    candidatos = [proveedor] if proveedor else [p.nombre for p in enrutador_llm.ordenar()]
+    for nombre in candidatos:
+        en_cache = cache_respuestas.obtener(_clave_cache(nombre, contenido))
+        if en_cache is not None:
+            print(f"Respuesta de {nombre} desde el caché ({cache_respuestas.estadisticas()})")
+            yield en_cache
+            return
+
+    partes = []
+    origen = {}
     try:
-        print("Enviando consulta a Claude...")
-        response = requests.post(url, headers=headers, json=data)
-        
-        print(f"Status code: {response.status_code}")
-        if response.status_code != 200:
-            print(f"Error response: {response.text[:500]}")
-        
-        response_json = response.json()
-
-        if response.status_code == 200:
-            # Extraer el texto de la respuesta
-            if "content" in response_json:
-                # Encontrar el texto en la respuesta
-                for item in response_json.get("content", []):
-                    if item.get("type") == "text":
-                        return item.get("text", "")
-                return "⚠️ La respuesta no contiene texto."
-            else:
-                return "⚠️ La API no devolvió contenido en la respuesta."
-        else:
-            error_message = response_json.get("error", {}).get("message", "Error desconocido")
-            return f"❌ Error en la consulta: {error_message}"
-
-    except requests.exceptions.RequestException as e:
-        print(f"Error de conexión: {str(e)}")
-        return f"🚨 Error en la conexión con la API: {str(e)}"
-    except Exception as e:
-        print(f"Error inesperado: {str(e)}")
-        return f"🚨 Error inesperado: {str(e)}"
\ No newline at end of file
+        for parte in enrutador_llm.transmitir(
+            solicitud, preferido=proveedor, cobertura=cobertura,
+            tokens_estimados=estimar_tokens(texto) + MAX_TOKENS_RESPUESTA, origen=origen
+        ):
+            partes.append(parte)
+            yield parte
+    except ErrorProveedor as e:
+        print(f"Error en la consulta a {e.proveedor}: {e}")
+        if resultado is not None:
+            resultado["error"] = str(e)
+        separador = "\n\n" if partes else ""
+        yield f"{separador}{MENSAJE_ERROR}: {e}"
+        return
+
+    # Sólo las respuestas completas se guardan en el caché, con el proveedor que las generó
+    if partes and origen:
+        cache_respuestas.guardar(_clave_cache(origen["proveedor"], contenido, origen["modelo"]), "".join(partes))
+
+# Nombres anteriores a la elección de proveedor (sólo Claude), con su firma original, para el
+# código que aún los usa
+def consulta_claude(mensaje, solicitud=None):
+    return consulta_ia(mensaje, solicitud, proveedor="Claude")
+
+def consulta_claude_stream(mensaje, solicitud=None):
+    return consulta_ia_stream(mensaje, solicitud, proveedor="Claude")
+
+preparar_mensaje_claude = preparar_solicitud
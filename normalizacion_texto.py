@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""Normalización de texto en español: minúsculas, sin acentos y reducido a su raíz.
+
+Se usa tanto al indexar como al consultar, para que "contratación" y
+"contrataciones" coincidan.
+"""
+import functools
+import re
+import unicodedata
+
+# tiktoken es opcional: si está instalado se usa para estimar tokens con más precisión
+try:
+    import tiktoken
+    _codificador = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _codificador = None
+
+_PATRON_PALABRA = re.compile(r"\w+", re.UNICODE)
+# Piezas que un tokenizador BPE suele contar por separado: palabras, números y signos
+_PATRON_PIEZA = re.compile(r"[^\W\d_]+|\d+|[^\w\s]", re.UNICODE)
+
+# Sufijos flexivos y derivativos frecuentes, de más largo a más corto
+_SUFIJOS = sorted([
+    "aciones", "amientos", "imientos", "idades", "mente", "acion", "amiento", "imiento",
+    "idad", "ables", "ibles", "istas", "able", "ible", "ista", "ivos", "ivas", "osos",
+    "osas", "ores", "oras", "ivo", "iva", "oso", "osa", "dor", "dora", "es", "os", "as",
+    "s", "a", "o", "e",
+], key=len, reverse=True)
+
+# Largo mínimo de la raíz resultante
+_LARGO_MINIMO_RAIZ = 4
+
+
+# Marcas combinantes del bloque de diacríticos (tildes, diéresis, la virgulilla de la ñ):
+# se quitan con una expresión regular en lugar de recorrer el texto carácter a carácter
+_MARCAS_DIACRITICAS = re.compile(
+    "[" + "".join(chr(c) for c in range(0x300, 0x370) if unicodedata.combining(chr(c))) + "]"
+)
+
+
+def quitar_acentos(texto):
+    """Pasa a minúsculas y elimina tildes y diéresis (la ñ se conserva como n)."""
+    descompuesto = _MARCAS_DIACRITICAS.sub("", unicodedata.normalize("NFKD", texto.lower()))
+    if descompuesto.isascii():
+        return descompuesto
+    # Quedan otros caracteres: se descartan las marcas combinantes de cualquier bloque
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+# El vocabulario es acotado: todas las sesiones comparten las raíces ya calculadas
+@functools.lru_cache(maxsize=65536)
+def raiz(palabra):
+    """Reduce una palabra ya normalizada a una raíz aproximada (stemmer ligero)."""
+    for sufijo in _SUFIJOS:
+        if palabra.endswith(sufijo) and len(palabra) - len(sufijo) >= _LARGO_MINIMO_RAIZ:
+            return palabra[:-len(sufijo)]
+    return palabra
+
+
+@functools.lru_cache(maxsize=65536)
+def raiz_de_palabra(palabra):
+    """Raíz de una palabra tal como aparece en el texto (con mayúsculas y tildes)."""
+    return raiz(quitar_acentos(palabra))
+
+
+def tokenizar(texto):
+    """Divide el texto en palabras normalizadas, sin puntuación ni acentos."""
+    return _PATRON_PALABRA.findall(quitar_acentos(texto or ""))
+
+
+def raices(texto):
+    """Devuelve las raíces de todas las palabras del texto, en orden."""
+    return [raiz(palabra) for palabra in tokenizar(texto)]
+
+
+def estimar_tokens(texto):
+    """Estima los tokens de ``texto`` para un modelo tipo BPE.
+
+    Usa ``tiktoken`` si está instalado; si no, cuenta palabras, números y signos
+    y suma un token extra por cada 6 letras de las palabras largas (en español
+    las palabras largas se parten en varias piezas).
+    """
+    if not texto:
+        return 0
+    if _codificador is not None:
+        return len(_codificador.encode(texto))
+    tokens = 0
+    for pieza in _PATRON_PIEZA.findall(texto):
+        tokens += 1 + (len(pieza) - 1) // 6 if pieza.isalpha() else 1
+    return tokens
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""Planificación de consultas a Supabase.
+
+Agrupa la matriz campo x palabra clave de cada tabla en uno o pocos filtros
+``or_()`` de PostgREST, en lugar de hacer un ``ilike`` por cada combinación,
+y lleva la cuenta de las consultas (round trips) que cuesta cada turno de chat.
+"""
+import contextvars
+import math
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from normalizacion_texto import quitar_acentos
+
+# Máximo de condiciones por filtro or_() para no exceder el largo de URL de PostgREST
+MAX_CONDICIONES_POR_CONSULTA = 40
+
+# Máximo de ids por filtro in_() en las consultas de enriquecimiento
+MAX_IDS_POR_CONSULTA = 100
+
+# Hilos del pool de búsquedas, compartido por todos los turnos del proceso
+MAX_HILOS_BUSQUEDA = int(os.environ.get("MAX_HILOS_BUSQUEDA", "32"))
+
+# Caracteres con significado especial dentro de un filtro or_() de PostgREST
+_CARACTERES_RESERVADOS = set(',.:()" \\')
+
+# Letras que en la base pueden llevar tilde, diéresis o virgulilla
+_VARIANTES_ACENTO = {"a": "[aá]", "e": "[eé]", "i": "[ií]", "o": "[oó]", "u": "[uúü]", "n": "[nñ]"}
+
+
+def _valor_filtro(valor):
+    # Los valores con caracteres reservados deben ir entre comillas dobles
+    if any(caracter in _CARACTERES_RESERVADOS for caracter in valor):
+        return '"' + valor.replace("\\", "\\\\").replace('"', '\\"') + '"'
+    return valor
+
+
+def condicion_ilike(campo, patron):
+    """Devuelve una condición ``campo.ilike.patron`` apta para ``or_()``."""
+    return f"{campo}.ilike.{_valor_filtro(patron)}"
+
+
+def condicion_imatch(campo, expresion):
+    """Devuelve una condición ``campo.imatch.expresion`` (regex sin distinguir mayúsculas)."""
+    return f"{campo}.imatch.{_valor_filtro(expresion)}"
+
+
+def patron_sin_acentos(palabra):
+    """Expresión regular que encuentra ``palabra`` (ya sin acentos) con o sin tildes."""
+    return "".join(_VARIANTES_ACENTO.get(c, c) for c in quitar_acentos(palabra))
+
+
+def palabras_unicas(palabras):
+    """Elimina palabras repetidas conservando el orden original."""
+    vistas = set()
+    resultado = []
+    for palabra in palabras:
+        if palabra and palabra not in vistas:
+            vistas.add(palabra)
+            resultado.append(palabra)
+    return resultado
+
+
+def planificar_filtros_or(campos, palabras, comodin=True, max_condiciones=MAX_CONDICIONES_POR_CONSULTA):
+    """Pliega la matriz campos x palabras en la menor cantidad de filtros ``or_()``.
+
+    Cada filtro devuelto agrupa como máximo ``max_condiciones`` condiciones, de modo
+    que una tabla cuesta una consulta (o unas pocas) en lugar de una por combinación.
+    Con ``comodin`` las palabras se buscan como subcadena sin distinguir tildes
+    (``imatch``, ver ``patron_sin_acentos``); sin él, como valor exacto (``ilike``).
+    """
+    condiciones = []
+    for campo in campos:
+        for palabra in palabras_unicas(palabras):
+            if comodin:
+                condiciones.append(condicion_imatch(campo, patron_sin_acentos(palabra)))
+            else:
+                condiciones.append(condicion_ilike(campo, palabra))
+
+    return [
+        ",".join(condiciones[i:i + max_condiciones])
+        for i in range(0, len(condiciones), max_condiciones)
+    ]
+
+
+def dividir_en_lotes(valores, tamano=MAX_IDS_POR_CONSULTA):
+    """Divide los valores (sin repetidos) en lotes para filtros ``in_()``."""
+    valores = palabras_unicas(valores)
+    return [valores[i:i + tamano] for i in range(0, len(valores), tamano)]
+
+
+def agrupar_por_coincidencia(filas, columnas, palabras, limite_por_grupo=None):
+    """Reparte las filas de una consulta agrupada según la columna y palabra que coincidió.
+
+    Como el filtro ``or_()`` no indica qué condición se cumplió, se recalcula del lado
+    del cliente (sin distinguir tildes). Devuelve una lista de ``(columna, palabra, filas)``
+    en orden de aparición.
+    """
+    grupos = {}
+    normalizadas = [(p, quitar_acentos(p)) for p in palabras]
+    for fila in filas:
+        for columna in columnas:
+            valor = fila.get(columna)
+            if not isinstance(valor, str):
+                continue
+            valor = quitar_acentos(valor)
+            palabra = next((p for p, normalizada in normalizadas if normalizada in valor), None)
+            if palabra is not None:
+                grupo = grupos.setdefault((columna, palabra), [])
+                if limite_por_grupo is None or len(grupo) < limite_por_grupo:
+                    grupo.append(fila)
+                break
+
+    return [(columna, palabra, datos) for (columna, palabra), datos in grupos.items()]
+
+
+class ContadorConsultas:
+    """Cuenta las consultas (round trips) y los bytes recibidos durante un turno de chat."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.total = 0
+        self.por_tabla = {}
+        self.bytes = 0
+
+    def registrar(self, tabla):
+        with self._lock:
+            self.total += 1
+            self.por_tabla[tabla] = self.por_tabla.get(tabla, 0) + 1
+
+    def sumar_bytes(self, cantidad):
+        with self._lock:
+            self.bytes += cantidad
+
+    def resumen(self):
+        with self._lock:
+            return {"consultas": self.total, "por_tabla": dict(self.por_tabla), "bytes": self.bytes}
+
+
+# Pool de búsquedas del proceso: los hilos de las tareas abandonadas por timeout no se
+# acumulan de turno en turno, a lo sumo ocupan estos MAX_HILOS_BUSQUEDA
+_pool_busquedas = ThreadPoolExecutor(max_workers=MAX_HILOS_BUSQUEDA, thread_name_prefix="busqueda")
+
+
+def ejecutar_en_paralelo(tareas, max_concurrencia, timeout_por_tarea, plazos=None):
+    """Ejecuta tareas independientes en el pool de búsquedas con límite de concurrencia.
+
+    ``tareas`` es un diccionario ``nombre -> función sin argumentos``. A lo sumo
+    ``max_concurrencia`` tareas de la llamada ocupan hilos del pool a la vez. Cada tarea
+    dispone de ``timeout_por_tarea`` segundos (o de ``plazos[nombre]``, si se indica)
+    desde que empieza a ejecutarse; las que lo superan (o fallan) se abandonan y se
+    devuelven en la lista de incompletas, de modo que un resultado parcial siempre está
+    disponible. Una tarea abandonada sigue ocupando su hilo hasta terminar, pero el
+    pool es uno solo y acotado (``MAX_HILOS_BUSQUEDA``) para todo el proceso.
+
+    Devuelve ``(resultados, incompletas)`` con ``resultados`` como ``nombre -> valor``.
+    """
+    plazos = {nombre: (plazos or {}).get(nombre, timeout_por_tarea) for nombre in tareas}
+    inicios = {}
+
+    def _envolver(nombre, funcion):
+        # Cada tarea corre en una copia del contexto actual, para que sus tramos de
+        # traza (ver trazas.py) cuelguen del tramo que lanzó la búsqueda
+        contexto = contextvars.copy_context()
+
+        def _ejecutar():
+            inicios[nombre] = time.monotonic()
+            return contexto.run(funcion)
+        return _ejecutar
+
+    resultados = {}
+    incompletas = []
+    por_lanzar = list(tareas.items())
+    futuros = {}
+    pendientes = set()
+    # Cota global: ninguna tarea puede esperar indefinidamente detrás de otras colgadas
+    limite_global = time.monotonic() + max(plazos.values(), default=0) * math.ceil(len(tareas) / max_concurrencia)
+
+    try:
+        while pendientes or por_lanzar:
+            while por_lanzar and len(pendientes) < max_concurrencia:
+                nombre, funcion = por_lanzar.pop(0)
+                futuro = _pool_busquedas.submit(_envolver(nombre, funcion))
+                futuros[futuro] = nombre
+                pendientes.add(futuro)
+
+            ahora = time.monotonic()
+            vencimientos = [inicios[futuros[f]] + plazos[futuros[f]] for f in pendientes if futuros[f] in inicios]
+            espera = max(0.0, min(vencimientos + [limite_global]) - ahora)
+            hechos, pendientes = wait(pendientes, timeout=espera, return_when=FIRST_COMPLETED)
+
+            for futuro in hechos:
+                nombre = futuros[futuro]
+                try:
+                    resultados[nombre] = futuro.result()
+                except Exception as e:
+                    print(f"Error en la búsqueda de {nombre}: {e}")
+                    incompletas.append(nombre)
+
+            # Abandonar las tareas que agotaron su tiempo
+            ahora = time.monotonic()
+            for futuro in list(pendientes):
+                nombre = futuros[futuro]
+                vencida = nombre in inicios and ahora >= inicios[nombre] + plazos[nombre]
+                if vencida or ahora >= limite_global:
+                    print(f"Tiempo agotado en la búsqueda de {nombre}")
+                    futuro.cancel()
+                    pendientes.discard(futuro)
+                    incompletas.append(nombre)
+            if ahora >= limite_global:
+                incompletas.extend(nombre for nombre, _ in por_lanzar)
+                por_lanzar.clear()
+    finally:
+        # No esperar a los hilos colgados: sus resultados ya no se usarán (las que aún no
+        # empezaron se quitan de la cola del pool)
+        for futuro in pendientes:
+            futuro.cancel()
+
+    return resultados, incompletas
+
+
+def ejecutar_en_serie(tareas):
+    """Equivalente secuencial de :func:`ejecutar_en_paralelo` (sin límite de tiempo)."""
+    resultados = {}
+    incompletas = []
+    for nombre, funcion in tareas.items():
+        try:
+            resultados[nombre] = funcion()
+        except Exception as e:
+            print(f"Error en la búsqueda de {nombre}: {e}")
+            incompletas.append(nombre)
+    return resultados, incompletas
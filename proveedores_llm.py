@@ -0,0 +1,439 @@
+# -*- coding: utf-8 -*-
+"""Proveedores de modelos (Claude y Gemini) y enrutador con conmutación por error.
+
+Todos los proveedores reciben la misma solicitud que arma
+``llamadas_ia.preparar_solicitud`` (``{"system": [...], "messages": [...]}``, con el
+formato de la API de mensajes de Anthropic) y la traducen a su API; ``transmitir``
+entrega el texto a medida que llega y lanza ``ErrorProveedor`` si la llamada falla.
+
+``EnrutadorLLM`` elige el proveedor:
+
+- Ordena por latencia observada hasta el primer token (media móvil exponencial)
+  penalizada por la tasa de errores; el proveedor elegido en la barra lateral va
+  primero, salvo que esté en enfriamiento tras ``FALLOS_PARA_ENFRIAR`` fallos seguidos.
+- Si un proveedor falla antes de entregar texto por un error transitorio (timeout,
+  conexión, 408, 429, 529, 5xx) se pasa al siguiente sin esperar los reintentos del
+  transporte. Los demás errores HTTP (400, 401, 403...) son de la solicitud o de la
+  configuración: se informan tal cual, sin probar otro proveedor ni contar como fallo.
+- Con ``cobertura=True`` (consultas sensibles a la latencia) se lanza además el
+  siguiente proveedor si el primero no entregó texto en el tiempo esperado
+  (latencia media más dos desviaciones); gana el primero que responde y el otro se
+  cancela.
+"""
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+
+import requests
+
+from config import APIS_DISPONIBLES
+from trazas import tramo
+from transporte_llm import ESTADOS_REINTENTABLES, transporte_llm
+
+MAX_TOKENS_RESPUESTA = 1000
+# Timeout de lectura (segundos) de los intentos que tienen otro proveedor de respaldo
+TIMEOUT_LECTURA_CON_RESPALDO = float(os.environ.get("LLM_TIMEOUT_CON_RESPALDO", "20"))
+# Espera (segundos) antes de cubrir con otro proveedor cuando aún no hay latencias observadas
+ESPERA_COBERTURA = float(os.environ.get("LLM_ESPERA_COBERTURA", "2.0"))
+ESPERA_COBERTURA_MINIMA = 0.5
+# Peso de la última observación en las medias móviles
+ALFA_LATENCIA = 0.3
+ALFA_ERRORES = 0.2
+# Fallos seguidos que dejan a un proveedor al final de la lista durante ENFRIAMIENTO segundos
+FALLOS_PARA_ENFRIAR = 3
+ENFRIAMIENTO = float(os.environ.get("LLM_ENFRIAMIENTO", "60"))
+
+
+class ErrorProveedor(Exception):
+    """Falla de un proveedor; ``estado`` es el código HTTP, si lo hubo."""
+
+    def __init__(self, proveedor, mensaje, estado=None):
+        super().__init__(mensaje)
+        self.proveedor = proveedor
+        self.estado = estado
+
+    def transitorio(self):
+        """Si otro intento (u otro proveedor) podría tener éxito: sin respuesta HTTP o con un estado reintentable."""
+        return self.estado is None or self.estado in ESTADOS_REINTENTABLES
+
+
+def texto_contenido(contenido):
+    """Texto de un mensaje, tanto si ``content`` es una cadena como una lista de bloques."""
+    if isinstance(contenido, str):
+        return contenido
+    return "".join(bloque.get("text", "") for bloque in contenido)
+
+
+def _leer_eventos_sse(response):
+    # Recorre los eventos SSE de una respuesta en streaming y devuelve cada uno como diccionario
+    for linea in response.iter_lines(decode_unicode=True):
+        if not linea or not linea.startswith("data:"):
+            continue
+        try:
+            yield json.loads(linea[len("data:"):].strip())
+        except ValueError:
+            continue
+
+
+class ProveedorLLM:
+    """API de un modelo con streaming. Las subclases definen el formato de cada API."""
+
+    def __init__(self, nombre, clave, url, modelo):
+        self.nombre = nombre
+        self.clave = clave
+        self.url = url
+        self.modelo = modelo
+
+    def configurado(self):
+        return bool(self.clave) and self.clave != "CLAVE_NO_ENCONTRADA"
+
+    def url_stream(self):
+        raise NotImplementedError
+
+    def cabeceras(self):
+        raise NotImplementedError
+
+    def cuerpo(self, solicitud):
+        raise NotImplementedError
+
+    def interpretar(self, evento):
+        """Traduce un evento SSE a ``(texto, uso, fin)``; lanza ``ErrorProveedor`` si trae un error."""
+        raise NotImplementedError
+
+    def _error_http(self, response):
+        print(f"Error response ({self.nombre}): {response.text[:500]}")
+        try:
+            mensaje = response.json().get("error", {}).get("message", "Error desconocido")
+        except (ValueError, AttributeError):
+            mensaje = "Error desconocido"
+        return ErrorProveedor(self.nombre, mensaje, estado=response.status_code)
+
+    def transmitir(self, solicitud, tokens_estimados=0, max_reintentos=None, timeout=None):
+        """Generador con el texto de la respuesta. Si termina sin lanzar, la respuesta está completa."""
+        with tramo("llamada_llm", proveedor=self.nombre, modelo=self.modelo, stream=True) as t:
+            try:
+                response = transporte_llm.post(
+                    self.url_stream(), headers=self.cabeceras(), json=self.cuerpo(solicitud), stream=True,
+                    tokens_estimados=tokens_estimados, max_reintentos=max_reintentos, timeout=timeout
+                )
+            except requests.exceptions.RequestException as e:
+                raise ErrorProveedor(self.nombre, f"Error en la conexión con la API: {e}") from e
+            t.registrar(estado=response.status_code)
+
+            with response:
+                print(f"Status code ({self.nombre}): {response.status_code}")
+                if response.status_code != 200:
+                    raise self._error_http(response)
+
+                inicio = time.perf_counter()
+                largo = 0
+                completa = False
+                try:
+                    for evento in _leer_eventos_sse(response):
+                        texto, uso, fin = self.interpretar(evento)
+                        if uso:
+                            t.registrar(**uso)
+                        if texto:
+                            if not largo:
+                                t.registrar(primer_token_ms=round((time.perf_counter() - inicio) * 1000, 2))
+                            largo += len(texto.encode("utf-8"))
+                            yield texto
+                        if fin:
+                            completa = True
+                            break
+                except requests.exceptions.RequestException as e:
+                    raise ErrorProveedor(self.nombre, f"Se cortó la conexión con la API: {e}") from e
+                finally:
+                    t.registrar(bytes=largo, completa=completa)
+
+            if not completa:
+                raise ErrorProveedor(self.nombre, "La respuesta terminó antes de completarse")
+
+
+class ProveedorClaude(ProveedorLLM):
+    """API de mensajes de Anthropic: la solicitud ya viene en su formato (con cache_control)."""
+
+    def url_stream(self):
+        return self.url
+
+    def cabeceras(self):
+        return {
+            "anthropic-version": "2023-06-01",
+            "x-api-key": self.clave,
+            "content-type": "application/json"
+        }
+
+    def cuerpo(self, solicitud):
+        return {
+            "model": self.modelo,
+            "max_tokens": MAX_TOKENS_RESPUESTA,
+            "stream": True,
+            "system": solicitud["system"],
+            "messages": solicitud["messages"]
+        }
+
+    def interpretar(self, evento):
+        tipo = evento.get("type")
+        if tipo == "content_block_delta" and evento.get("delta", {}).get("type") == "text_delta":
+            return evento["delta"].get("text", ""), None, False
+        if tipo == "message_start":
+            uso = evento.get("message", {}).get("usage")
+            if not uso:
+                return "", None, False
+            return "", {
+                "tokens_entrada": uso.get("input_tokens"),
+                "tokens_cache_leidos": uso.get("cache_read_input_tokens"),
+                "tokens_cache_escritos": uso.get("cache_creation_input_tokens"),
+            }, False
+        if tipo == "error":
+            error = evento.get("error", {})
+            estado = 529 if error.get("type") == "overloaded_error" else None
+            raise ErrorProveedor(self.nombre, error.get("message", "Error desconocido"), estado=estado)
+        return "", None, tipo == "message_stop"
+
+
+class ProveedorGemini(ProveedorLLM):
+    """API generateContent de Google: el system va en systemInstruction y el asistente es "model".
+
+    Gemini no usa cache_control: los modelos recientes cachean solos los prefijos
+    repetidos, y el prefijo (instrucciones y contexto) se mantiene igual que en Claude.
+    """
+
+    def url_stream(self):
+        return f"{self.url.rstrip('/')}/models/{self.modelo}:streamGenerateContent?alt=sse"
+
+    def cabeceras(self):
+        # La clave va en una cabecera y no en la url, para que no quede en los logs
+        return {"x-goog-api-key": self.clave, "content-type": "application/json"}
+
+    def cuerpo(self, solicitud):
+        contenidos = [
+            {
+                "role": "model" if mensaje["role"] == "assistant" else "user",
+                "parts": [{"text": texto_contenido(mensaje["content"])}],
+            }
+            for mensaje in solicitud["messages"]
+        ]
+        return {
+            "systemInstruction": {"parts": [{"text": "\n\n".join(b["text"] for b in solicitud["system"])}]},
+            "contents": contenidos,
+            "generationConfig": {"maxOutputTokens": MAX_TOKENS_RESPUESTA},
+        }
+
+    def interpretar(self, evento):
+        if "error" in evento:
+            error = evento["error"]
+            raise ErrorProveedor(self.nombre, error.get("message", "Error desconocido"), estado=error.get("code"))
+        candidato = (evento.get("candidates") or [{}])[0]
+        texto = "".join(parte.get("text", "") for parte in candidato.get("content", {}).get("parts", []))
+        metadatos = evento.get("usageMetadata")
+        uso = {
+            "tokens_entrada": metadatos.get("promptTokenCount"),
+            "tokens_cache_leidos": metadatos.get("cachedContentTokenCount"),
+        } if metadatos else None
+        return texto, uso, bool(candidato.get("finishReason"))
+
+
+PROVEEDORES = {"Claude": ProveedorClaude, "Gemini": ProveedorGemini}
+
+
+class EstadisticasProveedor:
+    """Latencia hasta el primer token (media y desviación móviles, en segundos) y tasa de errores."""
+
+    def __init__(self):
+        self.latencia = None
+        self.desviacion = 0.0
+        self.tasa_error = 0.0
+        self.fallos_seguidos = 0
+        self.enfriado_hasta = 0.0
+        self.exitos = 0
+        self.fallos = 0
+
+    def exito(self, latencia):
+        self.exitos += 1
+        self.fallos_seguidos = 0
+        self.tasa_error *= 1 - ALFA_ERRORES
+        if self.latencia is None:
+            self.latencia, self.desviacion = latencia, latencia / 2
+        else:
+            self.desviacion += ALFA_LATENCIA * (abs(latencia - self.latencia) - self.desviacion)
+            self.latencia += ALFA_LATENCIA * (latencia - self.latencia)
+
+    def fallo(self):
+        self.fallos += 1
+        self.fallos_seguidos += 1
+        self.tasa_error += ALFA_ERRORES * (1 - self.tasa_error)
+        if self.fallos_seguidos >= FALLOS_PARA_ENFRIAR:
+            self.enfriado_hasta = time.monotonic() + ENFRIAMIENTO
+
+    def enfriando(self):
+        return time.monotonic() < self.enfriado_hasta
+
+    def puntaje(self):
+        # Menor es mejor: sin observaciones cuenta como la espera de cobertura por defecto
+        latencia = ESPERA_COBERTURA if self.latencia is None else self.latencia
+        return latencia * (1 + 4 * self.tasa_error)
+
+    def espera_cobertura(self):
+        if self.latencia is None:
+            return ESPERA_COBERTURA
+        return max(ESPERA_COBERTURA_MINIMA, self.latencia + 2 * self.desviacion)
+
+    def como_dict(self):
+        return {
+            "latencia_ms": round(self.latencia * 1000, 1) if self.latencia is not None else None,
+            "tasa_error": round(self.tasa_error, 3),
+            "exitos": self.exitos,
+            "fallos": self.fallos,
+            "enfriando": self.enfriando(),
+        }
+
+
+class _Intento:
+    # Un proveedor transmitiendo en su propio hilo; deja ("texto" | "fin" | "error", valor) en la cola
+    def __init__(self, proveedor, cola, **parametros):
+        self.proveedor = proveedor
+        self.cola = cola
+        self.parametros = parametros
+        self.cancelado = threading.Event()
+        self.inicio = time.perf_counter()
+
+    def ejecutar(self, solicitud):
+        generador = self.proveedor.transmitir(solicitud, **self.parametros)
+        try:
+            for texto in generador:
+                if self.cancelado.is_set():
+                    return
+                self.cola.put((self, "texto", texto))
+            self.cola.put((self, "fin", None))
+        except ErrorProveedor as e:
+            self.cola.put((self, "error", e))
+        except Exception as e:
+            self.cola.put((self, "error", ErrorProveedor(self.proveedor.nombre, f"Error inesperado: {e}")))
+        finally:
+            generador.close()
+
+
+class EnrutadorLLM:
+    """Elige proveedor por latencia y errores observados, con conmutación por error y cobertura."""
+
+    def __init__(self, proveedores):
+        self.proveedores = {p.nombre: p for p in proveedores}
+        self.estadisticas = {p.nombre: EstadisticasProveedor() for p in proveedores}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def desde_config(cls, apis=APIS_DISPONIBLES):
+        return cls([
+            PROVEEDORES[nombre](nombre, api["clave"], api["url"], api["modelo"])
+            for nombre, api in apis.items() if nombre in PROVEEDORES
+        ])
+
+    def ordenar(self, preferido=None):
+        """Proveedores configurados en el orden en que se intentarán."""
+        with self._lock:
+            def clave(proveedor):
+                estadisticas = self.estadisticas[proveedor.nombre]
+                return (estadisticas.enfriando(), proveedor.nombre != preferido, estadisticas.puntaje())
+            return sorted((p for p in self.proveedores.values() if p.configurado()), key=clave)
+
+    def _registrar_exito(self, intento):
+        with self._lock:
+            self.estadisticas[intento.proveedor.nombre].exito(time.perf_counter() - intento.inicio)
+
+    def _registrar_fallo(self, intento, error):
+        print(f"Falló {intento.proveedor.nombre} ({error.estado or 'sin respuesta'}): {error}")
+        with self._lock:
+            self.estadisticas[intento.proveedor.nombre].fallo()
+
+    def _espera_cobertura(self, intento):
+        with self._lock:
+            return self.estadisticas[intento.proveedor.nombre].espera_cobertura()
+
+    def transmitir(self, solicitud, preferido=None, cobertura=False, tokens_estimados=0, origen=None):
+        """Texto de la respuesta del primer proveedor que responda.
+
+        Un proveedor que falla antes de entregar texto con un error transitorio se
+        reemplaza por el siguiente; si falla a mitad de la respuesta, con un error no
+        transitorio (o fallan todos) se lanza ``ErrorProveedor``. Si se pasa el dict
+        ``origen``, se completa con ``proveedor`` y ``modelo`` del que respondió.
+        """
+        pendientes = self.ordenar(preferido)
+        if not pendientes:
+            raise ErrorProveedor(preferido or "enrutador", "No hay ningún proveedor de IA configurado")
+        cola = queue.Queue()
+        activos = []
+        ganador = None
+        ultimo_error = None
+
+        def lanzar():
+            proveedor = pendientes.pop(0)
+            # Con respaldo disponible no se esperan los reintentos ni el timeout largo del transporte
+            parametros = {"tokens_estimados": tokens_estimados}
+            if pendientes:
+                parametros.update(
+                    max_reintentos=0, timeout=(transporte_llm.timeout[0], TIMEOUT_LECTURA_CON_RESPALDO)
+                )
+            intento = _Intento(proveedor, cola, **parametros)
+            activos.append(intento)
+            print(f"Enviando consulta a {proveedor.nombre} (streaming)...")
+            contexto = contextvars.copy_context()
+            threading.Thread(target=contexto.run, args=(intento.ejecutar, solicitud), daemon=True).start()
+
+        lanzar()
+        try:
+            while activos:
+                espera = None
+                if cobertura and ganador is None and pendientes:
+                    espera = max(0.0, self._espera_cobertura(activos[0]) - (time.perf_counter() - activos[0].inicio))
+                try:
+                    intento, tipo, valor = cola.get(timeout=espera)
+                except queue.Empty:
+                    print(f"{activos[0].proveedor.nombre} no respondió en {espera:.1f} s: se cubre con otro proveedor")
+                    lanzar()
+                    continue
+                if ganador is not None and intento is not ganador:
+                    continue
+
+                if tipo == "error":
+                    activos.remove(intento)
+                    ultimo_error = valor
+                    # Errores de la solicitud o de la configuración (400, 401, 403...): se informan en
+                    # lugar de ocultarlos detrás de otro proveedor
+                    if not valor.transitorio():
+                        print(f"{intento.proveedor.nombre} rechazó la solicitud ({valor.estado}): {valor}")
+                        raise valor
+                    self._registrar_fallo(intento, valor)
+                    if ganador is intento:
+                        raise valor
+                    if not activos and pendientes:
+                        lanzar()
+                    continue
+
+                if ganador is None:
+                    ganador = intento
+                    self._registrar_exito(intento)
+                    if origen is not None:
+                        origen.update(proveedor=intento.proveedor.nombre, modelo=intento.proveedor.modelo)
+                    for otro in activos:
+                        if otro is not intento:
+                            otro.cancelado.set()
+                    activos[:] = [intento]
+                if tipo == "fin":
+                    return
+                yield valor
+            raise ultimo_error
+        finally:
+            for intento in activos:
+                intento.cancelado.set()
+
+    def resumen(self):
+        with self._lock:
+            return {nombre: e.como_dict() for nombre, e in self.estadisticas.items()}
+
+
+# Enrutador compartido por todo el proceso (las estadísticas se acumulan entre sesiones)
+enrutador_llm = EnrutadorLLM.desde_config()
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""Prueba de carga del chat: N sesiones simultáneas contra el pool de turnos, sin red.
+
+Cada sesión simulada es un usuario que hace ``--turnos`` preguntas seguidas (con su
+propia ``Conversacion`` e historial, como en app.py) sobre los fixtures sintéticos de
+benchmark.py, con latencia por consulta a la base y un servidor local que imita la
+API de Claude (simuladores_llm.py). Todas las sesiones comparten el repositorio, los
+cachés, el transporte HTTP y el pool de turnos (turnos_chat.py).
+
+Por cada nivel de concurrencia informa turnos por segundo, latencia p50 y p95, tiempo
+en cola y turnos rechazados por saturación::
+
+    python prueba_carga.py --sesiones 1,2,4,8,16,32
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# Backend de fixtures en un directorio temporal (se llena después de importar) y sin
+# límites de tasa del modelo, índice local ni trazas en disco
+DIRECTORIO_FIXTURES = tempfile.mkdtemp(prefix="prueba_carga_")
+os.environ["BACKEND_DATOS"] = "fixtures"
+os.environ["RUTA_FIXTURES"] = DIRECTORIO_FIXTURES
+os.environ.setdefault("LATENCIA_SIMULADA", "0.02")
+os.environ["USAR_INDICE_LOCAL"] = "0"
+os.environ["MODO_RECUPERACION"] = "palabras"
+os.environ.pop("RUTA_CACHE", None)
+os.environ["LLM_SOLICITUDES_POR_MINUTO"] = "0"
+os.environ["LLM_TOKENS_POR_MINUTO"] = "0"
+os.environ.setdefault("CLAUDE_API_KEY", "clave-prueba-carga")
+os.environ.setdefault("TRAZAS_EXPORTADOR", "ninguno")
+
+from benchmark import RUTA_CONSULTAS, generar_fixtures, percentil  # noqa: E402
+from cache_respuestas import cache_busquedas, cache_respuestas  # noqa: E402
+from conversacion import Conversacion  # noqa: E402
+from llamadas_ia import responder_turno  # noqa: E402
+from proveedores_llm import enrutador_llm  # noqa: E402
+from simuladores_llm import servidor_simulado  # noqa: E402
+from supabase_client import preparar_recursos_compartidos  # noqa: E402
+from turnos_chat import MAX_TURNOS_CONCURRENTES, MAX_TURNOS_EN_ESPERA, ChatSaturado, EjecutorTurnos  # noqa: E402
+
+TURNOS_POR_SESION = 4
+LATENCIA_LLM = 0.3
+# Pausa entre preguntas de un mismo usuario (segundos)
+PAUSA_ENTRE_TURNOS = 0.0
+
+
+def simular_sesion(indice, consultas, ejecutor, turnos, pausa, mediciones, lock):
+    """Un usuario: ``turnos`` preguntas seguidas, cada una esperando su respuesta completa."""
+    conversacion = Conversacion()
+    mensajes = []
+    for t in range(turnos):
+        consulta = consultas[(indice * 7 + t) % len(consultas)]["consulta"]
+        mensajes.append({"role": "user", "content": consulta})
+        inicio = time.perf_counter()
+        resultado = {}
+        try:
+            turno = ejecutor.enviar(
+                responder_turno, consulta, conversacion=conversacion, historial=mensajes[:-1], proveedor="Claude",
+                resultado=resultado
+            )
+        except ChatSaturado:
+            mensajes.pop()
+            with lock:
+                mediciones["rechazados"] += 1
+            continue
+        respuesta = "".join(turno.fragmentos())
+        fin = time.perf_counter()
+        mensajes.append({"role": "assistant", "content": respuesta})
+        with lock:
+            mediciones["latencias"].append((fin - inicio) * 1000)
+            mediciones["esperas"].append(turno.espera_ms or 0.0)
+            mediciones["errores"] += "error" in resultado
+        if pausa:
+            time.sleep(pausa)
+
+
+def medir_nivel(sesiones, consultas, args):
+    """Ejecuta ``sesiones`` usuarios a la vez con cachés vacíos y un pool nuevo."""
+    cache_busquedas.limpiar()
+    cache_respuestas.limpiar()
+    ejecutor = EjecutorTurnos(args.concurrencia, args.en_espera)
+    mediciones = {"latencias": [], "esperas": [], "rechazados": 0, "errores": 0}
+    lock = threading.Lock()
+    hilos = [
+        threading.Thread(
+            target=simular_sesion,
+            args=(i, consultas, ejecutor, args.turnos, args.pausa, mediciones, lock), daemon=True
+        )
+        for i in range(sesiones)
+    ]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+
+    latencias = mediciones["latencias"]
+    return {
+        "sesiones": sesiones,
+        "turnos": len(latencias),
+        "duracion_s": round(duracion, 2),
+        "turnos_por_segundo": round(len(latencias) / duracion, 2) if duracion else 0.0,
+        "latencia_p50_ms": round(percentil(latencias, 50), 1),
+        "latencia_p95_ms": round(percentil(latencias, 95), 1),
+        "espera_p95_ms": round(percentil(mediciones["esperas"], 95), 1),
+        "rechazados": mediciones["rechazados"],
+        "errores": mediciones["errores"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sesiones", default="1,2,4,8,16", help="niveles de concurrencia, separados por comas")
+    parser.add_argument("--turnos", type=int, default=TURNOS_POR_SESION, help="preguntas por sesión")
+    parser.add_argument("--pausa", type=float, default=PAUSA_ENTRE_TURNOS, help="segundos entre preguntas")
+    parser.add_argument("--concurrencia", type=int, default=MAX_TURNOS_CONCURRENTES, help="turnos a la vez en el pool")
+    parser.add_argument("--en-espera", type=int, default=MAX_TURNOS_EN_ESPERA, help="turnos que pueden esperar cupo")
+    parser.add_argument("--latencia-llm", type=float, default=LATENCIA_LLM, help="segundos por respuesta del modelo")
+    parser.add_argument("--consultas", default=RUTA_CONSULTAS, help="corpus de consultas (JSON)")
+    parser.add_argument("--salida", help="guarda los resultados en este JSON")
+    args = parser.parse_args()
+
+    with open(args.consultas, encoding="utf-8") as archivo:
+        consultas = json.load(archivo)
+    generar_fixtures(DIRECTORIO_FIXTURES)
+    with contextlib.redirect_stdout(io.StringIO()):
+        recursos = preparar_recursos_compartidos()
+    print(f"Recursos compartidos: {recursos}")
+
+    servidor, url = servidor_simulado("Claude", args.latencia_llm)
+    enrutador_llm.proveedores["Claude"].url = url
+    resultados = []
+    try:
+        print(f"{'sesiones':>8} {'turnos':>6} {'turnos/s':>9} {'p50 ms':>9} {'p95 ms':>9} "
+              f"{'cola p95':>9} {'rechazos':>8} {'eficiencia':>10}")
+        for sesiones in (int(n) for n in args.sesiones.split(",")):
+            # La salida de cada turno (búsquedas, llamadas) se descarta: sólo interesa la tabla
+            with contextlib.redirect_stdout(io.StringIO()):
+                nivel = medir_nivel(sesiones, consultas, args)
+            # Fracción del rendimiento lineal respecto del primer nivel (1.0 = escala perfecto)
+            base = resultados[0] if resultados else nivel
+            ideal = base["turnos_por_segundo"] * sesiones / base["sesiones"]
+            nivel["eficiencia"] = round(nivel["turnos_por_segundo"] / ideal, 2) if ideal else 0.0
+            resultados.append(nivel)
+            print(f"{sesiones:>8} {nivel['turnos']:>6} {nivel['turnos_por_segundo']:>9.2f} "
+                  f"{nivel['latencia_p50_ms']:>9.1f} {nivel['latencia_p95_ms']:>9.1f} "
+                  f"{nivel['espera_p95_ms']:>9.1f} {nivel['rechazados']:>8} {nivel['eficiencia']:>10.2f}")
+    finally:
+        servidor.shutdown()
+        shutil.rmtree(DIRECTORIO_FIXTURES, ignore_errors=True)
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            json.dump({"parametros": vars(args), "niveles": resultados}, archivo, ensure_ascii=False, indent=2)
+        print(f"Resultados guardados en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
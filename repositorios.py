@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+"""Repositorios de datos: expedientes, documentos y normativas detrás de una interfaz común.
+
+La búsqueda del chat (supabase_client.py) sólo conoce ``Repositorio``; de dónde salen
+los datos lo decide la implementación:
+
+- ``RepositorioPostgrest`` sobre el cliente de Supabase (remoto) o sobre un
+  ``EspejoLocal`` (SQLite sincronizado, ver sincronizacion.py).
+- ``repositorio_desde_fixtures`` carga archivos JSON/JSONL en un espejo SQLite
+  temporal y simula la latencia de red de cada consulta, para medir cantidad de
+  consultas y tiempos sin conexión y de forma reproducible::
+
+      repositorio = repositorio_desde_fixtures("fixtures/", latencia=0.05)
+      buscar_informacion_para_chat("contratos de limpieza", repositorio=repositorio)
+
+Cada método que consulta la base recibe opcionalmente un ``ContadorConsultas`` donde
+registra sus round trips y los bytes recibidos.
+"""
+import glob
+import json
+import os
+import random
+import re
+import threading
+import time
+
+import requests
+
+from cache_esquemas import CacheEsquemas
+from planificador_consultas import agrupar_por_coincidencia, dividir_en_lotes, planificar_filtros_or
+from sincronizacion import EspejoLocal
+from trazas import tramo
+
+# Campos de expedientes donde se buscan las palabras clave
+CAMPOS_EXPEDIENTE = ["numero_expediente", "tipo_proceso", "tema_principal", "area_solicitante", "seccion"]
+
+# Columnas que nunca se buscan por texto y tipos de PostgreSQL sobre los que ilike funciona
+COLUMNAS_EXCLUIDAS = ["id", "created_at", "updated_at"]
+TIPOS_TEXTO = ["text", "character varying", "character", "citext"]
+FILAS_MUESTRA_ESQUEMA = 20
+# Cadenas que en realidad son fechas o uuids (columnas donde ilike también falla)
+_PATRON_NO_TEXTO = re.compile(
+    r"^(\d{4}-\d{2}-\d{2}([T ][\d:.]+([+-]\d{2}:?\d{2}|Z)?)?"
+    r"|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12})$"
+)
+
+
+class Repositorio:
+    """Interfaz de acceso a expedientes, documentos y normativas."""
+
+    nombre = "repositorio"
+
+    # Expedientes
+    def expediente_por_numero(self, numero_expediente, contador=None):
+        """Devuelve el expediente con ese número exacto, o ``None``."""
+        raise NotImplementedError
+
+    def expedientes_por_numeros(self, numeros, contador=None):
+        """Devuelve los expedientes cuyos números están en ``numeros`` (coincidencia exacta)."""
+        raise NotImplementedError
+
+    def expedientes_por_ids(self, ids, contador=None):
+        raise NotImplementedError
+
+    def buscar_expedientes(self, mencionados, palabras_clave, contador=None):
+        """Expedientes citados por número (sin distinguir mayúsculas) o con alguna palabra
+        clave en sus campos principales, sin duplicados."""
+        raise NotImplementedError
+
+    def expedientes_por_entidades(self, entidades, limite, contador=None):
+        """Los ``limite`` expedientes más recientes cuyos campos toman alguno de los valores
+        de ``entidades`` (``campo -> valores``, coincidencia exacta en todos los campos)."""
+        raise NotImplementedError
+
+    # Documentos
+    def documentos_de_expedientes(self, ids, contador=None):
+        raise NotImplementedError
+
+    def paginas_documentos(self, ids, tamano_pagina, contador=None):
+        """Genera los documentos de los expedientes ``ids`` por páginas, ordenados por id."""
+        raise NotImplementedError
+
+    def buscar_documentos(self, palabras_clave, contador=None):
+        """Documentos con alguna palabra clave en su contenido."""
+        raise NotImplementedError
+
+    # Normativas
+    def columnas_texto(self, tabla, contador=None):
+        """Columnas de ``tabla`` sobre las que se puede buscar texto."""
+        raise NotImplementedError
+
+    def buscar_normativa(self, tabla, palabras_clave, limite_por_grupo, contador=None):
+        """Registros de ``tabla`` con las palabras clave, agrupados por (columna, palabra)."""
+        raise NotImplementedError
+
+    # Tablas completas
+    def paginas_tabla(self, tabla, tamano_pagina, contador=None):
+        """Genera todas las filas de ``tabla`` por páginas, ordenadas por id."""
+        raise NotImplementedError
+
+
+class RepositorioPostgrest(Repositorio):
+    """Repositorio sobre un cliente con la interfaz de consultas de Supabase/PostgREST.
+
+    Sirve tanto para el cliente de Supabase como para ``EspejoLocal``. Con ``url`` y
+    ``clave`` las columnas de texto se leen de la especificación OpenAPI de PostgREST;
+    sin ellas, de una muestra de filas. ``latencia`` (más hasta ``variacion``
+    segundos aleatorios, con ``semilla`` fija) se espera antes de cada consulta.
+    """
+
+    def __init__(self, cliente, nombre, url=None, clave=None, cache=None,
+                 latencia=0.0, variacion=0.0, semilla=0):
+        self.cliente = cliente
+        self.nombre = nombre
+        self.url = url
+        self.clave = clave
+        self.cache = cache if cache is not None else CacheEsquemas()
+        self.latencia = latencia
+        self.variacion = variacion
+        self._aleatorio = random.Random(semilla)
+        self._lock = threading.Lock()
+        self._openapi_fallido_en = None
+
+    def _ejecutar(self, consulta, tabla, contador):
+        # Ejecuta la consulta registrando el round trip en el contador del turno y en la traza
+        if contador is not None:
+            contador.registrar(tabla)
+        with tramo("consulta_bd", tabla=tabla, repositorio=self.nombre) as t:
+            if self.latencia or self.variacion:
+                with self._lock:
+                    espera = self.latencia + self._aleatorio.uniform(0, self.variacion)
+                time.sleep(espera)
+            response = consulta.execute()
+            # Tamaño aproximado de la respuesta (el JSON que viaja por la red)
+            tamano = len(json.dumps(response.data, default=str).encode("utf-8")) if response.data else 0
+            t.registrar(filas=len(response.data or []), bytes=tamano)
+        if contador is not None:
+            contador.sumar_bytes(tamano)
+        return response
+
+    def _tabla(self, tabla):
+        return self.cliente.table(tabla).select("*")
+
+    # Expedientes
+    def expediente_por_numero(self, numero_expediente, contador=None):
+        response = self._ejecutar(
+            self._tabla("expedientes").eq("numero_expediente", numero_expediente), "expedientes", contador
+        )
+        return response.data[0] if response.data else None
+
+    def expedientes_por_numeros(self, numeros, contador=None):
+        # Una consulta in_() por lote de números
+        expedientes = []
+        for lote in dividir_en_lotes(numeros):
+            response = self._ejecutar(self._tabla("expedientes").in_("numero_expediente", lote), "expedientes", contador)
+            expedientes.extend(response.data or [])
+        return expedientes
+
+    def expedientes_por_ids(self, ids, contador=None):
+        expedientes = []
+        for lote in dividir_en_lotes(ids):
+            try:
+                response = self._ejecutar(self._tabla("expedientes").in_("id", lote), "expedientes", contador)
+                expedientes.extend(response.data or [])
+            except Exception as e:
+                print(f"Error al obtener expedientes para documentos: {e}")
+        return expedientes
+
+    def buscar_expedientes(self, mencionados, palabras_clave, contador=None):
+        encontrados = []
+
+        # 1. Primero, buscar expedientes específicos por número: una consulta in_() exacta
+        # (indexada) y, sólo para los que no aparecen, otra sin distinguir mayúsculas
+        if mencionados:
+            print(f"Expedientes mencionados en la consulta: {mencionados}")
+            try:
+                por_numero = self.expedientes_por_numeros(mencionados, contador)
+            except Exception as e:
+                print(f"Error al buscar expedientes por número {mencionados}: {e}")
+                por_numero = []
+            if por_numero:
+                print(f"Encontrados {len(por_numero)} expedientes por número")
+                encontrados.extend(por_numero)
+            hallados = {str(exp.get("numero_expediente", "")).upper() for exp in por_numero}
+            faltantes = [numero for numero in mencionados if numero.upper() not in hallados]
+            for filtro in planificar_filtros_or(["numero_expediente"], faltantes, comodin=False):
+                try:
+                    response = self._ejecutar(self._tabla("expedientes").or_(filtro), "expedientes", contador)
+                    if response.data:
+                        print(f"Encontrados {len(response.data)} expedientes por número")
+                        encontrados.extend(response.data)
+                except Exception as e:
+                    print(f"Error al buscar expedientes por número {faltantes}: {e}")
+
+        # 2. Buscar en expedientes por palabras clave (campos x palabras plegados en or_())
+        for filtro in planificar_filtros_or(CAMPOS_EXPEDIENTE, palabras_clave):
+            try:
+                response = self._ejecutar(self._tabla("expedientes").or_(filtro), "expedientes", contador)
+                if response.data:
+                    print(f"Encontrados {len(response.data)} expedientes por palabras clave")
+                    encontrados.extend(response.data)
+            except Exception as e:
+                print(f"Error al buscar en expedientes por palabras clave: {e}")
+
+        # Eliminar duplicados de expedientes
+        expedientes_unicos = {}
+        for exp in encontrados:
+            expedientes_unicos[exp["id"]] = exp
+        return list(expedientes_unicos.values())
+
+    def expedientes_por_entidades(self, entidades, limite, contador=None):
+        if not entidades:
+            return []
+        consulta = self._tabla("expedientes")
+        for campo, valores in entidades.items():
+            consulta = consulta.in_(campo, valores)
+        try:
+            response = self._ejecutar(consulta.order("id", desc=True).limit(limite), "expedientes", contador)
+        except Exception as e:
+            print(f"Error al buscar expedientes por {entidades}: {e}")
+            return []
+        if response.data:
+            print(f"Encontrados {len(response.data)} expedientes por {entidades}")
+        return response.data or []
+
+    # Documentos
+    def documentos_de_expedientes(self, ids, contador=None):
+        # Un in_() por lote de ids
+        documentos = []
+        for lote in dividir_en_lotes(ids):
+            try:
+                response = self._ejecutar(
+                    self._tabla("documentos_expediente").in_("expediente_id", lote), "documentos_expediente", contador
+                )
+                if response.data:
+                    print(f"Encontrados {len(response.data)} documentos para {len(lote)} expedientes")
+                    documentos.extend(response.data)
+            except Exception as e:
+                print(f"Error al buscar documentos para los expedientes {lote}: {e}")
+        return documentos
+
+    def paginas_documentos(self, ids, tamano_pagina, contador=None):
+        inicio = 0
+        while True:
+            consulta = (
+                self._tabla("documentos_expediente")
+                .in_("expediente_id", ids)
+                .order("id")
+                .range(inicio, inicio + tamano_pagina - 1)
+            )
+            documentos = self._ejecutar(consulta, "documentos_expediente", contador).data or []
+            if documentos:
+                yield documentos
+            if len(documentos) < tamano_pagina:
+                return
+            inicio += tamano_pagina
+
+    def buscar_documentos(self, palabras_clave, contador=None):
+        documentos = []
+        for filtro in planificar_filtros_or(["contenido"], palabras_clave):
+            try:
+                response = self._ejecutar(
+                    self._tabla("documentos_expediente").or_(filtro), "documentos_expediente", contador
+                )
+                if response.data:
+                    print(f"Encontrados {len(response.data)} documentos por palabras clave en 'contenido'")
+                    documentos.extend(response.data)
+            except Exception as e:
+                print(f"Error al buscar en documentos por contenido: {e}")
+        return documentos
+
+    # Normativas
+    def _esquemas_desde_openapi(self, contador):
+        # PostgREST publica el tipo de cada columna en su especificación OpenAPI: una sola
+        # petición describe todas las tablas
+        if contador is not None:
+            contador.registrar("esquema")
+        response = requests.get(
+            f"{self.url}/rest/v1/",
+            headers={"apikey": self.clave, "Authorization": f"Bearer {self.clave}",
+                     "Accept": "application/openapi+json"},
+            timeout=10
+        )
+        response.raise_for_status()
+        esquemas = {}
+        for tabla, definicion in response.json().get("definitions", {}).items():
+            esquemas[tabla] = [
+                col for col, propiedades in definicion.get("properties", {}).items()
+                if col not in COLUMNAS_EXCLUIDAS and propiedades.get("format") in TIPOS_TEXTO
+            ]
+        return esquemas
+
+    def _columnas_texto_por_muestra(self, tabla, contador):
+        # Sin OpenAPI, se deducen las columnas de texto a partir de una muestra de filas
+        muestra = self._ejecutar(self._tabla(tabla).limit(FILAS_MUESTRA_ESQUEMA), tabla, contador)
+        columnas = {}
+        for fila in muestra.data or []:
+            for col, valor in fila.items():
+                if col in COLUMNAS_EXCLUIDAS or valor is None:
+                    continue
+                es_texto = isinstance(valor, str) and not _PATRON_NO_TEXTO.match(valor)
+                columnas[col] = columnas.get(col, True) and es_texto
+        return [col for col, es_texto in columnas.items() if es_texto]
+
+    def _cargar_esquemas(self, tabla, contador):
+        esquemas = {}
+        # Si el esquema OpenAPI no está disponible, no se reintenta hasta que venza el TTL
+        fallido_en = self._openapi_fallido_en
+        if self.url and (fallido_en is None or time.monotonic() - fallido_en > self.cache.ttl):
+            try:
+                esquemas = self._esquemas_desde_openapi(contador)
+                self._openapi_fallido_en = None
+            except Exception as e:
+                print(f"No se pudo leer el esquema OpenAPI, se usarán muestras de las tablas: {e}")
+                self._openapi_fallido_en = time.monotonic()
+        if tabla not in esquemas:
+            esquemas[tabla] = self._columnas_texto_por_muestra(tabla, contador)
+        return esquemas
+
+    def columnas_texto(self, tabla, contador=None):
+        return self.cache.obtener(tabla, lambda t: self._cargar_esquemas(t, contador))
+
+    def buscar_normativa(self, tabla, palabras_clave, limite_por_grupo, contador=None):
+        grupos_normativa = []
+        if not palabras_clave:
+            return grupos_normativa
+
+        # Columnas de texto de la tabla, desde el caché de esquemas (ilike falla sobre las demás)
+        columnas_texto = self.columnas_texto(tabla, contador)
+        if not columnas_texto:
+            return grupos_normativa
+
+        # Todas las columnas x palabras de la tabla en una (o pocas) consultas
+        for filtro in planificar_filtros_or(columnas_texto, palabras_clave):
+            try:
+                limite = limite_por_grupo * len(palabras_clave)
+                response = self._ejecutar(self._tabla(tabla).or_(filtro).limit(limite), tabla, contador)
+                grupos = agrupar_por_coincidencia(response.data or [], columnas_texto, palabras_clave, limite_por_grupo)
+                for columna, palabra, datos in grupos:
+                    print(f"Encontrados {len(datos)} registros en {tabla} con '{palabra}' en '{columna}'")
+                    grupos_normativa.append({
+                        "tabla": tabla,
+                        "columna": columna,
+                        "palabra_clave": palabra,
+                        "datos": datos
+                    })
+            except Exception as e:
+                print(f"Error al buscar en {tabla} por palabras clave: {e}")
+        return grupos_normativa
+
+    # Tablas completas
+    def paginas_tabla(self, tabla, tamano_pagina, contador=None):
+        inicio = 0
+        while True:
+            consulta = self._tabla(tabla).order("id").range(inicio, inicio + tamano_pagina - 1)
+            filas = self._ejecutar(consulta, tabla, contador).data or []
+            if filas:
+                yield filas
+            if len(filas) < tamano_pagina:
+                return
+            inicio += tamano_pagina
+
+
+def cargar_fixtures(directorio, espejo):
+    """Carga en ``espejo`` cada ``<tabla>.json`` (lista de filas) o ``<tabla>.jsonl``
+    de ``directorio``. Devuelve ``tabla -> filas cargadas``."""
+    totales = {}
+    for ruta in sorted(glob.glob(os.path.join(directorio, "*.json")) + glob.glob(os.path.join(directorio, "*.jsonl"))):
+        tabla, extension = os.path.splitext(os.path.basename(ruta))
+        with open(ruta, encoding="utf-8") as archivo:
+            if extension == ".jsonl":
+                filas = [json.loads(linea) for linea in archivo if linea.strip()]
+            else:
+                filas = json.load(archivo)
+        espejo.guardar_filas(tabla, filas)
+        totales[tabla] = totales.get(tabla, 0) + len(filas)
+    return totales
+
+
+def repositorio_desde_fixtures(directorio, latencia=0.0, variacion=0.0, semilla=0, ruta=":memory:"):
+    """Repositorio sobre un espejo SQLite (temporal por defecto) cargado con fixtures.
+
+    La latencia simulada se aplica a cada consulta, así el costo de un turno depende
+    de cuántos round trips hace, como contra Supabase.
+    """
+    espejo = EspejoLocal(ruta)
+    totales = cargar_fixtures(directorio, espejo)
+    print(f"Fixtures cargados desde {directorio}: {totales}")
+    return RepositorioPostgrest(espejo, "fixtures", latencia=latencia, variacion=variacion, semilla=semilla)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""Servidores locales que imitan las APIs de Claude y de Gemini, para probar sin red.
+
+Responden en streaming (SSE) con el formato de cada API, tras ``latencia`` segundos,
+o con ``estado_error`` (p. ej. 529 o 503) para probar la conmutación por error del
+enrutador (proveedores_llm.py). Se usan desde benchmark.py y también a mano::
+
+    python simuladores_llm.py --latencia-claude 3 --error-gemini 0
+
+e iniciando la app con las variables de entorno que muestra.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RESPUESTA = ("Según la información del expediente, corresponde revisar el contrato, "
+             "las penalidades aplicables y la conformidad del área usuaria.")
+
+
+class _ManejadorSimulado(BaseHTTPRequestHandler):
+    latencia = 0.05
+    estado_error = None
+    respuesta = RESPUESTA
+
+    def do_POST(self):
+        cuerpo = json.loads(self.rfile.read(int(self.headers.get("content-length", 0))) or b"{}")
+        time.sleep(self.latencia)
+        if self.estado_error:
+            self._enviar_json(self.estado_error, {"error": {"code": self.estado_error, "message": "Servidor simulado sobrecargado"}})
+            return
+        if not self._es_stream(cuerpo):
+            self._enviar_json(200, self.respuesta_completa())
+            return
+
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.end_headers()
+        for evento in self.eventos(self.respuesta.split()):
+            self.wfile.write(f"data: {json.dumps(evento)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _enviar_json(self, estado, contenido):
+        datos = json.dumps(contenido).encode("utf-8")
+        self.send_response(estado)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def log_message(self, *args):
+        pass
+
+
+class ManejadorClaude(_ManejadorSimulado):
+    # Imita POST /v1/messages de Anthropic
+    def _es_stream(self, cuerpo):
+        return bool(cuerpo.get("stream"))
+
+    def respuesta_completa(self):
+        return {"content": [{"type": "text", "text": self.respuesta}], "usage": {"input_tokens": 0}}
+
+    def eventos(self, palabras):
+        yield {"type": "message_start", "message": {"usage": {"input_tokens": 0}}}
+        for palabra in palabras:
+            yield {"type": "content_block_delta", "delta": {"type": "text_delta", "text": palabra + " "}}
+        yield {"type": "message_stop"}
+
+
+class ManejadorGemini(_ManejadorSimulado):
+    # Imita POST /v1beta/models/{modelo}:generateContent y :streamGenerateContent?alt=sse
+    def _es_stream(self, cuerpo):
+        return ":streamGenerateContent" in self.path
+
+    def respuesta_completa(self):
+        return {"candidates": [{"content": {"role": "model", "parts": [{"text": self.respuesta}]},
+                                "finishReason": "STOP"}]}
+
+    def eventos(self, palabras):
+        for palabra in palabras:
+            yield {"candidates": [{"content": {"role": "model", "parts": [{"text": palabra + " "}]}}]}
+        yield {"candidates": [{"content": {"role": "model", "parts": []}, "finishReason": "STOP"}],
+               "usageMetadata": {"promptTokenCount": 0}}
+
+
+MANEJADORES = {"Claude": (ManejadorClaude, "/v1/messages"), "Gemini": (ManejadorGemini, "/v1beta")}
+
+
+def servidor_simulado(proveedor="Claude", latencia=0.05, estado_error=None):
+    """Arranca en un hilo el servidor de ``proveedor``. Devuelve ``(servidor, url)``.
+
+    ``url`` es la que espera ``config.APIS_DISPONIBLES[proveedor]["url"]``.
+    """
+    base, ruta = MANEJADORES[proveedor]
+    manejador = type(base.__name__, (base,), {"latencia": latencia, "estado_error": estado_error})
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), manejador)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}{ruta}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    for nombre in MANEJADORES:
+        parser.add_argument(f"--latencia-{nombre.lower()}", type=float, default=0.05, help="segundos antes de responder")
+        parser.add_argument(f"--error-{nombre.lower()}", type=int, default=0, help="código HTTP de error a devolver")
+    args = parser.parse_args()
+
+    servidores = []
+    for nombre in MANEJADORES:
+        servidor, url = servidor_simulado(
+            nombre, getattr(args, f"latencia_{nombre.lower()}"), getattr(args, f"error_{nombre.lower()}") or None
+        )
+        servidores.append(servidor)
+        print(f"{nombre.upper()}_URL={url}")
+    print("Servidores simulados en marcha (Ctrl+C para terminar)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        for servidor in servidores:
+            servidor.shutdown()
@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+"""Espejo local (SQLite) de las tablas de Supabase y su sincronización incremental.
+
+``EspejoLocal`` guarda cada fila como JSON en un único archivo SQLite y ofrece el
+mismo estilo de consultas que el cliente de Supabase
+(``espejo.table("expedientes").select("*").eq(...).execute().data``), de modo que
+el mismo ``RepositorioPostgrest`` (ver repositorios.py) sirve para ambos.
+
+La sincronización lee de Supabase por páginas sólo las filas con ``updated_at``
+igual o posterior a la última marca guardada por tabla::
+
+    python sincronizacion.py
+"""
+import functools
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import weakref
+
+RUTA_ESPEJO = os.environ.get(
+    "RUTA_ESPEJO_LOCAL", os.path.join(os.path.dirname(os.path.abspath(__file__)), "espejo_local.db")
+)
+# Filas leídas de Supabase por página al sincronizar
+TAMANO_PAGINA = 1000
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS filas (
+    tabla TEXT NOT NULL,
+    id TEXT NOT NULL,
+    updated_at TEXT,
+    datos TEXT NOT NULL,
+    PRIMARY KEY (tabla, id)
+);
+CREATE INDEX IF NOT EXISTS filas_numero_expediente
+    ON filas (tabla, json_extract(datos, '$.numero_expediente'));
+CREATE INDEX IF NOT EXISTS filas_expediente_id
+    ON filas (tabla, json_extract(datos, '$.expediente_id'));
+CREATE INDEX IF NOT EXISTS filas_area_solicitante
+    ON filas (tabla, json_extract(datos, '$.area_solicitante'));
+CREATE INDEX IF NOT EXISTS filas_tipo_proceso
+    ON filas (tabla, json_extract(datos, '$.tipo_proceso'));
+CREATE TABLE IF NOT EXISTS marcas (
+    tabla TEXT PRIMARY KEY,
+    updated_at TEXT
+);
+"""
+
+_PATRON_COLUMNA = re.compile(r"^\w+$")
+
+
+def _columna(nombre):
+    # Los nombres de columna se insertan en el SQL: sólo se aceptan identificadores simples
+    if not _PATRON_COLUMNA.match(nombre):
+        raise ValueError(f"Nombre de columna no válido: {nombre}")
+    return f"json_extract(datos, '$.{nombre}')"
+
+
+@functools.lru_cache(maxsize=1024)
+def _patron_ilike(patron):
+    # SQLite llama a ilike una vez por fila: el patrón se compila una sola vez. Los
+    # comodines de los extremos se quitan y se usa search(), porque fullmatch de
+    # ".*palabra.*" retrocede en orden cuadrático sobre textos largos
+    nucleo = patron.strip("*%")
+    expresion = "".join(
+        ".*?" if c in "*%" else "." if c == "_" else re.escape(c) for c in nucleo
+    )
+    inicio = "" if patron[:1] in ("*", "%") else r"\A"
+    fin = "" if patron[-1:] in ("*", "%") else r"\Z"
+    return re.compile(inicio + expresion + fin, re.IGNORECASE | re.DOTALL)
+
+
+def _ilike(valor, patron):
+    # Equivalente de ilike de PostgreSQL: * y % como comodines, sin distinguir mayúsculas
+    if valor is None or patron is None:
+        return 0
+    return 1 if _patron_ilike(str(patron)).search(str(valor)) else 0
+
+
+@functools.lru_cache(maxsize=1024)
+def _patron_imatch(expresion):
+    return re.compile(expresion, re.IGNORECASE)
+
+
+def _imatch(valor, expresion):
+    # Equivalente de ~* de PostgreSQL (operador imatch de PostgREST)
+    if valor is None or expresion is None:
+        return 0
+    return 1 if _patron_imatch(str(expresion)).search(str(valor)) else 0
+
+
+def _dividir_condiciones(filtro):
+    # Divide un filtro or_() de PostgREST por comas, respetando los valores entre comillas
+    condiciones, actual, en_comillas, escapado = [], [], False, False
+    for caracter in filtro:
+        if escapado:
+            actual.append(caracter)
+            escapado = False
+        elif caracter == "\\" and en_comillas:
+            escapado = True
+        elif caracter == '"':
+            en_comillas = not en_comillas
+        elif caracter == "," and not en_comillas:
+            condiciones.append("".join(actual))
+            actual = []
+        else:
+            actual.append(caracter)
+    if actual:
+        condiciones.append("".join(actual))
+    return condiciones
+
+
+class RespuestaLocal:
+    """Imita la respuesta del cliente de Supabase (sólo el atributo ``data``)."""
+
+    def __init__(self, data):
+        self.data = data
+
+
+class ConsultaLocal:
+    """Constructor de consultas compatible con el subconjunto de PostgREST que usa la app."""
+
+    def __init__(self, espejo, tabla):
+        self.espejo = espejo
+        self.tabla = tabla
+        self._condiciones = []
+        self._parametros = []
+        self._orden = []
+        self._limite = None
+        self._desde = 0
+        self._columnas = None
+        self._insertar = None
+
+    def select(self, columnas="*"):
+        if columnas != "*":
+            self._columnas = [c.strip() for c in columnas.split(",")]
+        return self
+
+    def eq(self, columna, valor):
+        self._condiciones.append(f"{_columna(columna)} = ?")
+        self._parametros.append(valor)
+        return self
+
+    def gt(self, columna, valor):
+        self._condiciones.append(f"{_columna(columna)} > ?")
+        self._parametros.append(valor)
+        return self
+
+    def gte(self, columna, valor):
+        self._condiciones.append(f"{_columna(columna)} >= ?")
+        self._parametros.append(valor)
+        return self
+
+    def in_(self, columna, valores):
+        valores = list(valores)
+        if not valores:
+            self._condiciones.append("0")
+            return self
+        self._condiciones.append(f"{_columna(columna)} IN ({', '.join('?' for _ in valores)})")
+        self._parametros.extend(valores)
+        return self
+
+    def ilike(self, columna, patron):
+        self._condiciones.append(f"ilike({_columna(columna)}, ?)")
+        self._parametros.append(patron)
+        return self
+
+    def or_(self, filtro):
+        partes = []
+        for condicion in _dividir_condiciones(filtro):
+            columna, operador, valor = condicion.split(".", 2)
+            if operador in ("ilike", "imatch"):
+                partes.append(f"{operador}({_columna(columna)}, ?)")
+            elif operador == "eq":
+                partes.append(f"{_columna(columna)} = ?")
+            else:
+                raise ValueError(f"Operador no soportado en el espejo local: {operador}")
+            self._parametros.append(valor)
+        self._condiciones.append("(" + " OR ".join(partes) + ")")
+        return self
+
+    def order(self, columna, desc=False):
+        # Como en PostgREST, cada llamada agrega un criterio después de los anteriores
+        self._orden.append(f"{_columna(columna)} {'DESC' if desc else 'ASC'}")
+        return self
+
+    def limit(self, cantidad):
+        self._limite = cantidad
+        return self
+
+    def range(self, desde, hasta):
+        self._desde = desde
+        self._limite = hasta - desde + 1
+        return self
+
+    def insert(self, filas):
+        self._insertar = filas if isinstance(filas, list) else [filas]
+        return self
+
+    def execute(self):
+        if self._insertar is not None:
+            return RespuestaLocal(self.espejo.guardar_filas(self.tabla, self._insertar))
+
+        sql = "SELECT datos FROM filas WHERE tabla = ?"
+        parametros = [self.tabla]
+        for condicion in self._condiciones:
+            sql += f" AND {condicion}"
+        parametros.extend(self._parametros)
+        if self._orden:
+            sql += f" ORDER BY {', '.join(self._orden)}"
+        if self._limite is not None or self._desde:
+            sql += " LIMIT ? OFFSET ?"
+            parametros.extend([self._limite if self._limite is not None else -1, self._desde])
+
+        filas = [json.loads(datos) for (datos,) in self.espejo.consultar(sql, parametros)]
+        if self._columnas:
+            filas = [{c: fila.get(c) for c in self._columnas} for fila in filas]
+        return RespuestaLocal(filas)
+
+
+def _cerrar_espejo(conexiones, ruta_temporal):
+    # Cierra las conexiones de todos los hilos antes de borrar el archivo temporal: si se
+    # borrara con conexiones abiertas, éstas seguirían usando un archivo ya desvinculado
+    for conexion in conexiones:
+        conexion.close()
+    conexiones.clear()
+    if ruta_temporal and os.path.exists(ruta_temporal):
+        os.remove(ruta_temporal)
+
+
+class EspejoLocal:
+    """Copia local de las tablas en SQLite, consultable como el cliente de Supabase.
+
+    Con ``ruta=":memory:"`` se usa un archivo temporal que se borra al descartar el
+    espejo (se usa para cargar fixtures, ver repositorios.py): una base ":memory:" de
+    SQLite no puede compartirse entre las conexiones de varios hilos sin el modo de
+    caché compartido, que las serializa todas.
+    """
+
+    def __init__(self, ruta=RUTA_ESPEJO):
+        ruta_temporal = None
+        if ruta == ":memory:":
+            descriptor, ruta_temporal = tempfile.mkstemp(prefix="espejo_", suffix=".db")
+            os.close(descriptor)
+            ruta = ruta_temporal
+        self.ruta = ruta
+        self._local = threading.local()
+        self._esquema_creado = False
+        self._lock_esquema = threading.Lock()
+        # Conexiones abiertas por los distintos hilos, para cerrarlas todas al descartar el espejo
+        self._conexiones = []
+        self._finalizador = weakref.finalize(self, _cerrar_espejo, self._conexiones, ruta_temporal)
+
+    def cerrar(self):
+        """Cierra las conexiones de todos los hilos (y borra el archivo temporal, si lo hay)."""
+        self._finalizador()
+
+    def existe(self):
+        return os.path.exists(self.ruta)
+
+    def _conexion(self):
+        # Una conexión por hilo: la búsqueda del chat consulta desde varios hilos a la vez
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            # Cada conexión la usa sólo su hilo, pero se cierra desde el que descarta el espejo
+            conexion = sqlite3.connect(self.ruta, timeout=10, check_same_thread=False)
+            conexion.create_function("ilike", 2, _ilike, deterministic=True)
+            conexion.create_function("imatch", 2, _imatch, deterministic=True)
+            # El esquema se crea una sola vez: el DDL pide un bloqueo de escritura que
+            # esperaría a las lecturas en curso de los demás hilos
+            with self._lock_esquema:
+                if not self._esquema_creado:
+                    conexion.executescript(_ESQUEMA)
+                    self._esquema_creado = True
+                self._conexiones.append(conexion)
+            self._local.conexion = conexion
+        return conexion
+
+    def table(self, tabla):
+        return ConsultaLocal(self, tabla)
+
+    def consultar(self, sql, parametros):
+        return self._conexion().execute(sql, parametros).fetchall()
+
+    def guardar_filas(self, tabla, filas):
+        """Inserta o reemplaza filas (por ``id``). Devuelve las filas guardadas."""
+        conexion = self._conexion()
+        with conexion:
+            conexion.executemany(
+                "INSERT OR REPLACE INTO filas (tabla, id, updated_at, datos) VALUES (?, ?, ?, ?)",
+                [
+                    (tabla, str(fila["id"]), fila.get("updated_at"), json.dumps(fila, ensure_ascii=False, default=str))
+                    for fila in filas
+                ]
+            )
+        return filas
+
+    def marca(self, tabla):
+        fila = self._conexion().execute("SELECT updated_at FROM marcas WHERE tabla = ?", (tabla,)).fetchone()
+        return fila[0] if fila else None
+
+    def guardar_marca(self, tabla, updated_at):
+        conexion = self._conexion()
+        with conexion:
+            conexion.execute(
+                "INSERT INTO marcas (tabla, updated_at) VALUES (?, ?) "
+                "ON CONFLICT (tabla) DO UPDATE SET updated_at = excluded.updated_at",
+                (tabla, updated_at)
+            )
+
+
+def leer_cambios(cliente, tabla, marca=None, tamano_pagina=TAMANO_PAGINA):
+    """Genera páginas de filas de ``tabla`` con ``updated_at >= marca`` (todas si no hay marca).
+
+    Se usa ``>=`` para no perder filas con el mismo ``updated_at`` que la marca; releerlas
+    es inocuo porque se reemplazan. A igual ``updated_at`` las filas se ordenan por ``id``:
+    sin ese desempate el orden entre páginas no es estable y el paginado por rango puede
+    repetir unas filas y saltarse otras. Si la tabla no tiene ``updated_at`` se lee
+    completa, ordenada por ``id``. Las filas borradas en Supabase no se detectan.
+    """
+    columna_orden = "updated_at"
+    inicio = 0
+    while True:
+        consulta = cliente.table(tabla).select("*").order(columna_orden)
+        if columna_orden != "id":
+            consulta = consulta.order("id")
+        if marca and columna_orden == "updated_at":
+            consulta = consulta.gte("updated_at", marca)
+        try:
+            filas = consulta.range(inicio, inicio + tamano_pagina - 1).execute().data or []
+        except Exception as e:
+            if columna_orden == "id" or inicio:
+                raise
+            print(f"{tabla} no admite lectura incremental por updated_at ({e}); se lee completa")
+            columna_orden = "id"
+            continue
+        if not filas:
+            return
+        yield filas
+        if len(filas) < tamano_pagina:
+            return
+        inicio += tamano_pagina
+
+
+def sincronizar(cliente, espejo, tablas, indice=None):
+    """Trae de Supabase los cambios de cada tabla al espejo (y, si se indica, al índice FTS).
+
+    Un error en una tabla no impide sincronizar las demás. Devuelve ``tabla -> filas``.
+    """
+    totales = {}
+    for tabla in tablas:
+        try:
+            total = 0
+            for filas in leer_cambios(cliente, tabla, espejo.marca(tabla)):
+                espejo.guardar_filas(tabla, filas)
+                if indice is not None and tabla != "expedientes":
+                    indice.guardar_filas(tabla, filas)
+                total += len(filas)
+                if filas[-1].get("updated_at"):
+                    espejo.guardar_marca(tabla, filas[-1]["updated_at"])
+                    # El índice recibió las mismas filas: su marca avanza con la del espejo, así
+                    # su propio refresco (IndiceLocal.actualizar) no vuelve a traerlas
+                    if indice is not None and tabla != "expedientes":
+                        indice._guardar_marca(tabla, filas[-1]["updated_at"])
+            totales[tabla] = total
+            print(f"Espejo local: {total} filas nuevas o modificadas en {tabla}")
+        except Exception as e:
+            print(f"Error al sincronizar {tabla}: {e}")
+    return totales
+
+
+if __name__ == "__main__":
+    from indice_local import IndiceLocal
+    from supabase_client import TABLAS_NORMATIVA, obtener_cliente_supabase
+
+    sincronizar(
+        obtener_cliente_supabase(), EspejoLocal(), ["expedientes", "documentos_expediente"] + TABLAS_NORMATIVA, indice=IndiceLocal()
+    )
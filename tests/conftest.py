@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""Fixtures comunes: el backend de fixtures sintéticos de benchmark.py, sin red."""
+import os
+import sys
+
+# Igual que benchmark.py: sin índice local, caché persistente, límites de tasa ni trazas en disco
+os.environ["USAR_INDICE_LOCAL"] = "0"
+os.environ["MODO_RECUPERACION"] = "palabras"
+os.environ.pop("RUTA_CACHE", None)
+os.environ["LLM_SOLICITUDES_POR_MINUTO"] = "0"
+os.environ["LLM_TOKENS_POR_MINUTO"] = "0"
+os.environ.setdefault("CLAUDE_API_KEY", "clave-pruebas")
+os.environ["TRAZAS_EXPORTADOR"] = "ninguno"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+from benchmark import generar_fixtures  # noqa: E402
+from repositorios import repositorio_desde_fixtures  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def directorio_fixtures(tmp_path_factory):
+    directorio = tmp_path_factory.mktemp("fixtures")
+    generar_fixtures(str(directorio), expedientes=40, registros_normativa=10)
+    return str(directorio)
+
+
+@pytest.fixture(scope="session")
+def repositorio(directorio_fixtures):
+    """Repositorio sobre un espejo SQLite temporal con los fixtures, sin latencia."""
+    return repositorio_desde_fixtures(directorio_fixtures)
+
+
+@pytest.fixture(scope="session")
+def espejo(repositorio):
+    return repositorio.cliente
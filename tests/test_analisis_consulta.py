@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+from analisis_consulta import Vocabulario, analizar_consulta, obtener_vocabulario
+from normalizacion_texto import raiz
+
+
+class RepositorioLento:
+    """Repositorio de prueba cuyo recorrido de tablas espera a que se lo permitan."""
+
+    def __init__(self):
+        self.continuar = threading.Event()
+
+    def paginas_tabla(self, tabla, tamano_pagina, contador=None):
+        self.continuar.wait(5)
+        yield [{"id": 1, "tema_principal": "penalidades por mora"}, {"id": 2, "tema_principal": "obra vial"}]
+
+
+def test_palabras_vacias_y_raices():
+    analisis = analizar_consulta("¿Cuáles son las penalidades por mora del expediente 2024-LPN-OBR-0001?")
+    assert analisis.expedientes == ["2024-LPN-OBR-0001"]
+    assert analisis.palabras_clave == [raiz("penalidades"), raiz("mora")]
+
+
+def test_sin_vocabulario_guardado_no_espera_al_recorrido(tmp_path):
+    ruta = str(tmp_path / "vocabulario.json")
+    repositorio = RepositorioLento()
+
+    # El primer turno no espera: usa un vocabulario vacío mientras se calcula en segundo plano
+    assert obtener_vocabulario(repositorio, ["expedientes"], ruta=ruta).documentos == 0
+    repositorio.continuar.set()
+    for _ in range(100):
+        if (tmp_path / "vocabulario.json").exists():
+            break
+        time.sleep(0.05)
+    assert Vocabulario.cargar(ruta).documentos == 2
+    assert obtener_vocabulario(repositorio, ["expedientes"], ruta=ruta).documentos == 2
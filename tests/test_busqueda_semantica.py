@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from busqueda_semantica import IndiceSemantico
+
+np = pytest.importorskip("numpy")
+
+
+class _ModeloFijo:
+    def get_sentence_embedding_dimension(self):
+        return 4
+
+
+class IndiceSinModelo(IndiceSemantico):
+    """Vectores fijos en lugar de sentence-transformers: sólo importa qué archivos quedan."""
+
+    def _obtener_modelo(self):
+        return _ModeloFijo()
+
+    def _vectorizar(self, textos):
+        return np.full((len(textos), 4), 0.5, dtype="float32")
+
+
+def _textos(resultados):
+    return [metadatos["fragmento"] for _, metadatos in resultados]
+
+
+def test_otro_proceso_ve_la_reconstruccion(tmp_path):
+    ruta = str(tmp_path / "vectores")
+    constructor, lector = IndiceSinModelo(ruta), IndiceSinModelo(ruta)
+    constructor.construir([("normas", {"id": 1, "texto": "penalidades por mora"})])
+    assert _textos(lector.buscar("mora")) == ["penalidades por mora"]
+
+    constructor.construir([("normas", {"id": 2, "texto": "garantía de fiel cumplimiento"})])
+    assert _textos(lector.buscar("mora")) == ["garantía de fiel cumplimiento"]
+    assert len([nombre for nombre in os.listdir(tmp_path) if nombre.endswith(".npy")]) == 1
+
+
+def test_reconstruir_sin_texto_no_deja_vectores_viejos(tmp_path):
+    ruta = str(tmp_path / "vectores")
+    indice = IndiceSinModelo(ruta)
+    indice.construir([("normas", {"id": 1, "texto": "penalidades por mora"})])
+    assert indice.construir([("normas", {"id": 1, "texto": ""})]) == 0
+    assert indice.buscar("mora") == []
+    assert os.listdir(tmp_path) == ["vectores.db"]
+
+
+def test_construccion_fallida_conserva_el_indice_publicado(tmp_path):
+    class IndiceRoto(IndiceSinModelo):
+        def _vectorizar(self, textos):
+            raise RuntimeError("sin modelo")
+
+    ruta = str(tmp_path / "vectores")
+    IndiceSinModelo(ruta).construir([("normas", {"id": 1, "texto": "penalidades por mora"})])
+    with pytest.raises(RuntimeError):
+        IndiceRoto(ruta).construir([("normas", {"id": 2, "texto": "garantía"})])
+    assert _textos(IndiceSinModelo(ruta).buscar("mora")) == ["penalidades por mora"]
+    assert len(os.listdir(tmp_path)) == 2
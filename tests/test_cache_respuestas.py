@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import time
+
+from cache_respuestas import CacheLRU, normalizar_consulta
+
+
+def test_normalizar_consulta():
+    assert normalizar_consulta("¿Penalidades  del CONTRATO?") == normalizar_consulta("penalidades del contrato")
+
+
+def test_expulsa_la_entrada_menos_usada():
+    cache = CacheLRU("prueba", max_entradas=2, ttl=60)
+    cache.guardar("a", 1)
+    cache.guardar("b", 2)
+    assert cache.obtener("a") == 1
+    cache.guardar("c", 3)
+
+    assert cache.obtener("b") is None
+    assert (cache.obtener("a"), cache.obtener("c")) == (1, 3)
+    assert cache.estadisticas() == {"aciertos": 3, "fallos": 1, "entradas": 2}
+
+
+def test_vence_por_ttl():
+    cache = CacheLRU("prueba", max_entradas=10, ttl=0.05)
+    cache.guardar("a", 1)
+    time.sleep(0.1)
+    assert cache.obtener("a") is None
+    assert cache.estadisticas()["entradas"] == 0
+
+
+def test_persistencia_en_sqlite(tmp_path):
+    ruta = str(tmp_path / "cache.db")
+    cache = CacheLRU("respuestas", max_entradas=2, ttl=60, ruta=ruta)
+    for clave, valor in (("a", {"texto": "uno"}), ("b", {"texto": "dos"}), ("c", {"texto": "tres"})):
+        cache.guardar(clave, valor)
+
+    # Otro proceso (otra instancia) ve lo guardado, sin la entrada expulsada
+    reiniciado = CacheLRU("respuestas", max_entradas=2, ttl=60, ruta=ruta)
+    assert reiniciado.obtener("c") == {"texto": "tres"}
+    assert reiniciado.obtener("a") is None
+    # Cada caché tiene su propio espacio de claves dentro del archivo
+    assert CacheLRU("busquedas", max_entradas=2, ttl=60, ruta=ruta).obtener("c") is None
+
+    reiniciado.limpiar()
+    assert CacheLRU("respuestas", max_entradas=2, ttl=60, ruta=ruta).obtener("c") is None
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from constructor_contexto import construir_contexto, extraer_fragmento
+from normalizacion_texto import raices
+
+
+def test_texto_corto_completo():
+    assert extraer_fragmento("Contrato de obra.", set(raices("contrato")), largo=100) == "Contrato de obra."
+
+
+def test_sin_coincidencias_devuelve_el_inicio():
+    texto = "a" * 50 + " " + "b" * 50
+    assert extraer_fragmento(texto, set(raices("penalidad")), largo=20) == texto[:20] + "..."
+
+
+def test_ventana_con_mas_coincidencias():
+    relleno = "Se revisó el expediente sin observaciones relevantes. " * 20
+    foco = "Se aplicaron penalidades por mora; las penalidades se descuentan del pago. "
+    texto = relleno + "Hubo una penalidad. " + relleno + foco + relleno
+    fragmento = extraer_fragmento(texto, set(raices("penalidades mora")), largo=120)
+
+    assert fragmento.startswith("...") and fragmento.endswith("...")
+    assert "penalidades por mora" in fragmento
+    assert len(fragmento) == 120 + 6
+
+
+def test_coincide_sin_tildes_ni_mayusculas():
+    texto = "x " * 100 + "CONTRATACIÓN directa" + " y" * 100
+    assert "CONTRATACIÓN" in extraer_fragmento(texto, set(raices("contratacion")), largo=40)
+
+
+def test_palabras_vacias_no_cuentan_como_relevancia():
+    vacio = {"tipo_documento": "Acta", "contenido": "De la reunión que se hizo por la tarde en el local de la sede. " * 3}
+    relevante = {
+        "tipo_documento": "Informe",
+        "contenido": "Antecedentes del proceso. " * 20 + "Se aplicaron penalidades por mora al contratista.",
+    }
+    contexto, _ = construir_contexto(
+        {"documentos": [vacio, relevante]}, "¿Cuáles son las penalidades por mora en la ejecución de la obra?"
+    )
+
+    assert contexto.index("Tipo: Informe") < contexto.index("Tipo: Acta")
+    assert "penalidades por mora" in contexto
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from analisis_consulta import AnalisisConsulta
+from conversacion import Conversacion, compactar_historial
+
+
+def analisis(expedientes=(), entidades=None, palabras_clave=()):
+    return AnalisisConsulta(list(expedientes), entidades or {}, list(palabras_clave), {}, [])
+
+
+def test_compactar_omite_la_pregunta_sin_respuesta_y_une_roles():
+    mensajes = [
+        {"role": "user", "content": "Hola"},
+        {"role": "user", "content": "¿Qué expedientes hay?"},
+        {"role": "assistant", "content": "Hay tres."},
+        {"role": "user", "content": "¿Y sus documentos?"},
+    ]
+    resumen, recientes = compactar_historial(mensajes, presupuesto=1000)
+    assert resumen == ""
+    assert recientes == [
+        {"role": "user", "content": "Hola\n\n¿Qué expedientes hay?"},
+        {"role": "assistant", "content": "Hay tres."},
+    ]
+
+
+def test_compactar_descarta_los_turnos_fallidos():
+    mensajes = [
+        {"role": "user", "content": "¿Plazo del contrato?"},
+        {"role": "assistant", "content": "Sesenta días."},
+        {"role": "user", "content": "¿Y las penalidades?"},
+        {"role": "assistant", "content": "❌ Error en la consulta: sobrecargado", "error": True},
+        {"role": "user", "content": "¿Y las penalidades?"},
+        {"role": "assistant", "content": "Por mora."},
+    ]
+    _, recientes = compactar_historial(mensajes, presupuesto=1000)
+    assert [m["content"] for m in recientes] == [
+        "¿Plazo del contrato?", "Sesenta días.", "¿Y las penalidades?", "Por mora.",
+    ]
+
+
+def test_compactar_resume_los_turnos_antiguos():
+    mensajes = []
+    for i in range(10):
+        mensajes.append({"role": "user", "content": f"Pregunta {i} " + "sobre el contrato " * 10})
+        mensajes.append({"role": "assistant", "content": f"Respuesta {i} " + "con el detalle del plazo " * 20})
+    resumen, recientes = compactar_historial(mensajes, presupuesto=300)
+
+    assert recientes and recientes[0]["role"] == "user"
+    assert recientes[-1]["content"].startswith("Respuesta 9")
+    assert resumen.startswith("Resumen de la conversación anterior:")
+    assert "Pregunta 0" not in "".join(m["content"] for m in recientes)
+
+
+def test_conversacion_vacia_no_cubre():
+    assert not Conversacion().cubre(analisis(palabras_clave=["contrat"]))
+
+
+def test_cubre_con_el_conjunto_de_trabajo(repositorio):
+    expediente = repositorio.expediente_por_numero("2022-LPN-LOG-0001")
+    documentos = repositorio.documentos_de_expedientes([expediente["id"]])
+    conversacion = Conversacion()
+    conversacion.incorporar(
+        {"expedientes": [expediente], "documentos": documentos, "normativas": []},
+        analisis(["2022-lpn-log-0001"], {"area_solicitante": ["Logística"]}),
+    )
+
+    assert conversacion.cubre(analisis(["2022-LPN-LOG-0001"]))
+    assert conversacion.cubre(analisis(entidades={"area_solicitante": ["Logística"]}))
+    assert not conversacion.cubre(analisis(["2023-ADS-TIC-0002"]))
+    assert not conversacion.cubre(analisis(entidades={"area_solicitante": ["Infraestructura"]}))
+    assert not conversacion.cubre(analisis(palabras_clave=["zzz"]))
+
+
+def test_contexto_trabajo_estable_hasta_la_siguiente_busqueda():
+    conversacion = Conversacion()
+    construidos = []
+
+    def construir(informacion_bd, consulta):
+        construidos.append(consulta)
+        return f"contexto de {consulta}"
+
+    def buscar(consulta):
+        return {"expedientes": [{"id": len(construidos), "tema_principal": "Contrato de limpieza"}]}
+
+    def analizar(consulta):
+        return analisis(palabras_clave=[p for p in ("contrat", "limpiez", "vigilanci") if p in consulta])
+
+    conversacion.recuperar("contrato", buscar, analizar)
+    assert conversacion.contexto_trabajo(construir) == "contexto de contrato"
+    # Un seguimiento cubierto por el conjunto de trabajo no vuelve a armar el prefijo
+    conversacion.recuperar("limpieza", buscar, analizar)
+    assert conversacion.contexto_trabajo(construir) == "contexto de contrato"
+    conversacion.recuperar("vigilancia", buscar, analizar)
+    assert conversacion.contexto_trabajo(construir) == "contexto de vigilancia"
+    assert construidos == ["contrato", "vigilancia"]
+
+
+def test_la_busqueda_no_bloquea_la_conversacion():
+    conversacion = Conversacion()
+    buscando, continuar = threading.Event(), threading.Event()
+
+    def buscar(consulta):
+        buscando.set()
+        continuar.wait(5)
+        return {"expedientes": [{"id": 1, "tema_principal": "Contrato de limpieza"}]}
+
+    def analizar(consulta):
+        return analisis(palabras_clave=["contrat"])
+
+    hilo = threading.Thread(target=conversacion.recuperar, args=("contrato", buscar, analizar))
+    hilo.start()
+    assert buscando.wait(5)
+    # Mientras la búsqueda espera a la base, la conversación sigue disponible
+    lector = threading.Thread(target=conversacion.contexto_trabajo, args=(lambda informacion_bd, consulta: "",))
+    lector.start()
+    lector.join(1)
+    assert not lector.is_alive()
+    continuar.set()
+    hilo.join(5)
+    assert conversacion.resumen()["busquedas"] == 1
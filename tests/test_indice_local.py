@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from indice_local import IndiceLocal, _consulta_fts
+from normalizacion_texto import raiz
+
+
+def test_consulta_fts_raices_sin_repetir():
+    assert _consulta_fts(["Penalidades", "penalidad", "contratación"]) == f'"{raiz("penalidades")}"* OR "{raiz("contratacion")}"*'
+
+
+def test_consulta_fts_escapa_la_sintaxis_de_fts5():
+    # Operadores y signos de FTS5 no llegan a la consulta: sólo raíces entre comillas
+    assert _consulta_fts(["NOT", "plazo*", '"ejecución"']) == f'"not"* OR "{raiz("plazo")}"* OR "{raiz("ejecucion")}"*'
+    assert _consulta_fts([]) == ""
+
+
+def test_buscar_sobre_los_fixtures(tmp_path, espejo):
+    indice = IndiceLocal(str(tmp_path / "indice.db"))
+    indice.actualizar(espejo, ["documentos_expediente"])
+    resultados = indice.buscar(["penalidades", "mora"], limite=5)
+    assert resultados
+    assert all(fila["_tabla"] == "documentos_expediente" for fila in resultados)
+    assert "penalidades por mora" in resultados[0]["contenido"]
+    # Refrescar sin cambios no duplica filas
+    indice.actualizar(espejo, ["documentos_expediente"])
+    assert len(list(indice.filas())) == len(espejo.table("documentos_expediente").select("id").execute().data)
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import llamadas_ia
+from cache_respuestas import CacheLRU
+from proveedores_llm import ErrorProveedor
+
+SOLICITUD = {"system": [{"type": "text", "text": "Responde."}], "messages": [{"role": "user", "content": "Hola"}]}
+
+
+class _Proveedor:
+    def __init__(self, nombre):
+        self.nombre = nombre
+
+
+class EnrutadorFijo:
+    """Responde siempre desde ``ganador`` y cuenta las llamadas."""
+
+    def __init__(self, ganador, modelo):
+        self.ganador, self.modelo = ganador, modelo
+        self.llamadas = []
+
+    def ordenar(self, preferido=None):
+        return [_Proveedor("Claude"), _Proveedor("Gemini")]
+
+    def transmitir(self, solicitud, preferido=None, cobertura=False, tokens_estimados=0, origen=None):
+        self.llamadas.append(preferido)
+        origen.update(proveedor=self.ganador, modelo=self.modelo)
+        yield f"respuesta de {self.ganador}"
+
+
+@pytest.fixture
+def enrutador(monkeypatch):
+    enrutador = EnrutadorFijo("Gemini", llamadas_ia.obtener_api("Gemini")["modelo"])
+    monkeypatch.setattr(llamadas_ia, "enrutador_llm", enrutador)
+    monkeypatch.setattr(llamadas_ia, "cache_respuestas", CacheLRU("respuestas", max_entradas=10, ttl=60))
+    return enrutador
+
+
+def test_cache_por_proveedor_que_respondio(enrutador):
+    # Sin proveedor elegido respondió Gemini: la respuesta sirve para "auto" y para Gemini...
+    assert llamadas_ia.consulta_ia("Hola", SOLICITUD) == "respuesta de Gemini"
+    assert llamadas_ia.consulta_ia("Hola", SOLICITUD) == "respuesta de Gemini"
+    assert llamadas_ia.consulta_ia("Hola", SOLICITUD, proveedor="Gemini") == "respuesta de Gemini"
+    assert enrutador.llamadas == [None]
+    # ...pero no para quien eligió Claude
+    llamadas_ia.consulta_ia("Hola", SOLICITUD, proveedor="Claude")
+    assert enrutador.llamadas == [None, "Claude"]
+
+
+def test_otro_modelo_no_reutiliza_la_respuesta(enrutador, monkeypatch):
+    llamadas_ia.consulta_ia("Hola", SOLICITUD, proveedor="Gemini")
+    monkeypatch.setitem(llamadas_ia.obtener_api("Gemini"), "modelo", "otro-modelo")
+    llamadas_ia.consulta_ia("Hola", SOLICITUD, proveedor="Gemini")
+    assert enrutador.llamadas == ["Gemini", "Gemini"]
+
+
+def test_consulta_claude_acepta_la_solicitud_por_posicion(enrutador):
+    llamadas_ia.consulta_claude("Hola", SOLICITUD)
+    assert enrutador.llamadas == ["Claude"]
+
+
+def test_responder_turno_informa_el_error(enrutador, monkeypatch):
+    def transmitir(solicitud, **parametros):
+        raise ErrorProveedor("Claude", "sobrecargado", estado=529)
+        yield
+
+    monkeypatch.setattr(enrutador, "transmitir", transmitir)
+    monkeypatch.setattr(llamadas_ia, "preparar_solicitud", lambda mensaje, **parametros: SOLICITUD)
+    resultado = {}
+    respuesta = "".join(llamadas_ia.responder_turno("Hola", resultado=resultado))
+    assert respuesta.startswith(llamadas_ia.MENSAJE_ERROR)
+    assert resultado == {"error": "sobrecargado"}
+
+    # Una respuesta que sólo cita el aviso no es un error
+    resultado = {}
+    monkeypatch.setattr(enrutador, "transmitir", lambda solicitud, **parametros: iter([llamadas_ia.MENSAJE_ERROR]))
+    assert "".join(llamadas_ia.responder_turno("Hola", resultado=resultado)) == llamadas_ia.MENSAJE_ERROR
+    assert resultado == {}
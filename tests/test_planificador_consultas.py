@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from planificador_consultas import ejecutar_en_paralelo
+
+
+def test_resultados_y_errores():
+    def fallar():
+        raise RuntimeError("sin conexión")
+
+    resultados, incompletas = ejecutar_en_paralelo({"a": lambda: 1, "b": fallar, "c": lambda: 3}, 2, 1.0)
+    assert resultados == {"a": 1, "c": 3}
+    assert incompletas == ["b"]
+
+
+def test_abandona_la_tarea_vencida():
+    liberar = threading.Event()
+    inicio = time.monotonic()
+    resultados, incompletas = ejecutar_en_paralelo({"lenta": lambda: liberar.wait(5), "rapida": lambda: "ok"}, 2, 0.1)
+    liberar.set()
+    assert resultados == {"rapida": "ok"}
+    assert incompletas == ["lenta"]
+    assert time.monotonic() - inicio < 1
+
+
+def test_plazo_propio_por_tarea():
+    tareas = {"encadenada": lambda: time.sleep(0.15) or "ok", "simple": lambda: "ok"}
+    resultados, incompletas = ejecutar_en_paralelo(tareas, 2, 0.1, plazos={"encadenada": 0.5})
+    assert resultados == {"encadenada": "ok", "simple": "ok"}
+    assert incompletas == []
+
+
+def test_respeta_la_concurrencia_maxima():
+    activas, maximo, lock = [0], [0], threading.Lock()
+
+    def tarea():
+        with lock:
+            activas[0] += 1
+            maximo[0] = max(maximo[0], activas[0])
+        time.sleep(0.02)
+        with lock:
+            activas[0] -= 1
+        return True
+
+    resultados, _ = ejecutar_en_paralelo({f"t{i}": tarea for i in range(8)}, 3, 1.0)
+    assert len(resultados) == 8
+    assert maximo[0] <= 3
+
+
+def test_no_acumula_hilos_entre_llamadas(monkeypatch):
+    monkeypatch.setattr("planificador_consultas._pool_busquedas", ThreadPoolExecutor(2, thread_name_prefix="prueba_pool"))
+    liberar = threading.Event()
+    for _ in range(10):
+        ejecutar_en_paralelo({"colgada": lambda: liberar.wait(5)}, 1, 0.01)
+    hilos = [h for h in threading.enumerate() if h.name.startswith("prueba_pool")]
+    liberar.set()
+    # Las tareas colgadas esperan en el pool del proceso en lugar de abrir hilos nuevos
+    assert len(hilos) == 2
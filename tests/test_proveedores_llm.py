@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from proveedores_llm import FALLOS_PARA_ENFRIAR, EnrutadorLLM, ErrorProveedor, ProveedorClaude, ProveedorGemini
+from simuladores_llm import RESPUESTA, servidor_simulado
+
+SOLICITUD = {"system": [{"type": "text", "text": "Responde."}], "messages": [{"role": "user", "content": "Hola"}]}
+
+
+@pytest.fixture
+def servidores():
+    """Arranca servidores simulados ``(proveedor, latencia, estado_error)`` y los detiene al final."""
+    arrancados = []
+
+    def arrancar(proveedor, latencia=0.01, estado_error=None):
+        servidor, url = servidor_simulado(proveedor, latencia, estado_error)
+        arrancados.append(servidor)
+        return url
+
+    yield arrancar
+    for servidor in arrancados:
+        servidor.shutdown()
+
+
+def enrutador(url_claude, url_gemini):
+    return EnrutadorLLM([
+        ProveedorClaude("Claude", "clave", url_claude, "modelo-claude"),
+        ProveedorGemini("Gemini", "clave", url_gemini, "modelo-gemini"),
+    ])
+
+
+def test_responde_el_preferido(servidores):
+    llm = enrutador(servidores("Claude"), servidores("Gemini"))
+    assert "".join(llm.transmitir(SOLICITUD, preferido="Gemini")).split() == RESPUESTA.split()
+    assert llm.resumen()["Gemini"]["exitos"] == 1
+    assert llm.resumen()["Claude"]["exitos"] == 0
+
+
+def test_conmuta_ante_sobrecarga(servidores):
+    llm = enrutador(servidores("Claude", estado_error=529), servidores("Gemini"))
+    assert "".join(llm.transmitir(SOLICITUD, preferido="Claude")).split() == RESPUESTA.split()
+    resumen = llm.resumen()
+    assert resumen["Claude"]["fallos"] == 1
+    assert resumen["Gemini"]["exitos"] == 1
+
+
+def test_informa_quien_respondio_tras_conmutar(servidores):
+    llm = enrutador(servidores("Claude", estado_error=529), servidores("Gemini"))
+    origen = {}
+    "".join(llm.transmitir(SOLICITUD, preferido="Claude", origen=origen))
+    assert origen == {"proveedor": "Gemini", "modelo": "modelo-gemini"}
+
+
+def test_sin_proveedores_configurados():
+    llm = EnrutadorLLM([ProveedorClaude("Claude", "CLAVE_NO_ENCONTRADA", "http://localhost", "modelo-claude")])
+    with pytest.raises(ErrorProveedor) as error:
+        "".join(llm.transmitir(SOLICITUD))
+    assert error.value.proveedor == "enrutador"
+
+
+def test_no_conmuta_ante_errores_de_la_solicitud(servidores):
+    llm = enrutador(servidores("Claude", estado_error=401), servidores("Gemini"))
+    with pytest.raises(ErrorProveedor) as error:
+        "".join(llm.transmitir(SOLICITUD, preferido="Claude"))
+    assert error.value.estado == 401
+    resumen = llm.resumen()
+    assert resumen["Claude"]["fallos"] == 0
+    assert resumen["Gemini"]["exitos"] == 0
+
+
+def test_fallan_todos(servidores, monkeypatch):
+    # El último proveedor usa los reintentos del transporte: sin esperas de backoff
+    monkeypatch.setattr("transporte_llm.BACKOFF_BASE", 0.0)
+    llm = enrutador(servidores("Claude", estado_error=503), servidores("Gemini", estado_error=529))
+    with pytest.raises(ErrorProveedor):
+        "".join(llm.transmitir(SOLICITUD, preferido="Claude"))
+
+
+def test_enfria_tras_fallos_seguidos(servidores):
+    llm = enrutador(servidores("Claude", estado_error=529), servidores("Gemini"))
+    for _ in range(FALLOS_PARA_ENFRIAR):
+        "".join(llm.transmitir(SOLICITUD, preferido="Claude"))
+    assert llm.resumen()["Claude"]["enfriando"]
+    assert [p.nombre for p in llm.ordenar("Claude")] == ["Gemini", "Claude"]
+
+
+def test_cobertura_con_proveedor_lento(servidores, monkeypatch):
+    monkeypatch.setattr("proveedores_llm.ESPERA_COBERTURA", 0.1)
+    llm = enrutador(servidores("Claude", latencia=2.0), servidores("Gemini"))
+    assert "".join(llm.transmitir(SOLICITUD, preferido="Claude", cobertura=True)).split() == RESPUESTA.split()
+    assert llm.resumen()["Gemini"]["exitos"] == 1
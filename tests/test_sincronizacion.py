@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import os
+import sqlite3
+import threading
+
+import pytest
+
+from indice_local import IndiceLocal
+from sincronizacion import EspejoLocal, leer_cambios, sincronizar
+
+
+@pytest.fixture
+def espejo_pequeno():
+    espejo = EspejoLocal(":memory:")
+    espejo.table("expedientes").insert([
+        {"id": 1, "numero_expediente": "2022-LPN-LOG-0001", "estado": "Adjudicado", "tema_principal": "Compra de equipos, lote 1"},
+        {"id": 2, "numero_expediente": "2023-ADS-TIC-0002", "estado": "En trámite", "tema_principal": "Servicio de LIMPIEZA"},
+        {"id": 3, "numero_expediente": "2024-CDI-INF-0003", "estado": "Concluido", "tema_principal": "Obra vial"},
+    ]).execute()
+    return espejo
+
+
+def ids(respuesta):
+    return [fila["id"] for fila in respuesta.data]
+
+
+def test_eq_y_select(espejo_pequeno):
+    respuesta = espejo_pequeno.table("expedientes").select("id, estado").eq("estado", "Concluido").execute()
+    assert respuesta.data == [{"id": 3, "estado": "Concluido"}]
+
+
+def test_ilike_sin_distinguir_mayusculas(espejo_pequeno):
+    consulta = espejo_pequeno.table("expedientes").select("*").ilike("tema_principal", "%limpieza%")
+    assert ids(consulta.execute()) == [2]
+    # Sin comodines el patrón debe coincidir con todo el valor
+    assert ids(espejo_pequeno.table("expedientes").select("*").ilike("tema_principal", "obra").execute()) == []
+
+
+def test_or_con_comillas_e_imatch(espejo_pequeno):
+    filtro = 'tema_principal.ilike."*equipos, lote*",numero_expediente.imatch.^2024-'
+    consulta = espejo_pequeno.table("expedientes").select("*").or_(filtro).order("id")
+    assert ids(consulta.execute()) == [1, 3]
+
+
+def test_or_con_operador_no_soportado(espejo_pequeno):
+    with pytest.raises(ValueError):
+        espejo_pequeno.table("expedientes").select("*").or_("id.gt.1")
+
+
+def test_columna_no_valida(espejo_pequeno):
+    with pytest.raises(ValueError):
+        espejo_pequeno.table("expedientes").select("*").eq("id) OR (1", 1)
+
+
+def test_in_vacio_y_orden_con_rango(espejo_pequeno):
+    assert ids(espejo_pequeno.table("expedientes").select("*").in_("id", []).execute()) == []
+    consulta = espejo_pequeno.table("expedientes").select("*").in_("id", [1, 2, 3]).order("id", desc=True).range(1, 2)
+    assert ids(consulta.execute()) == [2, 1]
+
+
+def test_fixtures_cargados(espejo):
+    documentos = espejo.table("documentos_expediente").select("id, expediente_id").eq("expediente_id", 1).execute().data
+    assert documentos and all(documento["expediente_id"] == 1 for documento in documentos)
+
+
+def test_leer_cambios_desempata_por_id():
+    origen = EspejoLocal(":memory:")
+    # Mismo updated_at en todas: las páginas sólo son estables si se ordena también por id
+    origen.table("expedientes").insert([
+        {"id": i, "updated_at": "2024-01-01T00:00:00", "tema_principal": f"tema {i}"} for i in (5, 3, 9, 1, 7, 2, 8)
+    ]).execute()
+    paginas = list(leer_cambios(origen, "expedientes", "2024-01-01T00:00:00", tamano_pagina=3))
+    assert [[fila["id"] for fila in pagina] for pagina in paginas] == [[1, 2, 3], [5, 7, 8], [9]]
+
+
+def test_sincronizar_avanza_la_marca_del_indice(tmp_path):
+    origen = EspejoLocal(":memory:")
+    origen.table("documentos_expediente").insert([
+        {"id": 1, "updated_at": "2024-01-01T00:00:00", "contenido": "penalidades por mora"},
+        {"id": 2, "updated_at": "2024-02-01T00:00:00", "contenido": "garantía de fiel cumplimiento"},
+    ]).execute()
+    espejo, indice = EspejoLocal(str(tmp_path / "espejo.db")), IndiceLocal(str(tmp_path / "indice.db"))
+    sincronizar(origen, espejo, ["documentos_expediente"], indice=indice)
+
+    assert espejo.marca("documentos_expediente") == indice.marca("documentos_expediente") == "2024-02-01T00:00:00"
+
+
+def test_cerrar_espejo_temporal_cierra_las_conexiones_de_todos_los_hilos():
+    espejo = EspejoLocal(":memory:")
+    espejo.table("expedientes").insert([{"id": 1}]).execute()
+    hilo = threading.Thread(target=lambda: espejo.table("expedientes").select("*").execute())
+    hilo.start()
+    hilo.join()
+    conexiones = list(espejo._conexiones)
+    assert len(conexiones) == 2
+
+    espejo.cerrar()
+    assert not os.path.exists(espejo.ruta)
+    for conexion in conexiones:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conexion.execute("SELECT 1")
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+
+from turnos_chat import ChatSaturado, EjecutorTurnos, TurnoVencido
+
+
+def respuesta(partes, liberar=None):
+    if liberar is not None:
+        liberar.wait(5)
+    yield from partes
+
+
+def fallida():
+    yield "Parcial"
+    raise RuntimeError("se cortó")
+
+
+def test_entrega_los_fragmentos():
+    ejecutor = EjecutorTurnos(2, 0)
+    turno = ejecutor.enviar(respuesta, ["Hola ", "mundo"])
+    assert "".join(turno.fragmentos(espera=5)) == "Hola mundo"
+
+
+def test_relanza_el_error_del_turno():
+    turno = EjecutorTurnos(1, 0).enviar(fallida)
+    fragmentos = turno.fragmentos(espera=5)
+    assert next(fragmentos) == "Parcial"
+    with pytest.raises(RuntimeError):
+        next(fragmentos)
+
+
+def test_vence_y_cancela_el_turno():
+    liberar = threading.Event()
+    ejecutor = EjecutorTurnos(1, 0)
+    turno = ejecutor.enviar(respuesta, ["tarde"], liberar)
+    with pytest.raises(TurnoVencido):
+        list(turno.fragmentos(espera=0.05))
+    assert turno.cancelado.is_set()
+    liberar.set()
+    # El turno cancelado libera su cupo sin publicar nada más
+    siguiente = ejecutor.enviar(respuesta, ["ok"], espera=5)
+    assert list(siguiente.fragmentos(espera=5)) == ["ok"]
+
+
+def test_rechaza_sin_cupo():
+    liberar = threading.Event()
+    ejecutor = EjecutorTurnos(1, 0)
+    ejecutor.enviar(respuesta, ["lento"], liberar)
+    with pytest.raises(ChatSaturado):
+        ejecutor.enviar(respuesta, ["otro"], espera=0.05)
+    liberar.set()
+    assert ejecutor.resumen()["rechazados"] == 1
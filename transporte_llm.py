@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""Transporte HTTP compartido para las llamadas a los modelos de IA.
+
+- Una sola ``requests.Session`` por proceso con pool de conexiones keep-alive,
+  para no pagar un handshake TLS en cada turno.
+- Timeouts de conexión y de lectura, para que una conexión colgada no bloquee
+  el worker de Streamlit indefinidamente.
+- Reintentos con backoff exponencial y jitter ante estados reintentables
+  (429, 5xx, 529 "overloaded"), respetando ``retry-after`` si viene.
+- Un limitador de tasa (token bucket) compartido por todos los usuarios del
+  proceso, tanto de solicitudes como de tokens por minuto.
+"""
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+TIMEOUT_CONEXION = float(os.environ.get("LLM_TIMEOUT_CONEXION", "5"))
+TIMEOUT_LECTURA = float(os.environ.get("LLM_TIMEOUT_LECTURA", "60"))
+MAX_REINTENTOS = int(os.environ.get("LLM_MAX_REINTENTOS", "3"))
+BACKOFF_BASE = 1.0
+BACKOFF_MAXIMO = 20.0
+ESTADOS_REINTENTABLES = {408, 409, 429, 500, 502, 503, 504, 529}
+TAMANO_POOL = int(os.environ.get("LLM_TAMANO_POOL", "10"))
+
+# Presupuesto compartido por todo el proceso (0 desactiva el límite)
+SOLICITUDES_POR_MINUTO = float(os.environ.get("LLM_SOLICITUDES_POR_MINUTO", "50"))
+TOKENS_POR_MINUTO = float(os.environ.get("LLM_TOKENS_POR_MINUTO", "40000"))
+# Espera máxima por el limitador antes de enviar igualmente la solicitud
+ESPERA_MAXIMA_LIMITADOR = 30.0
+
+
+class LimitadorTasa:
+    """Token bucket thread-safe: ``capacidad`` unidades que se recargan cada minuto."""
+
+    def __init__(self, por_minuto):
+        self.capacidad = por_minuto
+        self._disponible = por_minuto
+        self._actualizado_en = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _recargar(self):
+        ahora = time.monotonic()
+        self._disponible = min(
+            self.capacidad, self._disponible + (ahora - self._actualizado_en) * self.capacidad / 60.0
+        )
+        self._actualizado_en = ahora
+
+    def adquirir(self, cantidad=1, espera_maxima=ESPERA_MAXIMA_LIMITADOR):
+        """Bloquea hasta que haya ``cantidad`` unidades. Devuelve los segundos esperados."""
+        if not self.capacidad:
+            return 0.0
+        # Una solicitud mayor que todo el presupuesto sólo puede esperar a tenerlo completo
+        cantidad = min(cantidad, self.capacidad)
+        inicio = time.monotonic()
+        while True:
+            with self._lock:
+                self._recargar()
+                if self._disponible >= cantidad:
+                    self._disponible -= cantidad
+                    return time.monotonic() - inicio
+                faltante = (cantidad - self._disponible) * 60.0 / self.capacidad
+            if time.monotonic() - inicio + faltante > espera_maxima:
+                # Mejor intentar (y quizá recibir un 429 reintentable) que bloquear al usuario
+                with self._lock:
+                    self._disponible -= cantidad
+                return time.monotonic() - inicio
+            time.sleep(min(faltante, 1.0))
+
+
+class TransporteLLM:
+    """Sesión HTTP compartida con timeouts, reintentos y limitación de tasa."""
+
+    def __init__(self, max_reintentos=MAX_REINTENTOS, timeout=(TIMEOUT_CONEXION, TIMEOUT_LECTURA),
+                 solicitudes_por_minuto=SOLICITUDES_POR_MINUTO, tokens_por_minuto=TOKENS_POR_MINUTO):
+        self.max_reintentos = max_reintentos
+        self.timeout = timeout
+        self.limitador_solicitudes = LimitadorTasa(solicitudes_por_minuto)
+        self.limitador_tokens = LimitadorTasa(tokens_por_minuto)
+        self.sesion = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=TAMANO_POOL, pool_maxsize=TAMANO_POOL)
+        self.sesion.mount("https://", adaptador)
+        self.sesion.mount("http://", adaptador)
+
+    def _espera_reintento(self, intento, response=None):
+        # Respetar retry-after si el servidor lo indica; si no, backoff exponencial con jitter
+        if response is not None:
+            try:
+                return min(float(response.headers.get("retry-after")), BACKOFF_MAXIMO)
+            except (TypeError, ValueError):
+                pass
+        return random.uniform(0, min(BACKOFF_MAXIMO, BACKOFF_BASE * 2 ** intento))
+
+    def post(self, url, headers=None, json=None, stream=False, tokens_estimados=0,
+             max_reintentos=None, timeout=None):
+        """POST con reintentos. Devuelve la última respuesta (aunque sea un error HTTP).
+
+        Los errores de conexión y timeouts se reintentan y, si persisten, se propagan
+        como ``requests.exceptions.RequestException``. ``max_reintentos`` y ``timeout``
+        reemplazan los del transporte en esta llamada (p. ej. para pasar antes a otro
+        proveedor, ver proveedores_llm.py).
+        """
+        max_reintentos = self.max_reintentos if max_reintentos is None else max_reintentos
+        timeout = self.timeout if timeout is None else timeout
+        self.limitador_solicitudes.adquirir(1)
+        if tokens_estimados:
+            self.limitador_tokens.adquirir(tokens_estimados)
+
+        for intento in range(max_reintentos + 1):
+            try:
+                response = self.sesion.post(url, headers=headers, json=json, stream=stream, timeout=timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if intento == max_reintentos:
+                    raise
+                espera = self._espera_reintento(intento)
+                print(f"Error de conexión con la API ({e}); reintento {intento + 1} en {espera:.1f}s")
+                time.sleep(espera)
+                continue
+
+            if response.status_code not in ESTADOS_REINTENTABLES or intento == max_reintentos:
+                return response
+
+            espera = self._espera_reintento(intento, response)
+            print(f"La API respondió {response.status_code}; reintento {intento + 1} en {espera:.1f}s")
+            response.close()
+            time.sleep(espera)
+
+
+# Transporte compartido por todo el proceso
+transporte_llm = TransporteLLM()
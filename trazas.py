@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""Trazas del pipeline del chat: un tramo (span) por etapa, con duración, filas y bytes.
+
+Cada turno del chat es una traza; sus tramos (extracción de palabras clave, cada
+consulta a la base, enriquecimiento de documentos, construcción del contexto y
+llamada al modelo) se anidan solos gracias a una ``ContextVar``::
+
+    with tramo("consulta_bd", tabla="expedientes") as t:
+        filas = ...
+        t.registrar(filas=len(filas), bytes=tamano)
+
+Al terminar la traza, sus tramos se exportan según ``TRAZAS_EXPORTADOR``:
+
+- ``ninguno`` (por defecto): sólo se guardan en memoria.
+- ``log``: una línea JSON por tramo en ``RUTA_TRAZAS`` (log estructurado, en el
+  directorio temporal salvo que se indique otra ruta). Al superar
+  ``MAX_MB_TRAZAS`` el archivo se rota a ``<ruta>.1``, que reemplaza al anterior.
+- ``otlp``: OTLP/HTTP en JSON a ``OTEL_EXPORTER_OTLP_ENDPOINT`` (``/v1/traces``),
+  compatible con un OpenTelemetry Collector, Jaeger o Tempo.
+
+Las últimas trazas quedan además en memoria para el panel de etapas más lentas de app.py.
+"""
+import contextlib
+import contextvars
+import json
+import os
+import secrets
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+TRAZAS_EXPORTADOR = os.environ.get("TRAZAS_EXPORTADOR", "ninguno")
+RUTA_TRAZAS = os.environ.get("RUTA_TRAZAS", os.path.join(tempfile.gettempdir(), "ia_gestion_trazas.jsonl"))
+# Tamaño (MB) a partir del cual se rota el log de trazas
+MAX_MB_TRAZAS = float(os.environ.get("MAX_MB_TRAZAS", "20"))
+OTLP_ENDPOINT = os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318")
+NOMBRE_SERVICIO = os.environ.get("OTEL_SERVICE_NAME", "ia-gestion-expedientes")
+# Trazas que se conservan en memoria para el panel
+MAX_TRAZAS_RECIENTES = 50
+
+_tramo_actual = contextvars.ContextVar("tramo_actual", default=None)
+
+
+class Tramo:
+    """Una etapa medida de una traza (equivalente a un span de OpenTelemetry)."""
+
+    def __init__(self, nombre, padre=None, **atributos):
+        self.nombre = nombre
+        self.traza_id = padre.traza_id if padre else secrets.token_hex(16)
+        self.tramo_id = secrets.token_hex(8)
+        self.padre_id = padre.tramo_id if padre else None
+        self.atributos = dict(atributos)
+        self.inicio_ns = time.time_ns()
+        self.fin_ns = None
+        self.duracion_ms = None
+        self.error = None
+        self._inicio = time.perf_counter()
+
+    def registrar(self, **atributos):
+        """Agrega atributos al tramo (p. ej. ``filas`` y ``bytes``)."""
+        self.atributos.update(atributos)
+
+    def terminar(self):
+        self.duracion_ms = (time.perf_counter() - self._inicio) * 1000
+        self.fin_ns = self.inicio_ns + int(self.duracion_ms * 1_000_000)
+
+    def como_dict(self):
+        return {
+            "traza_id": self.traza_id,
+            "tramo_id": self.tramo_id,
+            "padre_id": self.padre_id,
+            "nombre": self.nombre,
+            "inicio": self.inicio_ns / 1e9,
+            "duracion_ms": round(self.duracion_ms, 2) if self.duracion_ms is not None else None,
+            "error": self.error,
+            **self.atributos,
+        }
+
+
+def _valor_otlp(valor):
+    if isinstance(valor, bool):
+        return {"boolValue": valor}
+    if isinstance(valor, int):
+        return {"intValue": str(valor)}
+    if isinstance(valor, float):
+        return {"doubleValue": valor}
+    return {"stringValue": str(valor)}
+
+
+class ExportadorLog:
+    """Escribe cada tramo como una línea JSON, rotando el archivo al llegar a ``max_mb``."""
+
+    def __init__(self, ruta=RUTA_TRAZAS, max_mb=MAX_MB_TRAZAS):
+        self.ruta = ruta
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+
+    def exportar(self, tramos):
+        lineas = "".join(json.dumps(t.como_dict(), ensure_ascii=False, default=str) + "\n" for t in tramos)
+        with self._lock:
+            with open(self.ruta, "a", encoding="utf-8") as archivo:
+                archivo.write(lineas)
+                tamano = archivo.tell()
+            if tamano >= self.max_bytes:
+                os.replace(self.ruta, self.ruta + ".1")
+
+
+class ExportadorOTLP:
+    """Envía los tramos por OTLP/HTTP (JSON) en un hilo aparte, sin demorar el turno."""
+
+    def __init__(self, endpoint=OTLP_ENDPOINT, servicio=NOMBRE_SERVICIO):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.servicio = servicio
+
+    def _cuerpo(self, tramos):
+        spans = []
+        for t in tramos:
+            span = {
+                "traceId": t.traza_id,
+                "spanId": t.tramo_id,
+                "name": t.nombre,
+                "kind": 1,
+                "startTimeUnixNano": str(t.inicio_ns),
+                "endTimeUnixNano": str(t.fin_ns),
+                "attributes": [{"key": k, "value": _valor_otlp(v)} for k, v in t.atributos.items() if v is not None],
+                "status": {"code": 2, "message": t.error} if t.error else {"code": 1},
+            }
+            if t.padre_id:
+                span["parentSpanId"] = t.padre_id
+            spans.append(span)
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.servicio}}]},
+            "scopeSpans": [{"scope": {"name": "trazas"}, "spans": spans}],
+        }]}
+
+    def _enviar(self, cuerpo):
+        import requests
+
+        try:
+            requests.post(self.url, json=cuerpo, timeout=5).raise_for_status()
+        except Exception as e:
+            print(f"No se pudieron exportar las trazas a {self.url}: {e}")
+
+    def exportar(self, tramos):
+        threading.Thread(target=self._enviar, args=(self._cuerpo(tramos),), daemon=True).start()
+
+
+class RegistroTrazas:
+    """Junta los tramos terminados de cada traza, conserva las recientes y las exporta."""
+
+    def __init__(self, exportador=None, max_trazas=MAX_TRAZAS_RECIENTES):
+        self.exportador = exportador
+        self.max_trazas = max_trazas
+        self._trazas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def terminar(self, tramo):
+        with self._lock:
+            tramos = self._trazas.setdefault(tramo.traza_id, [])
+            tramos.append(tramo)
+            self._trazas.move_to_end(tramo.traza_id)
+            while len(self._trazas) > self.max_trazas:
+                self._trazas.popitem(last=False)
+            # La traza se exporta al cerrar su raíz; los tramos que terminan después
+            # (búsquedas abandonadas por timeout) se exportan sueltos
+            raiz_terminada = any(t.padre_id is None for t in tramos)
+            pendientes = list(tramos) if tramo.padre_id is None else ([tramo] if raiz_terminada else [])
+        if pendientes and self.exportador is not None:
+            try:
+                self.exportador.exportar(pendientes)
+            except Exception as e:
+                print(f"Error al exportar trazas: {e}")
+
+    def tramos(self, traza_id):
+        with self._lock:
+            return list(self._trazas.get(traza_id, []))
+
+    def mas_lentos(self, traza_id, cantidad=5):
+        """Los ``cantidad`` tramos más lentos de la traza, sin la raíz ni los que tienen hijos."""
+        tramos = self.tramos(traza_id)
+        padres = {t.padre_id for t in tramos}
+        hojas = [t for t in tramos if t.padre_id is not None and t.tramo_id not in padres]
+        return sorted(hojas, key=lambda t: t.duracion_ms, reverse=True)[:cantidad]
+
+
+def _crear_exportador(tipo):
+    if tipo == "log":
+        return ExportadorLog()
+    if tipo == "otlp":
+        return ExportadorOTLP()
+    return None
+
+
+@contextlib.contextmanager
+def tramo(nombre, **atributos):
+    """Mide el bloque como un tramo hijo del tramo en curso (o como raíz de una traza nueva)."""
+    padre = _tramo_actual.get()
+    actual = Tramo(nombre, padre, **atributos)
+    token = _tramo_actual.set(actual)
+    try:
+        yield actual
+    except GeneratorExit:
+        # El consumidor dejó de leer un generador instrumentado: no es un error
+        raise
+    except BaseException as e:
+        actual.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        try:
+            _tramo_actual.reset(token)
+        except ValueError:
+            # Un generador cerrado desde otro contexto no puede restaurar el token
+            _tramo_actual.set(padre)
+        actual.terminar()
+        registro_trazas.terminar(actual)
+
+
+def tramo_actual():
+    return _tramo_actual.get()
+
+
+# Registro compartido por todo el proceso
+registro_trazas = RegistroTrazas(_crear_exportador(TRAZAS_EXPORTADOR))
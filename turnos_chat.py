@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""Turnos del chat en un pool de hilos acotado y compartido por todas las sesiones.
+
+Cada turno (búsqueda, contexto y respuesta del modelo) corre en un hilo del pool y
+deja los fragmentos de la respuesta en una cola, de donde los toma el script de
+Streamlit para mostrarlos. Así el proceso nunca tiene más de
+``MAX_TURNOS_CONCURRENTES`` turnos trabajando a la vez (ni más conexiones abiertas
+a la base y al modelo de las que admiten sus pools), sin importar cuántas sesiones
+haya abiertas:
+
+- Con el pool lleno, hasta ``MAX_TURNOS_EN_ESPERA`` turnos esperan su turno.
+- Más allá, ``enviar`` espera un cupo hasta ``ESPERA_ADMISION`` segundos y, si no
+  lo consigue, lanza ``ChatSaturado`` para que la app pida reintentar en lugar de
+  acumular trabajo que ya nadie esperará (contrapresión).
+
+Si el usuario abandona la respuesta (nuevo rerun, otra pregunta) o quien la lee deja
+de esperarla (``ESPERA_PRIMER_FRAGMENTO``, ``ESPERA_ENTRE_FRAGMENTOS``), el turno se
+cancela en el siguiente fragmento y libera su cupo.
+"""
+import contextvars
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from trazas import tramo
+
+MAX_TURNOS_CONCURRENTES = int(os.environ.get("MAX_TURNOS_CONCURRENTES", "8"))
+MAX_TURNOS_EN_ESPERA = int(os.environ.get("MAX_TURNOS_EN_ESPERA", "16"))
+ESPERA_ADMISION = float(os.environ.get("ESPERA_ADMISION_TURNO", "2"))
+# Segundos que la app espera el primer fragmento (búsqueda y conexión con el modelo,
+# incluida la espera en la cola) y luego cada fragmento siguiente
+ESPERA_PRIMER_FRAGMENTO = float(os.environ.get("ESPERA_PRIMER_FRAGMENTO", "120"))
+ESPERA_ENTRE_FRAGMENTOS = float(os.environ.get("ESPERA_ENTRE_FRAGMENTOS", "60"))
+
+_FIN = object()
+
+
+class ChatSaturado(Exception):
+    """No hay cupo para otro turno del chat."""
+
+
+class TurnoVencido(Exception):
+    """La respuesta de un turno no avanzó en el tiempo de espera."""
+
+
+class TurnoChat:
+    """Un turno enviado al pool: su respuesta se lee con ``fragmentos``."""
+
+    def __init__(self):
+        self.traza_id = None
+        self.espera_ms = None
+        # Se marca al llegar el primer fragmento (o al terminar sin ninguno)
+        self.iniciado = threading.Event()
+        self.cancelado = threading.Event()
+        self._cola = queue.Queue()
+
+    def _publicar(self, elemento):
+        self._cola.put(elemento)
+        self.iniciado.set()
+
+    def fragmentos(self, espera=None):
+        """Texto de la respuesta a medida que llega; si el turno falló, relanza su error.
+
+        Con ``espera`` lanza ``TurnoVencido`` (y cancela el turno) si pasan más de
+        ``espera`` segundos sin un fragmento nuevo.
+        """
+        try:
+            while True:
+                try:
+                    elemento = self._cola.get(timeout=espera)
+                except queue.Empty:
+                    raise TurnoVencido(f"La respuesta no avanzó en {espera:g} segundos") from None
+                if elemento is _FIN:
+                    return
+                if isinstance(elemento, BaseException):
+                    raise elemento
+                yield elemento
+        finally:
+            # Quien leía dejó de hacerlo (o el turno terminó): el hilo del pool puede parar
+            self.cancelado.set()
+
+
+class EjecutorTurnos:
+    """Pool acotado con cola de espera limitada para los turnos del chat."""
+
+    def __init__(self, max_concurrentes=MAX_TURNOS_CONCURRENTES, max_en_espera=MAX_TURNOS_EN_ESPERA):
+        self.max_concurrentes = max_concurrentes
+        self.max_en_espera = max_en_espera
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrentes, thread_name_prefix="turno_chat")
+        self._cupos = threading.BoundedSemaphore(max_concurrentes + max_en_espera)
+        self._lock = threading.Lock()
+        self.admitidos = 0
+        self.en_curso = 0
+        self.completados = 0
+        self.rechazados = 0
+
+    def enviar(self, generador, *args, espera=ESPERA_ADMISION, atributos=None, **kwargs):
+        """Ejecuta ``generador(*args, **kwargs)`` en el pool y devuelve su ``TurnoChat``.
+
+        Cada turno es la raíz de una traza (``turno_chat``) con los ``atributos``
+        dados y el tiempo que esperó en la cola. Lanza ``ChatSaturado`` si no hay
+        cupo en ``espera`` segundos.
+        """
+        if not self._cupos.acquire(timeout=espera):
+            with self._lock:
+                self.rechazados += 1
+            raise ChatSaturado(
+                f"Hay {self.max_concurrentes + self.max_en_espera} consultas en curso o en espera"
+            )
+        with self._lock:
+            self.admitidos += 1
+        turno = TurnoChat()
+        enviado = time.perf_counter()
+
+        def ejecutar():
+            turno.espera_ms = round((time.perf_counter() - enviado) * 1000, 2)
+            with self._lock:
+                self.en_curso += 1
+            try:
+                with tramo("turno_chat", espera_ms=turno.espera_ms, **(atributos or {})) as t:
+                    turno.traza_id = t.traza_id
+                    # Un turno abandonado mientras esperaba en la cola no llega a empezar
+                    if turno.cancelado.is_set():
+                        t.registrar(cancelado=True)
+                        return
+                    fragmentos = generador(*args, **kwargs)
+                    try:
+                        for fragmento in fragmentos:
+                            if turno.cancelado.is_set():
+                                t.registrar(cancelado=True)
+                                break
+                            turno._publicar(fragmento)
+                    finally:
+                        fragmentos.close()
+            except Exception as e:
+                print(f"Error en el turno del chat: {e}")
+                turno._publicar(e)
+            finally:
+                turno._publicar(_FIN)
+                with self._lock:
+                    self.en_curso -= 1
+                    self.completados += 1
+                self._cupos.release()
+
+        # Sin contexto de traza heredado: cada turno es su propia traza
+        self._pool.submit(contextvars.Context().run, ejecutar)
+        return turno
+
+    def resumen(self):
+        with self._lock:
+            return {
+                "en_curso": self.en_curso,
+                "en_espera": self.admitidos - self.completados - self.en_curso,
+                "completados": self.completados,
+                "rechazados": self.rechazados,
+                "capacidad": self.max_concurrentes,
+            }
+
+
+# Pool compartido por todas las sesiones del proceso
+ejecutor_turnos = EjecutorTurnos()